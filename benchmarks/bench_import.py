@@ -0,0 +1,77 @@
+"""Measures the cold import time of mercedestrenz and each of its subsystems.
+
+Every import runs in a fresh interpreter, the median of several runs is
+reported together with the heavy dependencies that were loaded.
+
+Usage: python benchmarks/bench_import.py [--repeat 7]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+STATEMENTS = {
+    "mercedestrenz": "import mercedestrenz",
+    "mercedestrenz.compiled": "import mercedestrenz.compiled",
+    "mercedestrenz.data": "import mercedestrenz.data",
+    "mercedestrenz.predict": "import mercedestrenz.predict",
+    "mercedestrenz.train": "import mercedestrenz.train",
+    "mercedestrenz.visualizations": "import mercedestrenz.visualizations",
+}
+
+HEAVY_MODULES = ["pandas", "numpy", "sklearn", "altair", "joblib"]
+
+PROGRAM = """
+import sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(elapsed, ",".join(heavy))
+"""
+
+
+def time_import(statement, repeat):
+    """Returns the median import time in ms and the heavy modules loaded."""
+    timings = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                PROGRAM.format(statement=statement, heavy=HEAVY_MODULES),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        elapsed, heavy = (result.stdout.split() + [""])[:2]
+        timings.append(float(elapsed) * 1000)
+
+    return statistics.median(timings), heavy
+
+
+def run(repeat=7):
+    """Returns {name: {"median_ms": float, "loads": str}} for every import."""
+    results = {}
+    for name, statement in STATEMENTS.items():
+        median_ms, heavy = time_import(statement, repeat)
+        results[name] = {"median_ms": round(median_ms, 1), "loads": heavy}
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    for name, result in run(args.repeat).items():
+        print(
+            f"{name:<32}{result['median_ms']:>9.1f} ms  loads: {result['loads'] or '-'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
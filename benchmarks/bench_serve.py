@@ -0,0 +1,90 @@
+"""Load tests the local scoring server from mercedestrenz.serve.
+
+Starts the server in-process on a free port and sends requests from
+several client threads, each over its own kept-alive connection.
+
+Usage: python benchmarks/bench_serve.py [--clients 4] [--requests 200] [--batch-size 1]
+"""
+
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+
+from mercedestrenz.serve import make_server
+
+LISTING = {
+    "model": "e-class",
+    "year": 2015,
+    "odometer_mi": 55_000,
+    "condition": "fair",
+    "paint_color": "silver",
+}
+
+
+def client(port, n_requests, batch_size, latencies):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    if batch_size == 1:
+        path, body = "/predict", json.dumps(LISTING)
+    else:
+        path, body = "/predict_batch", json.dumps([LISTING] * batch_size)
+
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        connection.request("POST", path, body=body)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        assert response.status == 200
+
+    connection.close()
+
+
+def run(clients=4, requests=200, batch_size=1):
+    """Returns throughput and latency percentiles of the server under load."""
+    server = make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.ready.wait()
+
+    latencies = []
+    threads = [
+        threading.Thread(
+            target=client, args=(server.server_port, requests, batch_size, latencies)
+        )
+        for _ in range(clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    server.shutdown()
+    server.server_close()
+
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {
+        "requests_per_second": len(latencies) / elapsed,
+        "listings_per_second": len(latencies) * batch_size / elapsed,
+        "p50_ms": percentiles[49] * 1000,
+        "p95_ms": percentiles[94] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=1)
+    args = parser.parse_args()
+
+    for name, value in run(args.clients, args.requests, args.batch_size).items():
+        print(f"{name:<22}{value:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""Runs the mercedestrenz benchmark suite on synthetic listings.
+
+Every case is timed on listings from make_synthetic_mercedes_listings at
+each requested size, with a fixed seed so runs are comparable. Latency
+percentiles and throughput come from untraced runs, the peak memory is the
+largest Python allocation (tracemalloc) of one extra traced run. Results can
+be saved as a JSON baseline and compared against one from another commit.
+
+Usage: python benchmarks/bench_suite.py [--sizes 1000 100000] [--cases listing_search predict]
+           [--repeat 50] [--save baseline.json] [--compare baseline.json] [--tolerance 0.2]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+from datetime import datetime, timezone
+
+import numpy as np
+
+from mercedestrenz.data import (
+    listing_search,
+    load_sample_mercedes_listings,
+    make_synthetic_mercedes_listings,
+)
+
+SEED = 42
+# training is only timed on this many rows, it tunes with cross validation
+TRAIN_ROWS = 2_000
+# the metrics compared with a baseline and whether a larger value is better
+METRICS = {
+    "p50_ms": False,
+    "p95_ms": False,
+    "seconds": False,
+    "peak_mb": False,
+    "rows_per_second": True,
+}
+
+
+def summarize(latencies, rows=None):
+    """Returns latency percentiles in ms, and throughput if rows are given."""
+    latencies = np.array(latencies) * 1000
+    result = {
+        "calls": len(latencies),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+    if rows is not None:
+        result["rows_per_second"] = rows / (result["p50_ms"] / 1000)
+
+    return result
+
+
+def timed(function, repeat):
+    """Returns the latency of each of repeat calls and the traced peak memory in MB."""
+    latencies = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function(i)
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function(repeat)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return latencies, peak / 1e6
+
+
+def bench_generate(n_rows, repeat):
+    latencies, peak_mb = timed(
+        lambda i: make_synthetic_mercedes_listings(n_rows, random_state=SEED), 3
+    )
+    return {**summarize(latencies, n_rows), "peak_mb": peak_mb}
+
+
+def bench_load_sample(n_rows, repeat):
+    try:
+        load_sample_mercedes_listings()
+    except FileNotFoundError:
+        return None
+
+    latencies, peak_mb = timed(lambda i: load_sample_mercedes_listings(), 5)
+    result = {**summarize(latencies), "peak_mb": peak_mb}
+    cached, _ = timed(lambda i: load_sample_mercedes_listings(cache=True), repeat)
+    result["cached_p50_ms"] = summarize(cached)["p50_ms"]
+
+    return result
+
+
+def bench_listing_search(n_rows, repeat):
+    data = make_synthetic_mercedes_listings(n_rows, random_state=SEED)
+    rng = np.random.default_rng(SEED)
+    models = ["any"] + sorted(data["model"].unique())
+    searches = [
+        dict(
+            budget=[int(low), int(low) + 20_000],
+            model=str(rng.choice(models)),
+            sort_feature=str(rng.choice(["odometer_mi", "year"])),
+        )
+        for low in rng.integers(0, 60_000, repeat + 1)
+    ]
+    latencies, peak_mb = timed(lambda i: listing_search(data, **searches[i]), repeat)
+
+    return {**summarize(latencies, n_rows), "peak_mb": peak_mb}
+
+
+def bench_predict(n_rows, repeat):
+    from mercedestrenz.predict import predict_mercedes_price
+
+    data = make_synthetic_mercedes_listings(repeat + 1, random_state=SEED)
+    listings = list(
+        data[["model", "year", "odometer_mi", "condition", "paint_color"]].itertuples(
+            index=False, name=None
+        )
+    )
+    # the first call loads the model
+    predict_mercedes_price(*listings[0])
+    latencies, peak_mb = timed(
+        lambda i: predict_mercedes_price(*listings[i]), repeat
+    )
+
+    return {**summarize(latencies, 1), "peak_mb": peak_mb}
+
+
+def bench_predict_batch(n_rows, repeat):
+    from mercedestrenz.predict import predict_mercedes_price_batch
+
+    data = make_synthetic_mercedes_listings(n_rows, random_state=SEED)
+    predict_mercedes_price_batch(data.iloc[:1])
+    latencies, peak_mb = timed(lambda i: predict_mercedes_price_batch(data), 3)
+
+    return {**summarize(latencies, n_rows), "peak_mb": peak_mb}
+
+
+def bench_train(n_rows, repeat):
+    from mercedestrenz.train import train_mercedes_price_prediction_model
+
+    data = make_synthetic_mercedes_listings(min(n_rows, TRAIN_ROWS), random_state=SEED)
+
+    def train(i):
+        with contextlib.redirect_stdout(io.StringIO()):
+            train_mercedes_price_prediction_model(data, "vbench", n_iter=1)
+
+    latencies, peak_mb = timed(train, 1)
+
+    return {"seconds": latencies[0], "rows": len(data), "peak_mb": peak_mb}
+
+
+def bench_plot(n_rows, repeat):
+    from mercedestrenz.visualizations import plot_mercedes_price
+
+    data = make_synthetic_mercedes_listings(n_rows, random_state=SEED)
+    latencies, peak_mb = timed(
+        lambda i: plot_mercedes_price("c-class", 20_000, data), repeat
+    )
+
+    return {**summarize(latencies, n_rows), "peak_mb": peak_mb}
+
+
+def bench_import(n_rows, repeat):
+    from bench_import import run as run_import
+
+    return {
+        name: result["median_ms"] for name, result in run_import(repeat=3).items()
+    }
+
+
+# cases that do not depend on the number of listings only run once
+CASES = {
+    "generate": (bench_generate, True),
+    "load_sample": (bench_load_sample, False),
+    "listing_search": (bench_listing_search, True),
+    "predict": (bench_predict, False),
+    "predict_batch": (bench_predict_batch, True),
+    "train": (bench_train, False),
+    "plot": (bench_plot, True),
+    "import": (bench_import, False),
+}
+
+
+def run(sizes=(1_000, 100_000), cases=None, repeat=50):
+    """Returns {"case[n=rows]": {metric: value}} for every case and size."""
+    results = {}
+    for name in cases or CASES:
+        bench, sized = CASES[name]
+        for n_rows in sizes if sized else [min(sizes)]:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                result = bench(n_rows, repeat)
+            if result is not None:
+                key = f"{name}[n={n_rows}]" if sized else name
+                results[key] = result
+
+    return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Returns (key, metric, baseline, current, ratio, regressed) for shared metrics."""
+    rows = []
+    for key, metrics in results.items():
+        for metric, higher_is_better in METRICS.items():
+            if metric not in metrics or metric not in baseline.get(key, {}):
+                continue
+            before, after = baseline[key][metric], metrics[metric]
+            ratio = after / before if before else float("inf")
+            if higher_is_better:
+                regressed = ratio < 1 / (1 + tolerance)
+            else:
+                regressed = ratio > 1 + tolerance
+            rows.append((key, metric, before, after, ratio, regressed))
+
+    return rows
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000])
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=None)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare with a JSON file saved by --save")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.cases, args.repeat)
+    for key, metrics in results.items():
+        values = "  ".join(f"{name}={value:.4g}" for name, value in metrics.items())
+        print(f"{key:<32}{values}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "commit": git_commit(),
+                    "date": datetime.now(timezone.utc).isoformat(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\ncompared with {baseline.get('commit')} ({baseline.get('date')})")
+        rows = compare(results, baseline["results"], args.tolerance)
+        for key, metric, before, after, ratio, regressed in rows:
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{key:<32}{metric:<16}{before:>12.4g}{after:>12.4g}{ratio:>8.2f}x{flag}")
+        if any(row[-1] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Measures the memory each forked worker spends on holding the price model.
+
+Every worker loads the model after the fork, like a prefork server would,
+and reports how much its resident set size (RSS) and its private memory grew.
+Pages backed by one copy in the OS page cache count towards RSS in every
+worker but are not private to any of them. Linux only.
+
+Usage: python benchmarks/bench_worker_memory.py [--workers 8]
+"""
+
+import argparse
+import multiprocessing
+
+# imported before forking so the libraries themselves are shared
+import sklearn.ensemble  # noqa: F401
+from mercedestrenz.predict import load_mercedes_price_model
+
+LISTING = {
+    "model": ["e-class"],
+    "year": [2015],
+    "odometer_mi": [55_000],
+    "condition": ["fair"],
+    "paint_color": ["silver"],
+}
+
+
+def memory_kb():
+    """Returns the Rss and private memory of the current process in kB."""
+    usage = {"Rss": 0, "Private": 0}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name == "Rss":
+                usage["Rss"] += int(rest.split()[0])
+            elif name in ["Private_Clean", "Private_Dirty"]:
+                usage["Private"] += int(rest.split()[0])
+
+    return usage
+
+
+def worker(mmap_mode, ready, done, results):
+    before = memory_kb()
+    model = load_mercedes_price_model("v1", use_cache=False, mmap_mode=mmap_mode)
+    model.predict(LISTING if mmap_mode else __import__("pandas").DataFrame(LISTING))
+
+    # wait until every worker has loaded the model before measuring
+    ready.wait()
+    after = memory_kb()
+    results.put({name: after[name] - before[name] for name in after})
+    done.wait()
+
+
+def measure(workers, mmap_mode):
+    """Returns the mean per-worker growth in Rss and private memory in kB."""
+    context = multiprocessing.get_context("fork")
+    ready, done = context.Barrier(workers + 1), context.Barrier(workers + 1)
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(mmap_mode, ready, done, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    ready.wait()
+    growth = [results.get() for _ in processes]
+    done.wait()
+    for process in processes:
+        process.join()
+
+    return {name: sum(g[name] for g in growth) / workers for name in ["Rss", "Private"]}
+
+
+def run(workers=8):
+    """Returns the per-worker memory growth for the pipeline and mmap models."""
+    return {
+        "joblib pipeline": measure(workers, None),
+        "mmap compiled": measure(workers, "r"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"per worker memory growth with {args.workers} workers")
+    for name, usage in run(args.workers).items():
+        print(
+            f"{name:<18} Rss {usage['Rss'] / 1024:7.1f} MB  private {usage['Private'] / 1024:7.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,34 @@
-# read version from installed package
-from importlib.metadata import version
+# Submodules are imported on first attribute access so that importing the
+# package does not pull in pandas, sklearn or altair.
+from importlib import import_module
 
-__version__ = version("mercedestrenz")
+_SUBMODULES = [
+    "async_predict",
+    "compiled",
+    "data",
+    "predict",
+    "score",
+    "serve",
+    "train",
+    "visualizations",
+]
+
+__all__ = _SUBMODULES + ["__version__"]
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return import_module(f"{__name__}.{name}")
+
+    if name == "__version__":
+        # read version from installed package
+        from importlib.metadata import version
+
+        globals()["__version__"] = version("mercedestrenz")
+        return globals()["__version__"]
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
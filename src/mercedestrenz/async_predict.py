@@ -0,0 +1,146 @@
+import asyncio
+
+from mercedestrenz.predict import (
+    FEATURE_COLUMNS,
+    _check_prediction_inputs,
+    model_cache,
+    predict_mercedes_price_batch,
+)
+
+
+class AsyncMercedesPricePredictor:
+    """Predicts prices for concurrent async callers in micro-batches.
+
+    Calls to `predict` are queued and grouped into batches of up to
+    `max_batch_size` listings. A batch is scored as soon as it is full, or
+    `max_wait` seconds after its first listing arrived. Each batch is scored
+    with one `predict_mercedes_price_batch` call in an executor, so the
+    event loop is never blocked by the model.
+
+    Parameters
+    ----------
+    version : str, optional
+        Model version to use if multiple available, by default "v1".
+    max_batch_size : int, optional
+        The most listings scored in one batch, by default 64.
+    max_wait : float, optional
+        Seconds to wait for more listings before scoring a batch that is not
+        full, by default 0.005.
+    executor : concurrent.futures.Executor, optional
+        Where batches are scored, by default None which uses the event
+        loop's default thread pool.
+
+    Examples
+    --------
+    >>> from mercedestrenz.async_predict import AsyncMercedesPricePredictor
+    >>> async with AsyncMercedesPricePredictor(max_batch_size=32) as predictor:
+    ...     price = await predictor.predict("e-class", 2015, 55_000, "fair", "silver")
+    """
+
+    def __init__(self, version="v1", max_batch_size=64, max_wait=0.005, executor=None):
+        if type(version) is not str:
+            raise TypeError("version must be a string of form 'vX'")
+        if type(max_batch_size) is not int or max_batch_size < 1:
+            raise ValueError("max_batch_size must be a positive integer")
+        if type(max_wait) not in [float, int] or max_wait < 0:
+            raise ValueError("max_wait must be a non-negative number of seconds")
+
+        self.version = version
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.executor = executor
+        self.n_batches = 0
+        self.n_predictions = 0
+
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    async def __aenter__(self):
+        await self.warmup()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def warmup(self):
+        """Loads the model in the executor before the first prediction."""
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, model_cache.warmup, [self.version])
+
+    async def predict(
+        self, model: str, year: int, odometer_mi: int, condition: str, paint_color: str
+    ) -> float:
+        """Predicts the price in USD of a Mercedes-Benz.
+
+        Takes the same listing arguments as `predict_mercedes_price`, which
+        are validated immediately so errors are raised to the caller.
+
+        Returns
+        -------
+        float
+            The predicted price of the Mercedes-Benz in USD.
+        """
+
+        _check_prediction_inputs(
+            model, year, odometer_mi, condition, paint_color, self.version
+        )
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(
+            ((model, year, odometer_mi, condition, paint_color), future)
+        )
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    async def close(self):
+        """Scores any queued listings and waits for running batches."""
+
+        self._flush()
+        if len(self._tasks) > 0:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _flush(self):
+        """Starts scoring the queued listings as one batch."""
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if len(batch) == 0:
+            return
+
+        task = asyncio.get_running_loop().create_task(self._score_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _score_batch(self, batch):
+        """Scores a batch in the executor and resolves each caller's future."""
+
+        rows, futures = zip(*batch)
+        listings = dict(zip(FEATURE_COLUMNS, map(list, zip(*rows))))
+        self.n_batches += 1
+        self.n_predictions += len(rows)
+
+        loop = asyncio.get_running_loop()
+        try:
+            prices = await loop.run_in_executor(
+                self.executor, predict_mercedes_price_batch, listings, self.version
+            )
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, price in zip(futures, prices):
+            if not future.done():
+                future.set_result(float(price))
@@ -0,0 +1,463 @@
+from importlib import resources
+import numpy as np
+import joblib
+
+# rows scored per block so the (rows x trees) node index matrix stays small
+_BLOCK_SIZE = 4096
+
+
+def compile_mercedes_price_model(model_pipeline):
+    """Compiles a fitted price prediction pipeline into flat numpy arrays.
+
+    The scaler constants, the one-hot and ordinal lookup tables and every
+    tree of the gradient boosting model are copied into contiguous arrays,
+    so predictions can be made without pandas or sklearn.
+
+    Parameters
+    ----------
+    model_pipeline : Pipeline
+        A fitted sklearn pipeline made of the column transformer from
+        `train.make_column_transformer` and a GradientBoostingRegressor.
+
+    Returns
+    -------
+    CompiledMercedesPriceModel
+        A model that scores dicts of columns with numpy only.
+
+    Raises
+    ------
+    ValueError
+        If the pipeline contains steps that cannot be compiled.
+
+    Examples
+    --------
+    >>> from mercedestrenz.predict import load_mercedes_price_model
+    >>> from mercedestrenz.compiled import compile_mercedes_price_model
+    >>> compiled = compile_mercedes_price_model(load_mercedes_price_model("v1"))
+    >>> compiled.predict_one(
+    ...     {
+    ...         "model": "e-class",
+    ...         "year": 2015,
+    ...         "odometer_mi": 55_000,
+    ...         "condition": "fair",
+    ...         "paint_color": "silver",
+    ...     }
+    ... )
+    """
+
+    from sklearn.compose import ColumnTransformer
+    from sklearn.ensemble import GradientBoostingRegressor
+    from sklearn.preprocessing import StandardScaler, OneHotEncoder, OrdinalEncoder
+
+    if len(model_pipeline.steps) != 2:
+        raise ValueError(
+            "model_pipeline must have a column transformer and a model step"
+        )
+
+    columntransformer, regressor = model_pipeline[0], model_pipeline[-1]
+    if not isinstance(columntransformer, ColumnTransformer):
+        raise ValueError("The first pipeline step must be a ColumnTransformer")
+    if not isinstance(regressor, GradientBoostingRegressor):
+        raise ValueError("The last pipeline step must be a GradientBoostingRegressor")
+
+    numeric = {"columns": [], "index": [], "mean": [], "scale": []}
+    onehot = {"columns": [], "values": [], "codes": [], "offsets": [0], "unknown": []}
+    ordinal = {
+        "columns": [],
+        "values": [],
+        "codes": [],
+        "offsets": [0],
+        "index": [],
+        "unknown": [],
+    }
+
+    for name, transformer, columns in columntransformer.transformers_:
+        if transformer == "drop" or len(columns) == 0:
+            continue
+        output_start = columntransformer.output_indices_[name].start
+
+        if isinstance(transformer, StandardScaler):
+            mean = (
+                transformer.mean_ if transformer.with_mean else np.zeros(len(columns))
+            )
+            scale = (
+                transformer.scale_ if transformer.with_std else np.ones(len(columns))
+            )
+            numeric["columns"] += list(columns)
+            numeric["index"] += [output_start + i for i in range(len(columns))]
+            numeric["mean"] += list(mean)
+            numeric["scale"] += list(scale)
+
+        elif isinstance(transformer, OneHotEncoder):
+            if transformer.drop_idx_ is not None:
+                raise ValueError("OneHotEncoder with drop cannot be compiled")
+            infrequent = getattr(transformer, "infrequent_categories_", None)
+            output_index = output_start
+
+            for i, column in enumerate(columns):
+                infrequent_values = (
+                    []
+                    if infrequent is None or infrequent[i] is None
+                    else list(infrequent[i])
+                )
+                frequent_values = [
+                    value
+                    for value in transformer.categories_[i]
+                    if value not in infrequent_values
+                ]
+                codes = {
+                    value: output_index + j for j, value in enumerate(frequent_values)
+                }
+                output_index += len(frequent_values)
+
+                if len(infrequent_values) > 0:
+                    # infrequent and unknown values share the last output column
+                    codes.update({value: output_index for value in infrequent_values})
+                    unknown = output_index
+                    output_index += 1
+                elif transformer.handle_unknown == "error":
+                    unknown = -2
+                else:
+                    unknown = -1
+
+                onehot["columns"].append(column)
+                onehot["values"] += [str(value) for value in codes]
+                onehot["codes"] += list(codes.values())
+                onehot["offsets"].append(len(onehot["values"]))
+                onehot["unknown"].append(unknown)
+
+        elif isinstance(transformer, OrdinalEncoder):
+            for i, column in enumerate(columns):
+                categories = transformer.categories_[i]
+                ordinal["columns"].append(column)
+                ordinal["values"] += [str(value) for value in categories]
+                ordinal["codes"] += list(range(len(categories)))
+                ordinal["offsets"].append(len(ordinal["values"]))
+                ordinal["index"].append(output_start + i)
+                ordinal["unknown"].append(
+                    transformer.unknown_value
+                    if transformer.handle_unknown == "use_encoded_value"
+                    else np.nan
+                )
+
+        else:
+            raise ValueError(
+                f"Transformer {name} of type {type(transformer)} cannot be compiled"
+            )
+
+    if regressor.init_ == "zero":
+        init_value = 0.0
+    elif hasattr(regressor.init_, "constant_"):
+        init_value = float(np.ravel(regressor.init_.constant_)[0])
+    else:
+        raise ValueError("Only constant init estimators can be compiled")
+
+    # every tree's nodes are stored back to back, leaves point to themselves
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    node_offset = 0
+    max_depth = 0
+    for estimator in regressor.estimators_[:, 0]:
+        tree = estimator.tree_
+        node_ids = np.arange(tree.node_count) + node_offset
+        is_leaf = tree.children_left == -1
+
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left + node_offset))
+        rights.append(np.where(is_leaf, node_ids, tree.children_right + node_offset))
+        values.append(
+            np.where(is_leaf, tree.value[:, 0, 0] * regressor.learning_rate, 0.0)
+        )
+        roots.append(node_offset)
+
+        node_offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+
+    arrays = {
+        "n_features": np.array(
+            max(output.stop for output in columntransformer.output_indices_.values())
+        ),
+        "numeric_columns": np.array(numeric["columns"], dtype=str),
+        "numeric_index": np.array(numeric["index"], dtype=np.int64),
+        "numeric_mean": np.array(numeric["mean"], dtype=np.float64),
+        "numeric_scale": np.array(numeric["scale"], dtype=np.float64),
+        "onehot_columns": np.array(onehot["columns"], dtype=str),
+        "onehot_values": np.array(onehot["values"], dtype=str),
+        "onehot_codes": np.array(onehot["codes"], dtype=np.int64),
+        "onehot_offsets": np.array(onehot["offsets"], dtype=np.int64),
+        "onehot_unknown": np.array(onehot["unknown"], dtype=np.int64),
+        "ordinal_columns": np.array(ordinal["columns"], dtype=str),
+        "ordinal_values": np.array(ordinal["values"], dtype=str),
+        "ordinal_codes": np.array(ordinal["codes"], dtype=np.float64),
+        "ordinal_offsets": np.array(ordinal["offsets"], dtype=np.int64),
+        "ordinal_index": np.array(ordinal["index"], dtype=np.int64),
+        "ordinal_unknown": np.array(ordinal["unknown"], dtype=np.float64),
+        "init_value": np.array(init_value),
+        "tree_max_depth": np.array(max_depth),
+        "tree_roots": np.array(roots, dtype=np.int64),
+        "tree_feature": np.concatenate(features).astype(np.int64),
+        "tree_threshold": np.concatenate(thresholds).astype(np.float64),
+        "tree_left": np.concatenate(lefts).astype(np.int64),
+        "tree_right": np.concatenate(rights).astype(np.int64),
+        "tree_value": np.concatenate(values).astype(np.float64),
+    }
+
+    return CompiledMercedesPriceModel(arrays)
+
+
+def export_compiled_mercedes_price_model(model_pipeline, version="v1"):
+    """Compiles a pipeline and saves its arrays so they can be memory mapped.
+
+    The arrays are written uncompressed next to the sklearn model file, so
+    `load_compiled_mercedes_price_model` can map them straight from disk.
+
+    Parameters
+    ----------
+    model_pipeline : Pipeline
+        A fitted sklearn pipeline, see `compile_mercedes_price_model`.
+    version : str, optional
+        What to tag the model version by. By default "v1"
+
+    Returns
+    -------
+    CompiledMercedesPriceModel
+        The compiled model that was saved.
+    """
+
+    compiled = compile_mercedes_price_model(model_pipeline)
+
+    model_name = f"mercedes_price_prediction_{version}.mmap"
+    with resources.path("mercedestrenz.models", model_name) as d:
+
+        joblib.dump(compiled.arrays, d)
+
+    return compiled
+
+
+def load_compiled_mercedes_price_model(version="v1", mmap_mode="r"):
+    """Loads a compiled model saved by `export_compiled_mercedes_price_model`.
+
+    Parameters
+    ----------
+    version : str, optional
+        Model version to use if multiple available, by default "v1"
+    mmap_mode : str, optional
+        Memory map mode of the arrays, by default "r". None reads them into
+        memory.
+
+    Returns
+    -------
+    CompiledMercedesPriceModel
+        The compiled model, backed by memory mapped arrays.
+
+    Raises
+    ------
+    FileNotFoundError
+        If no compiled model was saved for the version.
+    """
+
+    # predict imports this module, and loading pulls in its dependencies
+    from mercedestrenz.predict import _load_mercedes_price_model_from_disk
+
+    return _load_mercedes_price_model_from_disk(version, mmap_mode, compiled=True)
+
+
+def remove_compiled_mercedes_price_model(version="v1"):
+    """Removes the compiled model arrays saved for a version, if there are any.
+
+    Parameters
+    ----------
+    version : str, optional
+        Model version to remove the compiled arrays of. By default "v1"
+    """
+
+    model_name = f"mercedes_price_prediction_{version}.mmap"
+    with resources.path("mercedestrenz.models", model_name) as d:
+
+        d.unlink(missing_ok=True)
+
+
+class CompiledMercedesPriceModel:
+    """A price prediction model evaluated with numpy arrays only.
+
+    Created by `compile_mercedes_price_model`, it gives the same predictions
+    as the sklearn pipeline it was compiled from, up to floating point
+    rounding, without building a pandas dataframe for every call. It is
+    meant for single listings and small batches, large batches are faster
+    through the sklearn pipeline.
+
+    Parameters
+    ----------
+    arrays : dict of numpy.ndarray
+        The arrays produced by `compile_mercedes_price_model`.
+    """
+
+    def __init__(self, arrays: dict):
+        self.arrays = arrays
+
+        self._numeric_columns = [str(c) for c in arrays["numeric_columns"]]
+        self._onehot_columns = [str(c) for c in arrays["onehot_columns"]]
+        self._ordinal_columns = [str(c) for c in arrays["ordinal_columns"]]
+        self._onehot_lookups = _make_lookups(
+            arrays["onehot_values"], arrays["onehot_codes"], arrays["onehot_offsets"]
+        )
+        self._ordinal_lookups = _make_lookups(
+            arrays["ordinal_values"], arrays["ordinal_codes"], arrays["ordinal_offsets"]
+        )
+        self._n_features = int(arrays["n_features"])
+        self._max_depth = int(arrays["tree_max_depth"])
+        self._init_value = float(arrays["init_value"])
+
+    @property
+    def feature_names_in_(self) -> list:
+        """The input columns the model needs."""
+
+        return self._numeric_columns + self._onehot_columns + self._ordinal_columns
+
+    def transform(self, listings) -> np.ndarray:
+        """Encodes listings into the model's feature matrix.
+
+        Parameters
+        ----------
+        listings : dict or pandas.DataFrame
+            Equal length columns for every name in `feature_names_in_`.
+
+        Returns
+        -------
+        numpy.ndarray
+            A float64 matrix with one row per listing.
+
+        Raises
+        ------
+        ValueError
+            If a column is missing, a numeric value is not finite, or a
+            category is unknown to an encoder that does not allow it.
+        """
+
+        missing = [col for col in self.feature_names_in_ if col not in listings]
+        if len(missing) > 0:
+            raise ValueError(f"listings is missing the columns {missing}")
+
+        n_rows = len(listings[self.feature_names_in_[0]])
+        X = np.zeros((n_rows, self._n_features))
+        arrays = self.arrays
+
+        for i, column in enumerate(self._numeric_columns):
+            values = np.asarray(listings[column], dtype=np.float64)
+            if not np.isfinite(values).all():
+                raise ValueError(f"{column} must only contain finite numbers")
+            X[:, arrays["numeric_index"][i]] = (
+                values - arrays["numeric_mean"][i]
+            ) / arrays["numeric_scale"][i]
+
+        for i, column in enumerate(self._onehot_columns):
+            unknown = int(arrays["onehot_unknown"][i])
+            codes = _lookup_codes(listings[column], self._onehot_lookups[i], unknown)
+            if (codes == -2).any():
+                raise ValueError(f"{column} contains categories unknown to the model")
+            known = codes >= 0
+            X[np.flatnonzero(known), codes[known].astype(np.int64)] = 1.0
+
+        for i, column in enumerate(self._ordinal_columns):
+            codes = _lookup_codes(
+                listings[column], self._ordinal_lookups[i], arrays["ordinal_unknown"][i]
+            )
+            if np.isnan(codes).any():
+                raise ValueError(f"{column} contains categories unknown to the model")
+            X[:, arrays["ordinal_index"][i]] = codes
+
+        return X
+
+    def predict(self, listings) -> np.ndarray:
+        """Predicts the price in USD of each listing.
+
+        Parameters
+        ----------
+        listings : dict or pandas.DataFrame
+            Equal length columns for every name in `feature_names_in_`.
+
+        Returns
+        -------
+        numpy.ndarray
+            The predicted prices, in the same order as the input rows.
+        """
+
+        X = self.transform(listings)
+        predictions = np.empty(len(X))
+        for start in range(0, len(X), _BLOCK_SIZE):
+            block = slice(start, start + _BLOCK_SIZE)
+            predictions[block] = self._predict_features(X[block])
+
+        return predictions
+
+    def predict_one(self, listing: dict) -> float:
+        """Predicts the price in USD of a single listing.
+
+        Parameters
+        ----------
+        listing : dict
+            The value of every column in `feature_names_in_`.
+
+        Returns
+        -------
+        float
+            The predicted price.
+        """
+
+        return float(
+            self.predict({col: [listing[col]] for col in self.feature_names_in_})[0]
+        )
+
+    def _predict_features(self, X: np.ndarray) -> np.ndarray:
+        """Walks every tree for a block of encoded rows at once."""
+
+        arrays = self.arrays
+        feature = arrays["tree_feature"]
+        threshold = arrays["tree_threshold"]
+        left = arrays["tree_left"]
+        right = arrays["tree_right"]
+
+        # sklearn compares float32 inputs against the split thresholds
+        X = X.astype(np.float32).astype(np.float64)
+
+        if len(X) == 1:
+            # a flat walk over the trees is much cheaper for a single row
+            x = X[0]
+            nodes = arrays["tree_roots"]
+            for _ in range(self._max_depth):
+                nodes = np.where(
+                    x[feature[nodes]] <= threshold[nodes], left[nodes], right[nodes]
+                )
+            return np.array([self._init_value + arrays["tree_value"][nodes].sum()])
+
+        rows = np.arange(len(X))[:, np.newaxis]
+        nodes = np.repeat(arrays["tree_roots"][np.newaxis, :], len(X), axis=0)
+        for _ in range(self._max_depth):
+            go_left = X[rows, feature[nodes]] <= threshold[nodes]
+            nodes = np.where(go_left, left[nodes], right[nodes])
+
+        return self._init_value + arrays["tree_value"][nodes].sum(axis=1)
+
+
+def _make_lookups(values, codes, offsets) -> list:
+    """Splits flat category tables into one dict per input column."""
+
+    return [
+        dict(zip(values[start:stop].tolist(), codes[start:stop].tolist()))
+        for start, stop in zip(offsets[:-1], offsets[1:])
+    ]
+
+
+def _lookup_codes(values, lookup: dict, unknown) -> np.ndarray:
+    """Maps category values to codes, looking up each distinct value once."""
+
+    values = np.asarray(values, dtype=object)
+    if len(values) == 1:
+        return np.array([lookup.get(values[0], unknown)], dtype=np.float64)
+
+    uniques, inverse = np.unique(values.astype(str), return_inverse=True)
+    codes = np.array(
+        [lookup.get(value, unknown) for value in uniques.tolist()], dtype=np.float64
+    )
+
+    return codes[inverse]
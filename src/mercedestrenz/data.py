@@ -1,14 +1,38 @@
 # Author: Spencer Gerlach
 # Date: 2023-01-20
 from importlib import resources
+import bisect
+import datetime
+import json
+import os
+import re
+import threading
 import pandas as pd
 import numpy as np
 
-def load_sample_mercedes_listings()-> pd.DataFrame():
+# text columns with fewer distinct values than this share of rows are stored as categoricals
+_CATEGORY_MAX_RATIO = 0.5
+# bumped when the columnar cache changes, older caches are rebuilt (2: floats are only stored as float32 when exact)
+_COLUMNAR_CACHE_VERSION = 2
+
+
+def load_sample_mercedes_listings(optimize_dtypes = False, cache = False, cache_dir = None)-> pd.DataFrame():
     """
     Retrieves a dataframe containing sample data of used Mercedez Benz vehicles. 
     The function returns a pandas dataframe of all sample listings.
 
+    Parameters
+    ----------
+    optimize_dtypes : bool
+        Store text columns with few distinct values (model, condition, paint_color, ...) as categoricals
+        and downcast numeric columns to the smallest dtype that holds them exactly. The default is False.
+    cache : bool
+        Keep the parsed dataframe in memory between calls, and write it to a columnar cache of NumPy
+        .npy files on first load so later processes skip parsing the csv. Each call returns a copy.
+        The cache is rebuilt when the csv changes. The default is False.
+    cache_dir : string
+        Directory of the columnar cache. The default is mercedestrenz in the user cache directory.
+
     Returns
     -------
     pandas.DataFrame
@@ -18,15 +42,367 @@ def load_sample_mercedes_listings()-> pd.DataFrame():
     --------
     >>> from mercedestrenz.data import load_sample_mercedes_listings
     >>> sample_mercedes_listings = load_sample_mercedes_listings()
+    >>> # typed, cached copy for repeated loads
+    >>> sample_mercedes_listings = load_sample_mercedes_listings(optimize_dtypes = True, cache = True)
     """
     with resources.path('mercedestrenz.datasets', 'mercedes.csv') as d:
+        if cache:
+            return _load_cached_listings(d, optimize_dtypes, cache_dir)
+
         data = pd.read_csv(d, index_col=0)
+        if optimize_dtypes:
+            data = optimize_mercedes_listing_dtypes(data)
         return data
 
 
+def optimize_mercedes_listing_dtypes(data)-> pd.DataFrame():
+    """
+    Return a copy of a listings dataframe stored with compact dtypes.
+
+    Text columns where fewer than half of the values are distinct become categoricals, 
+    integer columns are downcast to the smallest integer dtype and float columns to float32 
+    when every value is unchanged by it. Free text columns such as description are left as objects.
+
+    Parameters
+    ----------
+    data : dataframe
+        The listings dataframe.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The listings with compact dtypes, equal in value to the input.
+
+    Examples
+    --------
+    >>> optimize_mercedes_listing_dtypes(data).memory_usage(deep = True).sum()
+    """
+    if type(data) != pd.DataFrame:
+        raise Exception("The input dataset is not of Pandas DataFrame format")
+
+    columns = {}
+    for name, column in data.items():
+        if pd.api.types.is_object_dtype(column.dtype):
+            if column.nunique() < _CATEGORY_MAX_RATIO * len(column):
+                column = column.astype('category')
+        elif pd.api.types.is_integer_dtype(column.dtype) and not pd.api.types.is_extension_array_dtype(column.dtype):
+            column = pd.to_numeric(column, downcast = 'integer')
+        elif pd.api.types.is_float_dtype(column.dtype) and not pd.api.types.is_extension_array_dtype(column.dtype):
+            # pd.to_numeric only checks that float32 is close, keep float64 unless it is exact
+            downcast = column.astype(np.float32)
+            if ((downcast.astype(column.dtype) == column) | column.isna()).all():
+                column = downcast
+        columns[name] = column
+
+    return pd.DataFrame(columns, index = data.index)
+
+
+# share of listings and approximate new price in USD of each model
+_SYNTHETIC_MODELS = {
+    'c-class': (0.22, 45000), 'e-class': (0.17, 60000), 's-class': (0.10, 105000),
+    'other': (0.08, 50000), 'gl-class': (0.07, 75000), 'm-class': (0.07, 58000),
+    'sprinter': (0.06, 48000), 'sl-class': (0.04, 95000), 'amg': (0.04, 110000),
+    'cl-class': (0.02, 100000), 'a-class': (0.02, 36000), 'metris': (0.02, 38000),
+    'b-class': (0.01, 32000), 'r-class': (0.01, 52000), 'd-class': (0.01, 40000),
+    }
+# share of listings and price factor of each condition
+_SYNTHETIC_CONDITIONS = {
+    'excellent': (0.45, 1.0), 'good': (0.30, 0.95), 'like new': (0.12, 1.08), 'fair': (0.06, 0.8),
+    'new': (0.03, 1.15), 'salvage': (0.02, 0.45), 'used': (0.02, 0.9),
+    }
+_SYNTHETIC_PAINT_COLORS = {
+    'black': 0.28, 'white': 0.20, 'silver': 0.17, 'grey': 0.12, 'blue': 0.07, 'red': 0.04,
+    'brown': 0.03, 'custom': 0.02, 'green': 0.01, 'yellow': 0.005, 'orange': 0.003, 'purple': 0.002,
+    }
+
+
+def make_synthetic_mercedes_listings(n_rows, random_state = None, template = None)-> pd.DataFrame():
+    """
+    Generate realistic used Mercedes Benz listings of any size, e.g. for benchmarks.
+
+    The model, condition, paint colour and year of each listing are drawn from the distributions of 
+    the sample data, the odometer grows with the age of the car and the price depreciates with age, 
+    mileage and condition from the new price of the model, with random noise.
+
+    Parameters
+    ----------
+    n_rows : int
+        The number of listings.
+    random_state : int
+        Seed of the random number generator, the same seed gives the same listings. The default is unseeded.
+    template : dataframe
+        Listings whose model, condition, paint_color and year distributions are copied, such as 
+        load_sample_mercedes_listings(). Its other columns are resampled too. 
+        The default uses built-in distributions close to the sample data.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The listings, with the columns price_USD, condition, paint_color, model, odometer_mi and year.
+
+    Examples
+    --------
+    >>> data = make_synthetic_mercedes_listings(1_000_000, random_state = 42)
+    >>> data = make_synthetic_mercedes_listings(10_000, random_state = 42, template = load_sample_mercedes_listings())
+    """
+    if type(n_rows) != int or n_rows < 0:
+        raise Exception("The n_rows parameter should be a non-negative integer")
+    if template is not None and type(template) != pd.DataFrame:
+        raise Exception("The template should be a Pandas DataFrame")
+
+    rng = np.random.default_rng(random_state)
+
+    def draw(shares):
+        values = np.array(list(shares), dtype = object)
+        weights = np.array(list(shares.values()), dtype = float)
+        return values[rng.choice(len(values), size = n_rows, p = weights / weights.sum())]
+
+    if template is None:
+        model = draw({name: share for name, (share, _) in _SYNTHETIC_MODELS.items()})
+        condition = draw({name: share for name, (share, _) in _SYNTHETIC_CONDITIONS.items()})
+        paint_color = draw(_SYNTHETIC_PAINT_COLORS)
+        year = np.clip(np.round(rng.normal(2013, 6.3, n_rows)), 1985, 2022).astype(np.int64)
+    else:
+        model, condition, paint_color = (
+            draw(template[name].value_counts(normalize = True, dropna = False).to_dict())
+            for name in ['model', 'condition', 'paint_color']
+            )
+        years = template['year'].dropna().to_numpy()
+        year = years[rng.integers(0, len(years), n_rows)].astype(np.int64)
+
+    # about 8,000 miles a year
+    age = 2022 - year
+    odometer_mi = np.round((age + rng.random(n_rows)) * 7400 * rng.lognormal(0, 0.4, n_rows)).astype(np.int64)
+
+    codes, names = pd.factorize(model)
+    new_price = np.array([_SYNTHETIC_MODELS.get(name, (0, 50000))[1] for name in names], dtype = float)[codes]
+    codes, names = pd.factorize(condition)
+    condition_factor = np.array([_SYNTHETIC_CONDITIONS.get(name, (0, 1.0))[1] for name in names])[codes]
+    price = new_price * 0.86 ** age * np.exp(-odometer_mi / 400_000) * condition_factor * rng.lognormal(0, 0.2, n_rows)
+    price_USD = np.maximum(np.round(price), 500).astype(np.int64)
+
+    data = pd.DataFrame({
+        'price_USD': price_USD,
+        'condition': condition,
+        'paint_color': paint_color,
+        'model': model,
+        'odometer_mi': odometer_mi,
+        'year': year,
+        })
+
+    if template is not None:
+        for name in template.columns.difference(data.columns, sort = False):
+            data[name] = template[name].to_numpy()[rng.integers(0, len(template), n_rows)]
+
+    return data
+
+
+# columns of the raw craigslist listings renamed to the package's column names
+_RAW_COLUMN_NAMES = {'price': 'price_USD', 'odometer': 'odometer_mi', 'cylinders': 'num_cylinders'}
+# (pattern, model) tried in order on a lower case raw model name, the categories of the trained model
+_MODEL_PATTERNS = [
+    (re.compile(r'sprinter'), 'sprinter'),
+    (re.compile(r'metris'), 'metris'),
+    (re.compile(r'amg\b'), 'amg'),
+    (re.compile(r'ml\s?\d|m\s?\d|m[\s-]?class\b'), 'm-class'),
+    (re.compile(r'gl[a-z]?\s?\d|gl[a-z]?[\s-]?class\b|gl[a-z]?\b'), 'gl-class'),
+    (re.compile(r'sl[a-z]?\s?\d|sl[a-z]?[\s-]?class\b|sl[a-z]?\b'), 'sl-class'),
+    (re.compile(r'cl[a-z]?\s?\d|cl[a-z]?[\s-]?class\b|cl[a-z]?\b'), 'cl-class'),
+    (re.compile(r'a\s?\d|a[\s-]?class\b'), 'a-class'),
+    (re.compile(r'b\s?\d|b[\s-]?class\b'), 'b-class'),
+    (re.compile(r'c\s?\d|c[\s-]?class\b'), 'c-class'),
+    (re.compile(r'd[\s-]?class\b'), 'd-class'),
+    (re.compile(r'e\s?\d|e[\s-]?class\b'), 'e-class'),
+    (re.compile(r'r\s?\d|r[\s-]?class\b'), 'r-class'),
+    (re.compile(r's\s?\d|s[\s-]?class\b'), 's-class'),
+    ]
+_MODEL_PREFIX = re.compile(r'^(?:(?:mercedes|benz|mercedes-benz|mb)[\s-]*)+')
+# raw condition descriptions mapped onto the ordinal levels of the trained model
+_CONDITION_NAMES = {
+    'salvage': 'salvage', 'salvaged': 'salvage', 'salvage title': 'salvage',
+    'used': 'used', 'pre owned': 'used', 'preowned': 'used',
+    'fair': 'fair', 'poor': 'fair', 'rough': 'fair',
+    'good': 'good', 'very good': 'good',
+    'excellent': 'excellent', 'great': 'excellent',
+    'like new': 'like new', 'mint': 'like new',
+    'new': 'new', 'brand new': 'new',
+    }
+_PAINT_COLOR_NAMES = {'gray': 'grey'}
+# a number written as e.g. "$15,500", "15.5k" or "80,000 km" once spaces, commas and currency are removed
+_NUMBER_NOISE = str.maketrans('', '', ' \t\n,$')
+_NUMBER = re.compile(r'(\d+(?:\.\d+)?)(k(?=mi|km|[^a-z]|$))?')
+_KILOMETERS = re.compile(r'\d(?:k?kms?(?![a-z])|kilomet)')
+
+
+def clean_raw_mercedes_listings(raw, chunk_size = 100_000, price_range = [500, 250_000], max_odometer_mi = 500_000, year_range = None, **read_csv_kwargs)-> pd.DataFrame():
+    """
+    Clean raw scraped Mercedes Benz listings into the format of the sample data.
+
+    The listings are cleaned chunk_size rows at a time with vectorized operations:
+    
+    - the craigslist columns price, odometer and cylinders are renamed to price_USD, odometer_mi and num_cylinders
+    - model names such as "Mercedes-Benz C300 4matic" become the model categories of the price model, e.g. c-class, 
+      names that match no category become other
+    - conditions are mapped onto the levels salvage, used, fair, good, excellent, like new and new, others become NaN
+    - prices and odometer readings such as "$15,500", "15.5k" or "55,000 miles" are parsed, km are converted to miles
+    - listings without a price, and outliers outside price_range, year_range or above max_odometer_mi are dropped
+    - reposted listings are dropped, keeping the last posting. Reposts share a VIN, or when there is 
+      no VIN the same model, year, odometer and paint colour.
+
+    The result can be passed to listing_search and train_mercedes_price_prediction_model.
+
+    Parameters
+    ----------
+    raw : dataframe, string or path
+        The raw listings, or the path of a csv file of raw listings.
+    chunk_size : int
+        Number of raw listings cleaned at a time. The default is 100,000.
+    price_range : list of float or int
+        The lowest and highest plausible price in USD. The default is [500, 250000].
+    max_odometer_mi : float or int
+        The highest plausible odometer reading in miles. The default is 500,000.
+    year_range : list of int
+        The oldest and newest plausible model year. The default is 1950 to next year.
+    **read_csv_kwargs
+        Passed to pandas.read_csv when raw is a path.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The cleaned listings, with the index of the raw listings.
+
+    Examples
+    --------
+    >>> data = clean_raw_mercedes_listings("vehicles.csv", usecols = ["price", "year", "model", "condition", "odometer", "paint_color", "VIN"])
+    >>> listing_search(data, budget = 20000, model = "c-class")
+    """
+    if type(chunk_size) != int or chunk_size < 1:
+        raise Exception("The chunk_size parameter should be a positive integer")
+    if year_range is None:
+        year_range = [1950, datetime.date.today().year + 1]
+
+    if isinstance(raw, (str, os.PathLike)):
+        chunks = pd.read_csv(raw, chunksize = chunk_size, **read_csv_kwargs)
+    elif type(raw) == pd.DataFrame:
+        chunks = (raw.iloc[start:start + chunk_size] for start in range(0, max(len(raw), 1), chunk_size))
+    else:
+        raise Exception("The input dataset is not of Pandas DataFrame format")
+
+    cleaned = []
+    for chunk in chunks:
+        chunk = chunk.rename(columns = {name: new_name for name, new_name in _RAW_COLUMN_NAMES.items() if new_name not in chunk.columns})
+        if 'price_USD' not in chunk.columns or 'model' not in chunk.columns:
+            raise Exception("The raw listings should contain the columns model and price_USD, or price")
+
+        chunk = chunk.assign(
+            model = _normalize_text(chunk['model'], _normalize_model_name),
+            price_USD = _parse_number(chunk['price_USD']),
+            )
+        if 'condition' in chunk.columns:
+            chunk['condition'] = _normalize_text(chunk['condition'], lambda name: _CONDITION_NAMES.get(re.sub(r'[\s_-]+', ' ', name)))
+        if 'paint_color' in chunk.columns:
+            chunk['paint_color'] = _normalize_text(chunk['paint_color'], lambda name: _PAINT_COLOR_NAMES.get(name, name))
+        if 'odometer_mi' in chunk.columns:
+            chunk['odometer_mi'] = _parse_number(chunk['odometer_mi'], km_to_miles = True)
+        if 'year' in chunk.columns:
+            chunk['year'] = _parse_number(chunk['year'])
+        if 'VIN' in chunk.columns:
+            chunk['VIN'] = _normalize_text(chunk['VIN'], lambda vin: vin.upper() if vin else np.nan)
+
+        # drop listings without a price and outliers, missing odometer readings and years are kept
+        keep = chunk['price_USD'].between(price_range[0], price_range[1])
+        if 'odometer_mi' in chunk.columns:
+            keep &= ~(chunk['odometer_mi'] > max_odometer_mi)
+        if 'year' in chunk.columns:
+            keep &= ~((chunk['year'] < year_range[0]) | (chunk['year'] > year_range[1]))
+        cleaned.append(chunk.loc[keep])
+
+    data = pd.concat(cleaned)
+    data = data.loc[~_is_reposted(data)]
+
+    # whole numbers are stored as integers when none are missing
+    for name in ['price_USD', 'odometer_mi', 'year']:
+        if name in data.columns:
+            data[name] = data[name].round()
+            if data[name].notna().all():
+                data[name] = data[name].astype(np.int64)
+
+    return data
+
+
+def _normalize_text(column, normalize):
+    """
+    Return a text column normalized by a function of its lower case values, called once per distinct value.
+    """
+    codes, uniques = pd.factorize(column)
+    normalized = np.array([normalize(str(name).lower().strip()) for name in uniques] + [np.nan], dtype = object)
+
+    return pd.Series(normalized[codes], index = column.index).fillna(np.nan)
+
+
+def _normalize_model_name(name):
+    """
+    Return the model category of a lower case raw model name.
+    """
+    name = _MODEL_PREFIX.sub('', name).strip()
+    for pattern, model in _MODEL_PATTERNS:
+        if pattern.match(name):
+            return model
+
+    return 'other'
+
+
+def _parse_number(column, km_to_miles = False):
+    """
+    Return a column of prices or distances written as numbers or text, such as "$15,500", "15.5k" or "80,000 km", as floats.
+
+    Each distinct value is parsed once.
+    """
+    if pd.api.types.is_numeric_dtype(column.dtype):
+        return column.astype(float)
+
+    codes, uniques = pd.factorize(column)
+    numbers = np.array([_parse_number_text(str(value), km_to_miles) for value in uniques] + [np.nan])
+
+    return pd.Series(numbers[codes], index = column.index)
+
+
+def _parse_number_text(value, km_to_miles):
+    """
+    Return the number written in a price or distance, NaN when there is none.
+    """
+    text = value.lower().translate(_NUMBER_NOISE).replace('usd', '')
+    match = _NUMBER.match(text)
+    if match is None:
+        return np.nan
+
+    number = float(match[1]) * (1000 if match[2] else 1)
+    if km_to_miles and 'k' in text and _KILOMETERS.search(text):
+        number *= 0.621371
+
+    return number
+
+
+def _is_reposted(data):
+    """
+    Return a mask of the listings that are posted again later in the data.
+    """
+    reposted = np.zeros(len(data), dtype = bool)
+    has_vin = data['VIN'].notna().to_numpy() if 'VIN' in data.columns else np.zeros(len(data), dtype = bool)
+    if has_vin.any():
+        reposted[has_vin] = data.loc[has_vin, 'VIN'].duplicated(keep = 'last').to_numpy()
+
+    spec = ['model', 'year', 'odometer_mi', 'paint_color']
+    if set(spec).issubset(data.columns):
+        has_spec = data[spec].notna().all(axis = 1).to_numpy() & ~has_vin
+        reposted[has_spec] = data.loc[has_spec, spec].duplicated(keep = 'last').to_numpy()
+
+    return reposted
+
+
 # Author: Kelly Wu
 # Date: 2023-01-19
-def listing_search(data, budget=[0, np.Inf], model = "any", sort_feature = "odometer_mi", ascending = True, price_col = 'price_USD')-> pd.DataFrame():
+def listing_search(data, budget=[0, np.Inf], model = "any", sort_feature = "odometer_mi", ascending = True, price_col = 'price_USD', limit = None)-> pd.DataFrame():
     """
     Return the top listings that are within the budget specified by the user.
 
@@ -37,8 +413,8 @@ def listing_search(data, budget=[0, np.Inf], model = "any", sort_feature = "odom
     
     Parameters
     ----------
-    data : dataframe
-        The input dataframe.
+    data : dataframe, ListingIndex or ListingStore
+        The input dataframe, a ListingIndex built from it for faster repeated searches, or a ListingStore.
     budget : float or int,  or list of float or int
         The maximum budget, or the range of budget when passing a list.
     model : string
@@ -49,6 +425,9 @@ def listing_search(data, budget=[0, np.Inf], model = "any", sort_feature = "odom
         Boolean value that indicate whether the sort is ascending. The default value is True.
     price_col : string
         String value that indicates the column name of car price. The default is price_USD.
+    limit : int
+        Only return this many of the top listings. Only these rows are sorted and copied, which is much faster
+        than sorting every matching listing. The default is to return all matching listings.
 
     Returns
     -------
@@ -61,13 +440,827 @@ def listing_search(data, budget=[0, np.Inf], model = "any", sort_feature = "odom
     >>> listing_search(data, budget=[2000, 20000], model = "any", sort_feature = "odometer_mi", ascending = True)
     >>> # search listings for a specific model and below a maximum price
     >>> listing_search(data, budget=20000, model = "gl-class", sort_feature = "odometer_mi", ascending = True)
+    >>> # first page of 20 listings
+    >>> listing_search(data, budget=[2000, 20000], limit = 20)
     """
 
+    if isinstance(data, (ListingIndex, ListingStore)):
+        return data.search(budget, model, sort_feature, ascending, price_col, limit)
+
     # ======= Unit tests ==========
     # check input data is a pd.dataframe
     if type(data) != pd.DataFrame:
         raise Exception("The input dataset is not of Pandas DataFrame format")
 
+    _check_listing_search_args(
+        budget,
+        model,
+        lambda: data['model'].unique(),
+        sort_feature,
+        lambda: data.select_dtypes('number').columns.to_list(),
+        ascending,
+        price_col,
+        limit,
+    )
+
+    # ======= Function ==========
+    
+    # filter by budget
+    if type(budget) in [float, int]: # max budget specified
+        condition = data[price_col] <= budget
+    else:
+        condition = ((budget[0] <= data[price_col]) & (data[price_col] <= budget[1]))
+
+    # filter by model
+    if model != "any":
+        condition = condition & (data['model'] == model)
+
+    # top listings only, select them without sorting every match
+    if limit is not None:
+        rows = np.flatnonzero(condition.to_numpy())
+        prices = data[price_col].to_numpy(dtype = float)
+        return _sorted_listings(data, rows, prices, sort_feature, ascending, price_col, limit)
+
+    temp_df = data.loc[condition]
+
+    # sort by price & output
+    result = temp_df.sort_values(by = [sort_feature, price_col], ascending = [ascending, True])
+
+    # order output 
+    result = result.loc[:, _listing_column_order(data.columns, sort_feature, price_col)]
+
+    return result
+
+
+class ListingIndex:
+    """
+    A listings dataframe prepared for fast repeated listing searches.
+
+    The rows are grouped by model and sorted by price once, so filtering by
+    budget becomes a binary search instead of a scan of every listing.
+    Searches return the same results as listing_search on the dataframe.
+    The dataframe should not be modified after the index is built.
+
+    Parameters
+    ----------
+    data : dataframe
+        The listings dataframe to index.
+    price_col : string
+        String value that indicates the column name of car price. The default is price_USD.
+
+    Examples
+    --------
+    >>> index = ListingIndex(data)
+    >>> index.search(budget=[2000, 20000], model = "c-class", sort_feature = "odometer_mi")
+    >>> # the index can also be passed to listing_search in place of the dataframe
+    >>> listing_search(index, budget=20000, model = "gl-class")
+    """
+
+    def __init__(self, data, price_col = 'price_USD'):
+        if type(data) != pd.DataFrame:
+            raise Exception("The input dataset is not of Pandas DataFrame format")
+        if type(price_col) != str:
+            raise Exception("Please specify the price column name using a string, or use the default value.")
+        if price_col not in data.columns or 'model' not in data.columns:
+            raise Exception(f"The input dataset should contain the columns model and {price_col}")
+
+        self.data = data
+        self.price_col = price_col
+        self.models = data['model'].unique()
+        self.numeric_cols = data.select_dtypes('number').columns.to_list()
+
+        prices = data[price_col].to_numpy(dtype = float)
+        self._prices = prices
+        has_price = ~np.isnan(prices)
+
+        # all listings sorted by price, listings without a price never match a budget
+        order = np.argsort(prices, kind = 'stable')[:has_price.sum()]
+        self._groups = {'any': (prices[order], order)}
+
+        # listings of each model sorted by price
+        codes, uniques = pd.factorize(data['model'])
+        order = np.lexsort((prices, codes))
+        order = order[(codes[order] >= 0) & has_price[order]]
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        for i, model in enumerate(uniques):
+            group = order[bounds[i]:bounds[i + 1]]
+            self._groups[model] = (prices[group], group)
+
+    def search(self, budget=[0, np.Inf], model = "any", sort_feature = "odometer_mi", ascending = True, price_col = 'price_USD', limit = None)-> pd.DataFrame():
+        """
+        Return the top listings that are within the budget specified by the user.
+
+        Takes the same arguments as listing_search, see listing_search for details.
+
+        Returns
+        -------
+        pandas.DataFrame
+            A pandas dataframe of the sorted listings that matches user's expected budget range.
+        """
+
+        _check_listing_search_args(
+            budget,
+            model,
+            lambda: self.models,
+            sort_feature,
+            lambda: self.numeric_cols,
+            ascending,
+            price_col,
+            limit,
+        )
+        if price_col != self.price_col:
+            raise Exception(f"The index was built for the price column {self.price_col}")
+
+        # keep the original row order so ties are broken like listing_search
+        rows = np.sort(self._budget_rows(budget, model))
+
+        return _sorted_listings(self.data, rows, self._prices, sort_feature, ascending, price_col, limit)
+
+    def _budget_rows(self, budget, model):
+        """
+        Return the positions of the listings of a model within a budget.
+        """
+        prices, rows = self._groups.get(model, (np.array([]), np.array([], dtype = int)))
+
+        if type(budget) in [float, int]: # max budget specified
+            start, stop = 0, np.searchsorted(prices, budget, side = 'right')
+        else:
+            start = np.searchsorted(prices, budget[0], side = 'left')
+            stop = np.searchsorted(prices, budget[1], side = 'right')
+
+        return rows[start:stop]
+
+
+class ListingStore:
+    """
+    A mutable collection of listings for listing_search queries.
+
+    Listings can be inserted, deleted and repriced while the store is being
+    searched. The listings of each model are kept in lists sorted by price,
+    so every change is a binary search and a list insert or delete instead
+    of rebuilding a dataframe. Searches return the same results as
+    listing_search on to_frame(), where listings are in insertion order.
+
+    Parameters
+    ----------
+    data : dataframe
+        The initial listings, indexed by a unique listing id. Its columns and 
+        their dtypes are used for every listing, it can be empty.
+    price_col : string
+        String value that indicates the column name of car price. The default is price_USD.
+
+    Examples
+    --------
+    >>> store = ListingStore(data)
+    >>> store.insert(123, {'price_USD': 18500, 'model': 'c-class', 'odometer_mi': 42000, 'year': 2016})
+    >>> store.update_price(123, 17900)
+    >>> store.search(budget=20000, model = "c-class")
+    >>> store.delete(123)
+    >>> # the store can also be passed to listing_search in place of the dataframe
+    >>> listing_search(store, budget=20000, model = "c-class")
+    """
+
+    def __init__(self, data, price_col = 'price_USD'):
+        if type(data) != pd.DataFrame:
+            raise Exception("The input dataset is not of Pandas DataFrame format")
+        if type(price_col) != str:
+            raise Exception("Please specify the price column name using a string, or use the default value.")
+        if price_col not in data.columns or 'model' not in data.columns:
+            raise Exception(f"The input dataset should contain the columns model and {price_col}")
+        if not data.index.is_unique:
+            raise Exception("The index of the input dataset should be unique listing ids")
+        if not data.columns.is_unique:
+            raise Exception("The column names of the input dataset should be unique")
+
+        self.price_col = price_col
+        self.columns = data.columns.to_list()
+        self.numeric_cols = data.select_dtypes('number').columns.to_list()
+        self._dtypes = {name: dtype for name, dtype in data.dtypes.items() if dtype.kind in 'biuf'}
+        self._index_name = data.index.name
+        self._index_dtype = data.index.dtype
+        self._price_pos = self.columns.index(price_col)
+        self._model_pos = self.columns.index('model')
+        self._lock = threading.Lock()
+
+        # each listing is (insertion number, values), the insertion number breaks ties like the row order of a dataframe
+        self._listings = dict(zip(data.index, enumerate(data.itertuples(index = False, name = None))))
+        self._next = len(data)
+        self._model_counts = data['model'].value_counts().to_dict()
+
+        # (price, insertion number, id) of every priced listing, sorted, per model and for any model
+        self._groups = {}
+        prices = data[price_col].to_numpy(dtype = float)
+        ids = data.index.to_numpy()
+        for model, rows in data.groupby('model', sort = False).indices.items():
+            rows = rows[~np.isnan(prices[rows])]
+            rows = rows[np.argsort(prices[rows], kind = 'stable')]
+            self._groups[model] = list(zip(prices[rows].tolist(), rows.tolist(), ids[rows].tolist()))
+        rows = np.argsort(prices, kind = 'stable')[:(~np.isnan(prices)).sum()]
+        self._groups['any'] = list(zip(prices[rows].tolist(), rows.tolist(), ids[rows].tolist()))
+
+    def __len__(self):
+        return len(self._listings)
+
+    def __contains__(self, listing_id):
+        return listing_id in self._listings
+
+    @property
+    def models(self):
+        """The models of the listings in the store."""
+        return list(self._model_counts)
+
+    def insert(self, listing_id, listing):
+        """
+        Add a listing to the store.
+
+        Parameters
+        ----------
+        listing_id : hashable
+            The unique id of the listing.
+        listing : dict
+            The values of the listing by column name, missing columns are NaN.
+        """
+        unknown = set(listing) - set(self.columns)
+        if unknown:
+            raise Exception(f"The listing has columns {sorted(unknown)} that are not in the store")
+        values = tuple(listing.get(name, np.nan) for name in self.columns)
+        self._check_price(values[self._price_pos])
+
+        with self._lock:
+            if listing_id in self._listings:
+                raise Exception(f"The listing {listing_id} already exists in the store")
+
+            number = self._next
+            self._next += 1
+            self._listings[listing_id] = (number, values)
+            model = values[self._model_pos]
+            if not _is_missing(model):
+                self._model_counts[model] = self._model_counts.get(model, 0) + 1
+            self._add_to_groups(listing_id, number, values)
+
+    def delete(self, listing_id):
+        """
+        Remove a listing from the store, e.g. once the car is sold.
+
+        Parameters
+        ----------
+        listing_id : hashable
+            The id of the listing.
+        """
+        with self._lock:
+            if listing_id not in self._listings:
+                raise Exception(f"The listing {listing_id} does not exist in the store")
+
+            number, values = self._listings.pop(listing_id)
+            model = values[self._model_pos]
+            if not _is_missing(model):
+                self._model_counts[model] -= 1
+                if self._model_counts[model] == 0:
+                    del self._model_counts[model]
+            self._remove_from_groups(number, values)
+
+    def update_price(self, listing_id, price):
+        """
+        Change the price of a listing, keeping its place in the insertion order.
+
+        Parameters
+        ----------
+        listing_id : hashable
+            The id of the listing.
+        price : float or int
+            The new price.
+        """
+        self._check_price(price)
+
+        with self._lock:
+            if listing_id not in self._listings:
+                raise Exception(f"The listing {listing_id} does not exist in the store")
+
+            number, values = self._listings[listing_id]
+            self._remove_from_groups(number, values)
+            values = values[:self._price_pos] + (price,) + values[self._price_pos + 1:]
+            self._listings[listing_id] = (number, values)
+            self._add_to_groups(listing_id, number, values)
+
+    def to_frame(self)-> pd.DataFrame():
+        """
+        Return the listings in the store as a dataframe indexed by listing id, in insertion order.
+        """
+        with self._lock:
+            ids = list(self._listings)
+            rows = [values for _, values in self._listings.values()]
+
+        return self._make_frame(ids, rows)
+
+    def search(self, budget=[0, np.Inf], model = "any", sort_feature = "odometer_mi", ascending = True, price_col = 'price_USD', limit = None)-> pd.DataFrame():
+        """
+        Return the top listings that are within the budget specified by the user.
+
+        Takes the same arguments as listing_search, see listing_search for details.
+
+        Returns
+        -------
+        pandas.DataFrame
+            A pandas dataframe of the sorted listings that matches user's expected budget range.
+        """
+        _check_listing_search_args(
+            budget,
+            model,
+            lambda: self.models,
+            sort_feature,
+            lambda: self.numeric_cols,
+            ascending,
+            price_col,
+            limit,
+        )
+        if price_col != self.price_col:
+            raise Exception(f"The store was built for the price column {self.price_col}")
+
+        if type(budget) in [float, int]: # max budget specified
+            budget = [-np.inf, budget]
+
+        with self._lock:
+            group = self._groups.get(model, [])
+            start = bisect.bisect_left(group, (budget[0], -1))
+            stop = bisect.bisect_right(group, (budget[1], np.inf))
+            # keep the insertion order so ties are broken like listing_search
+            matches = sorted(group[start:stop], key = lambda entry: entry[1])
+            ids = [listing_id for _, _, listing_id in matches]
+            rows = [self._listings[listing_id][1] for listing_id in ids]
+
+        data = self._make_frame(ids, rows)
+        prices = data[price_col].to_numpy(dtype = float)
+
+        return _sorted_listings(data, np.arange(len(data)), prices, sort_feature, ascending, price_col, limit)
+
+    def _make_frame(self, ids, rows):
+        """
+        Return listings as a dataframe with the dtypes of the initial data where they still fit.
+        """
+        index = pd.Index(ids, name = self._index_name)
+        if not ids:
+            index = index.astype(self._index_dtype)
+        data = pd.DataFrame(rows, columns = self.columns, index = index)
+
+        return data.astype(self._dtypes, errors = 'ignore')
+
+    def _check_price(self, price):
+        """
+        Raise an error before any change to the store if a price cannot be sorted as a number.
+        """
+        if _is_missing(price):
+            return
+        try:
+            float(price)
+        except (TypeError, ValueError):
+            raise Exception(f"The price {price!r} is not a number")
+
+    def _add_to_groups(self, listing_id, number, values):
+        price = values[self._price_pos]
+        if _is_missing(price):
+            return
+
+        entry = (float(price), number, listing_id)
+        bisect.insort(self._groups['any'], entry)
+        model = values[self._model_pos]
+        if not _is_missing(model):
+            bisect.insort(self._groups.setdefault(model, []), entry)
+
+    def _remove_from_groups(self, number, values):
+        price = values[self._price_pos]
+        if _is_missing(price):
+            return
+
+        key = (float(price), number)
+        models = ['any'] if _is_missing(values[self._model_pos]) else ['any', values[self._model_pos]]
+        for model in models:
+            group = self._groups[model]
+            del group[bisect.bisect_left(group, key)]
+            if not group and model != 'any':
+                del self._groups[model]
+
+
+def listing_search_batch(data, queries, sort_feature = "odometer_mi", ascending = True, price_col = 'price_USD', limit = None, as_frame = False):
+    """
+    Run many listing searches, each with its own budget range and model, together.
+
+    The queries are grouped by model and all of their budget ranges are found
+    with one binary search per group over the listings sorted by price. The
+    listings are ranked by sort_feature once, so each result only needs to
+    sort the ranks of its own rows. Every result is the same as listing_search
+    would return for that query.
+
+    Parameters
+    ----------
+    data : dataframe or ListingIndex
+        The input dataframe, or a ListingIndex built from it.
+    queries : dataframe
+        One row per search, indexed by query id. The column budget_max holds the
+        maximum budget, the optional column budget_min the minimum budget (missing
+        means no minimum) and the optional column model the car model (missing or
+        "any" means any model).
+    sort_feature : string
+        The numeric variable used to sort every result. The default value is to sort by odometer value.
+    ascending : bool
+        Boolean value that indicate whether the sort is ascending. The default value is True.
+    price_col : string
+        String value that indicates the column name of car price. The default is price_USD.
+    limit : int
+        Only return this many of the top listings of each query. The default is to return all matching listings.
+    as_frame : bool
+        Whether to return one long dataframe with a query_id column instead of a dictionary. The default is False.
+
+    Returns
+    -------
+    dict or pandas.DataFrame
+        A dictionary of the results of listing_search keyed by query id, or a
+        single dataframe of all results with the query id in the first column.
+
+    Examples
+    --------
+    >>> queries = pd.DataFrame({
+    ...     'budget_min': [2000, 10000],
+    ...     'budget_max': [20000, 40000],
+    ...     'model': ['c-class', 'any'],
+    ...     }, index=['alert-1', 'alert-2'])
+    >>> listing_search_batch(data, queries, limit = 10)
+    """
+
+    if type(data) == pd.DataFrame:
+        data = ListingIndex(data, price_col)
+    elif not isinstance(data, ListingIndex):
+        raise Exception("The input dataset is not of Pandas DataFrame format")
+
+    if type(queries) != pd.DataFrame:
+        raise Exception("The queries should be a Pandas DataFrame with one search per row")
+    if 'budget_max' not in queries.columns:
+        raise Exception("The queries should have a budget_max column")
+    if type(as_frame) != bool:
+        raise Exception("Please specify True or False in the as_frame parameter")
+
+    # budget and model are checked per query below
+    _check_listing_search_args(
+        [0, np.Inf],
+        'any',
+        lambda: data.models,
+        sort_feature,
+        lambda: data.numeric_cols,
+        ascending,
+        price_col,
+        limit,
+    )
+    if price_col != data.price_col:
+        raise Exception(f"The index was built for the price column {data.price_col}")
+
+    budget_max = pd.to_numeric(queries['budget_max'], errors = 'coerce').to_numpy(dtype = float)
+    if 'budget_min' in queries.columns:
+        budget_min = pd.to_numeric(queries['budget_min'], errors = 'coerce').to_numpy(dtype = float)
+        budget_min = np.where(np.isnan(budget_min), -np.inf, budget_min)
+    else:
+        budget_min = np.full(len(queries), -np.inf)
+    if np.isnan(budget_max).any():
+        raise Exception("The budget range boundaries should be floats or integers")
+
+    models = queries['model'].fillna('any') if 'model' in queries.columns else pd.Series('any', index = queries.index)
+    unknown = set(models) - set(data._groups)
+    if len(unknown) > 0:
+        raise Exception(f"The specified car models {sorted(map(str, unknown))} do not exist in the dataframe provided")
+
+    listings = data.data
+    keys = listings[sort_feature].to_numpy()
+    all_col = _listing_column_order(listings.columns, sort_feature, price_col)
+    columns = listings.columns.get_indexer(all_col) if listings.columns.is_unique else None
+
+    # rank of every listing in the sort order, ties broken by original position
+    rank = None
+    if keys.dtype.kind in 'iuf':
+        rank = np.empty(len(keys), dtype = int)
+        rank[_sort_order(keys, data._prices, ascending)] = np.arange(len(keys))
+
+    query_rows = [None] * len(queries)
+    for model, positions in models.groupby(models, sort = False).indices.items():
+        prices, rows = data._groups[model]
+        starts = np.searchsorted(prices, budget_min[positions], side = 'left')
+        stops = np.searchsorted(prices, budget_max[positions], side = 'right')
+
+        for position, start, stop in zip(positions, starts, stops):
+            selected = rows[start:max(start, stop)]
+            if rank is None:
+                query_rows[position] = np.sort(selected)
+            else:
+                if limit is not None and limit < len(selected):
+                    # partial selection of the top ranks, ranks are unique
+                    selected = selected[np.argpartition(rank[selected], limit)[:limit]]
+                query_rows[position] = selected[np.argsort(rank[selected])]
+
+    if rank is None or columns is None:
+        # sort_feature is not a plain numeric column, search each query on its own
+        results = [
+            _sorted_listings(listings, rows, data._prices, sort_feature, ascending, price_col, limit)
+            for rows in query_rows
+        ]
+    elif as_frame:
+        lengths = [len(rows) for rows in query_rows]
+        result = listings.iloc[np.concatenate([np.array([], dtype = int)] + query_rows), columns]
+        result.insert(0, 'query_id', np.repeat(queries.index.to_numpy(), lengths))
+        return result
+    else:
+        results = [listings.iloc[rows, columns] for rows in query_rows]
+
+    if not as_frame:
+        return dict(zip(queries.index, results))
+
+    result = pd.concat([listings.iloc[:0].loc[:, all_col]] + results)
+    result.insert(0, 'query_id', np.repeat(queries.index.to_numpy(), [len(r) for r in results]))
+
+    return result
+
+
+def listing_search_stream(source, budget = [0, np.Inf], model = "any", sort_feature = "odometer_mi", ascending = True, price_col = 'price_USD', limit = 100, chunk_size = 100_000, **read_csv_kwargs)-> pd.DataFrame():
+    """
+    Return the top listings within a budget from a csv file that does not fit in memory.
+
+    The file is read chunk_size rows at a time and each chunk is filtered by budget and model like listing_search.
+    Only the top limit listings seen so far are kept between chunks, so memory stays bounded by limit and chunk_size.
+    The result is the same as listing_search(data, ..., limit = limit) on the whole file.
+    Other sources, such as the record batches of a Parquet file, can be searched by passing an iterable of dataframes.
+
+    Parameters
+    ----------
+    source : string, path or iterable of dataframes
+        Path of the csv file, or the chunks of the listings in their original order.
+    budget : float or int,  or list of float or int
+        The maximum budget, or the range of budget when passing a list.
+    model : string
+        The model of the car that the user is interested in. The default is to include listings of any model.
+    sort_feature : string
+        The numeric variable that the user is interested in using to sort the result. The default value is to sort by odometer value.
+    ascending : bool
+        Boolean value that indicate whether the sort is ascending. The default value is True.
+    price_col : string
+        String value that indicates the column name of car price. The default is price_USD.
+    limit : int
+        Only return this many of the top listings. The default is 100. 
+        None returns every matching listing, which then all have to fit in memory.
+    chunk_size : int
+        Number of rows of the csv file read at a time. The default is 100,000.
+    **read_csv_kwargs
+        Passed to pandas.read_csv, e.g. index_col or dtype. Give the dtype of columns with 
+        missing values so every chunk is parsed the same way as the whole file.
+
+    Returns
+    -------
+    pandas.DataFrame
+        A pandas dataframe of the sorted listings that matches user's expected budget range.
+
+    Examples
+    --------
+    >>> # the 20 cheapest c-class listings with the lowest mileage in a large csv dump
+    >>> listing_search_stream("listings.csv", budget=[2000, 20000], model = "c-class", limit = 20)
+    >>> # a Parquet file, read in record batches
+    >>> import pyarrow.parquet as pq
+    >>> batches = pq.ParquetFile("listings.parquet").iter_batches(batch_size = 100_000)
+    >>> listing_search_stream((batch.to_pandas() for batch in batches), budget=20000, limit = 20)
+    """
+    # the model and sort feature are checked against the chunks as they are read
+    _check_listing_search_args(
+        budget, model, lambda: [model], sort_feature, lambda: [sort_feature], ascending, price_col, limit,
+    )
+    if type(chunk_size) != int or chunk_size < 1:
+        raise Exception("The chunk_size parameter should be a positive integer")
+
+    if isinstance(source, (str, os.PathLike)):
+        chunks = pd.read_csv(source, chunksize = chunk_size, **read_csv_kwargs)
+    else:
+        chunks = source
+
+    matches = []
+    models = set()
+    for chunk in chunks:
+        if type(chunk) != pd.DataFrame:
+            raise Exception("The input dataset is not of Pandas DataFrame format")
+        if sort_feature not in chunk.select_dtypes('number').columns:
+            raise Exception("The specified sort_feature should be a numeric column in the provided dataframe.")
+
+        # filter by budget
+        if type(budget) in [float, int]: # max budget specified
+            condition = chunk[price_col] <= budget
+        else:
+            condition = ((budget[0] <= chunk[price_col]) & (chunk[price_col] <= budget[1]))
+
+        # filter by model
+        if model != "any":
+            models.update(chunk['model'].unique())
+            condition = condition & (chunk['model'] == model)
+
+        matches.append(chunk.loc[condition])
+
+        # keep the top listings only, in their original order
+        if limit is not None and len(matches) > 1:
+            top = pd.concat(matches)
+            matches = [top.iloc[_top_positions(top, sort_feature, ascending, price_col, limit)]]
+
+    if model != "any" and model not in models:
+        raise Exception("The specified car model does not exist in the dataframe provided")
+    if not matches:
+        return pd.DataFrame()
+
+    top = pd.concat(matches)
+    prices = top[price_col].to_numpy(dtype = float)
+
+    return _sorted_listings(top, np.arange(len(top)), prices, sort_feature, ascending, price_col, limit)
+
+
+def find_mercedes_deals(data, budget = [0, np.Inf], model = "any", price_col = 'price_USD', limit = 10, rank_by = 'discount_USD', version = "v1", n_workers = 1, chunk_size = 100_000)-> pd.DataFrame():
+    """
+    Return the listings priced furthest below their predicted fair price.
+
+    The listings are filtered by budget and model like listing_search, then every remaining listing 
+    is scored with the packaged price prediction model in batches of chunk_size rows. 
+    The discount is the predicted price minus the asking price. Listings that cannot be scored 
+    because of missing or invalid features are left out.
+
+    Parameters
+    ----------
+    data : dataframe
+        The listings, with the price column and the model, year, odometer_mi, condition and paint_color columns.
+    budget : float or int,  or list of float or int
+        The maximum budget, or the range of budget when passing a list.
+    model : string
+        The model of the car that the user is interested in. The default is to include listings of any model.
+    price_col : string
+        String value that indicates the column name of car price. The default is price_USD.
+    limit : int
+        Return this many of the best deals, None returns every listing ranked. The default is 10.
+    rank_by : string
+        Rank by the discount in USD, 'discount_USD', or as a percentage of the predicted price, 'discount_pct'. 
+        Ties are ranked by lower price. The default is 'discount_USD'.
+    version : string
+        Version of the price prediction model. The default is v1.
+    n_workers : int
+        Number of processes scoring the listings, None uses one per CPU. The default is 1.
+    chunk_size : int
+        Number of listings scored at a time. The default is 100,000.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The deals, best first, with the columns predicted_price_USD, discount_USD and discount_pct added after the price.
+
+    Examples
+    --------
+    >>> # the 20 best c-class deals under $30,000
+    >>> find_mercedes_deals(data, budget=30000, model = "c-class", limit = 20)
+    >>> # score millions of listings on 8 cores
+    >>> find_mercedes_deals(data, limit = 100, rank_by = 'discount_pct', n_workers = 8)
+    """
+    # imported here so the data functions do not load scikit-learn
+    from mercedestrenz.predict import FEATURE_COLUMNS, predict_mercedes_price_parallel
+
+    if type(data) != pd.DataFrame:
+        raise Exception("The input dataset is not of Pandas DataFrame format")
+    if type(price_col) != str:
+        raise Exception("Please specify the price column name using a string, or use the default value.")
+    if price_col not in data.select_dtypes('number').columns:
+        raise Exception(f"The price column {price_col} should be a numeric column in the provided dataframe.")
+    _check_listing_search_args(
+        budget,
+        model,
+        lambda: data['model'].unique(),
+        price_col,
+        lambda: [price_col],
+        True,
+        price_col,
+        limit,
+    )
+    if rank_by not in ['discount_USD', 'discount_pct']:
+        raise Exception("The rank_by parameter should be 'discount_USD' or 'discount_pct'")
+
+    # filter by budget and model before scoring
+    prices = data[price_col].to_numpy(dtype = float)
+    if type(budget) in [float, int]: # max budget specified
+        condition = prices <= budget
+    else:
+        condition = (budget[0] <= prices) & (prices <= budget[1])
+    if model != "any":
+        condition = condition & (data['model'] == model).to_numpy()
+    rows = np.flatnonzero(condition)
+
+    # missing feature columns are reported by the prediction function
+    columns = [name for name in FEATURE_COLUMNS if name in data.columns]
+    features = data.iloc[rows, data.columns.get_indexer(columns)]
+    predicted = predict_mercedes_price_parallel(features, version, n_workers, chunk_size, errors = "coerce")
+
+    scored = ~np.isnan(predicted)
+    rows, predicted, prices = rows[scored], predicted[scored], prices[rows[scored]]
+    discount = np.round(predicted - prices, 2)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        discount_pct = np.round(100 * discount / predicted, 2)
+
+    keys = discount if rank_by == 'discount_USD' else discount_pct
+    if limit is None:
+        order = _sort_order(keys, prices, ascending = False)
+    else:
+        order = _top_order(keys, prices, False, limit)
+
+    result = data.iloc[rows[order]]
+    position = result.columns.get_loc(price_col) + 1
+    result.insert(position, 'discount_pct', discount_pct[order])
+    result.insert(position, 'discount_USD', discount[order])
+    result.insert(position, 'predicted_price_USD', predicted[order])
+
+    return result
+
+
+def _top_positions(data, sort_feature, ascending, price_col, limit):
+    """
+    Return the row positions of the top listings of a search result, in their original order.
+    """
+    keys = data[sort_feature].to_numpy()
+    prices = data[price_col].to_numpy(dtype = float)
+
+    if keys.dtype.kind in 'iuf':
+        return np.sort(_top_order(keys, prices, ascending, limit))
+
+    ranked = pd.DataFrame({'key': data[sort_feature].array, 'price': prices})
+    ranked = ranked.sort_values(by = ['key', 'price'], ascending = [ascending, True])
+
+    return np.sort(ranked.index.to_numpy()[:limit])
+
+
+def _sorted_listings(data, rows, prices, sort_feature, ascending, price_col, limit = None):
+    """
+    Return the listings at the given row positions sorted like listing_search.
+
+    The row positions must be in their original order. When limit is given only
+    the top listings are selected with a partial sort and copied.
+    """
+    all_col = _listing_column_order(data.columns, sort_feature, price_col)
+
+    keys = data[sort_feature].to_numpy()
+    if keys.dtype.kind not in 'iuf' or not data.columns.is_unique:
+        temp_df = data.iloc[rows]
+        result = temp_df.sort_values(by = [sort_feature, price_col], ascending = [ascending, True])
+        result = result.loc[:, all_col]
+        return result if limit is None else result.iloc[:limit]
+
+    if limit is None:
+        rows = rows[_sort_order(keys[rows], prices[rows], ascending)]
+    else:
+        rows = rows[_top_order(keys[rows], prices[rows], ascending, limit)]
+
+    return data.iloc[rows, data.columns.get_indexer(all_col)]
+
+
+def _top_order(keys, prices, ascending, limit):
+    """
+    Return the first limit positions of _sort_order without sorting every listing.
+
+    Every listing whose key is not beyond the limit-th smallest key is a
+    candidate, this keeps all ties at the boundary. Only the candidates are
+    then sorted, in their original order so ties are broken the same way.
+    """
+    if limit == 0:
+        return np.array([], dtype = int)
+
+    missing = np.isnan(keys) if keys.dtype.kind == 'f' else np.zeros(len(keys), dtype = bool)
+    present = np.flatnonzero(~missing)
+
+    # missing keys sort last, only a full sort can order them
+    if limit >= len(present):
+        return _sort_order(keys, prices, ascending)[:limit]
+
+    values = keys[present].astype(float)
+    if not ascending:
+        values = -values
+    boundary = np.partition(values, limit - 1)[limit - 1]
+    candidates = present[values <= boundary]
+
+    return candidates[_sort_order(keys[candidates], prices[candidates], ascending)[:limit]]
+
+
+def _sort_order(keys, prices, ascending):
+    """
+    Return the order that sorts listings by a numeric key and then by price.
+
+    Matches DataFrame.sort_values: ties keep their original order and missing
+    keys go last, whether ascending or not.
+    """
+    missing = np.isnan(keys) if keys.dtype.kind == 'f' else np.zeros(len(keys), dtype = bool)
+    if not ascending:
+        # exact ranks, so large integers are not rounded by negating as floats
+        keys = -np.unique(keys, return_inverse = True)[1]
+
+    return np.lexsort((prices, keys, missing))
+
+
+def _check_listing_search_args(budget, model, get_models, sort_feature, get_numeric_cols, ascending, price_col, limit):
+    """
+    Raise an exception if the arguments of a listing search are invalid.
+
+    The models and numeric columns of the data are passed as functions so
+    they are only computed once the earlier checks have passed.
+    """
     # check budget is either a flort/int or a list of float/int
     if type(budget) not in [float, int]: 
         if len(budget) == 2:
@@ -82,7 +1275,7 @@ def listing_search(data, budget=[0, np.Inf], model = "any", sort_feature = "odom
             raise Exception("The model parameter should have a string as the input")
     
     # The string should correspond to a specific car model in the model column
-    if ((model in data['model'].unique()) or model == 'any') == False:
+    if ((model in get_models()) or model == 'any') == False:
         raise Exception("The specified car model does not exist in the dataframe provided")
 
     # sort_feature should be a string
@@ -90,7 +1283,7 @@ def listing_search(data, budget=[0, np.Inf], model = "any", sort_feature = "odom
         raise Exception("The input value for sort_feature parameter should be a string")
     
     # sort_feature should indicate a numeric column in the provided data frame
-    numeric_cols = data.select_dtypes('number').columns.to_list()
+    numeric_cols = get_numeric_cols()
     if sort_feature not in numeric_cols:
         raise Exception("The specified sort_feature should be a numeric column in the provided dataframe.")
 
@@ -102,28 +1295,153 @@ def listing_search(data, budget=[0, np.Inf], model = "any", sort_feature = "odom
     if type(price_col) != str:
         raise Exception("Please specify the price column name using a string, or use the default value.")
 
+    # limit is either None or a non-negative integer
+    if limit is not None and (type(limit) != int or limit < 0):
+        raise Exception("The limit parameter should be a non-negative integer")
 
-    # ======= Function ==========
-    
-    # filter by budget
-    if type(budget) in [float, int]: # max budget specified
-        condition = data[price_col] <= budget
-    else:
-        condition = ((budget[0] <= data[price_col]) & (data[price_col] <= budget[1]))
-    temp_df = data.loc[condition]
-
-    # filter by model
-    if model != "any":
-        condition = data['model'] == model
-        temp_df = temp_df.loc[condition]
-
-    # sort by price & output
-    result = temp_df.sort_values(by = [sort_feature, price_col], ascending = [ascending, True])
 
-    # order output 
+def _listing_column_order(columns, sort_feature, price_col):
+    """
+    Return the columns of a search result, price, model and sort feature first.
+    """
     priority_order = [price_col, 'model', sort_feature]
-    remaining = list(set(data.columns) - set(priority_order))
+    remaining = list(set(columns) - set(priority_order))
     all_col = priority_order + remaining
-    result = result.loc[:, all_col]
 
-    return result
+    return all_col
+
+
+_listings_cache = {}
+_listings_cache_lock = threading.Lock()
+
+
+def _load_cached_listings(csv_path, optimize_dtypes, cache_dir):
+    """
+    Return a copy of a listings csv, parsed once per process and cached as columnar files on disk.
+    """
+    stat = os.stat(csv_path)
+    signature = [stat.st_mtime_ns, stat.st_size]
+    key = (os.path.abspath(csv_path), optimize_dtypes)
+
+    if cache_dir is None:
+        cache_base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        cache_dir = os.path.join(cache_base, 'mercedestrenz')
+    columnar_dir = os.path.join(cache_dir, os.path.splitext(os.path.basename(csv_path))[0])
+
+    with _listings_cache_lock:
+        if key not in _listings_cache or _listings_cache[key][0] != signature:
+            loaded = _read_columnar_listings(columnar_dir, signature)
+            if loaded is None:
+                data = pd.read_csv(csv_path, index_col=0)
+                optimized = optimize_mercedes_listing_dtypes(data)
+                _write_columnar_listings(optimized, data.dtypes, columnar_dir, signature)
+            else:
+                optimized, dtypes = loaded
+                data = None
+
+            if optimize_dtypes:
+                data = optimized
+            elif data is None:
+                data = optimized.astype(dtypes)
+
+            _listings_cache[key] = (signature, data)
+
+        return _listings_cache[key][1].copy()
+
+
+def _write_columnar_listings(data, dtypes, columnar_dir, signature):
+    """
+    Write a listings dataframe as one .npy file per column, text stored as codes and utf-8 bytes.
+
+    The metadata file is written last so an interrupted write is never read back. 
+    Dataframes with column types other than numbers, booleans and text are not cached.
+    """
+    columns = [('index', data.index.to_series())] + list(data.items())
+    arrays = {}
+    kinds = []
+    for i, (name, column) in enumerate(columns):
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            codes, categories = column.cat.codes.to_numpy(), column.cat.categories
+        elif pd.api.types.is_object_dtype(column.dtype):
+            codes, categories = pd.factorize(column)
+        elif column.dtype.kind in 'biuf':
+            arrays[f'{i}'] = column.to_numpy()
+            kinds.append('values')
+            continue
+        else:
+            return
+
+        if pd.api.types.infer_dtype(categories, skipna = False) != 'string':
+            return
+        text = [value.encode('utf-8') for value in categories]
+        arrays[f'{i}.codes'] = np.asarray(codes)
+        arrays[f'{i}.text'] = np.frombuffer(b''.join(text), dtype = np.uint8)
+        arrays[f'{i}.offsets'] = np.cumsum([0] + [len(value) for value in text], dtype = np.int64)
+        kinds.append('text')
+
+    meta = {
+        'version': _COLUMNAR_CACHE_VERSION,
+        'signature': signature,
+        'index_name': data.index.name,
+        'index_dtype': str(data.index.dtype),
+        'columns': data.columns.to_list(),
+        'kinds': kinds,
+        'dtypes': [str(column.dtype) for _, column in columns],
+        'source_dtypes': [str(dtype) for dtype in dtypes],
+        }
+
+    try:
+        os.makedirs(columnar_dir, exist_ok = True)
+        for name, array in arrays.items():
+            np.save(os.path.join(columnar_dir, f'{name}.npy'), array)
+        meta_path = os.path.join(columnar_dir, 'meta.json')
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+    except OSError:
+        # the cache is only an optimization, e.g. the cache directory may be read-only
+        pass
+
+
+def _read_columnar_listings(columnar_dir, signature):
+    """
+    Read a listings dataframe written by _write_columnar_listings.
+
+    Returns the compact dataframe and the dtypes of the csv it was parsed from, 
+    or None when there is no cache for this version of the csv.
+    """
+    try:
+        with open(os.path.join(columnar_dir, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('version') != _COLUMNAR_CACHE_VERSION or meta['signature'] != signature:
+            return None
+
+        columns = []
+        for i, (kind, dtype) in enumerate(zip(meta['kinds'], meta['dtypes'])):
+            if kind == 'values':
+                columns.append(np.load(os.path.join(columnar_dir, f'{i}.npy')))
+                continue
+
+            codes = np.load(os.path.join(columnar_dir, f'{i}.codes.npy'))
+            text = np.load(os.path.join(columnar_dir, f'{i}.text.npy')).tobytes()
+            offsets = np.load(os.path.join(columnar_dir, f'{i}.offsets.npy'))
+            categories = [text[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+            column = pd.Categorical.from_codes(codes, categories = pd.Index(categories, dtype = object))
+            columns.append(column if dtype == 'category' else column.astype(object))
+    except (OSError, ValueError, KeyError):
+        return None
+
+    index = pd.Index(columns[0], name = meta['index_name'], dtype = meta['index_dtype'])
+    data = pd.DataFrame(dict(zip(range(len(meta['columns'])), columns[1:])), index = index)
+    data.columns = meta['columns']
+    dtypes = pd.Series(meta['source_dtypes'], index = meta['columns'])
+
+    return data, dtypes
+
+
+def _is_missing(value):
+    """
+    Return True for a missing scalar value such as None or NaN.
+    """
+    return value is None or value is pd.NA or (isinstance(value, float) and np.isnan(value))
+
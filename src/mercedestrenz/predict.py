@@ -1,9 +1,25 @@
 # Author: Ty Andrews
 # Date: 2023-01-12
 import pandas as pd
+import numpy as np
 from importlib import resources
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+import time
 import joblib
 
+from mercedestrenz.compiled import CompiledMercedesPriceModel
+from mercedestrenz.compiled import export_compiled_mercedes_price_model
+from mercedestrenz.compiled import remove_compiled_mercedes_price_model
+
+FEATURE_COLUMNS = ["model", "year", "odometer_mi", "condition", "paint_color"]
+CONDITIONS = ["salvage", "used", "fair", "good", "excellent", "like new", "new"]
+
 
 def predict_mercedes_price(
     model: str,
@@ -12,6 +28,7 @@ def predict_mercedes_price(
     condition: str,
     paint_color: str,
     version="v1",
+    cache=None,
 ) -> int:
     """Predicts the price in USD of a Mercedes-Benz given the year, model,
     condition, paint color and odometer reading.
@@ -34,6 +51,9 @@ def predict_mercedes_price(
         The color of the paint.
     version : str, optional
         Model version to use if multiple available, by default "v1".
+    cache : MercedesPricePredictionCache, optional
+        A prediction cache to look up and store the result in, by default
+        None which always runs the model.
 
     Returns
     -------
@@ -56,19 +76,69 @@ def predict_mercedes_price(
     >>> predict_mercedes_price("e-class", 2015, 55_000, "fair", "silver")
     """
 
+    _check_prediction_inputs(model, year, odometer_mi, condition, paint_color, version)
+
+    if cache is not None:
+        # the hash and the model come from the same read of the model file
+        model_hash, price_model = model_cache._get_entry(version, None)
+        odometer_mi = cache.bucket_odometer(odometer_mi)
+        cache_key = (
+            version,
+            model_hash,
+            model,
+            year,
+            odometer_mi,
+            condition,
+            paint_color,
+        )
+        cached_price = cache.get(cache_key)
+        if cached_price is not None:
+            return cached_price
+    else:
+        price_model = load_mercedes_price_model(version)
+
+    price_prediction = price_model.predict(
+        pd.DataFrame(
+            {
+                "model": [model],
+                "year": [year],
+                "odometer_mi": [odometer_mi],
+                "condition": [condition],
+                "paint_color": [paint_color],
+            }
+        )
+    )
+
+    price = round(float(price_prediction[0]), 2)
+
+    if cache is not None:
+        cache.put(cache_key, price)
+
+    return price
+
+
+def _check_prediction_inputs(model, year, odometer_mi, condition, paint_color, version):
+    """Raises an error if the inputs for a single prediction are invalid."""
+
     if type(model) is not str:
         raise TypeError("model must be a string")
     if type(year) is not int:
         raise TypeError("year must be an integer from 1929 to 2021")
     if type(odometer_mi) is not int:
         raise TypeError("odometer_mi must be an integer")
-    if (type(condition) is not str):
+    if type(condition) is not str:
         raise TypeError(
             "condition must be of type str and one of 'salvage', 'used', 'fair', 'good', 'excellent', 'like new', 'new'"
         )
-    if (condition
-        not in ["salvage", "used", "fair", "good", "excellent", "like new", "new"]
-    ):
+    if condition not in [
+        "salvage",
+        "used",
+        "fair",
+        "good",
+        "excellent",
+        "like new",
+        "new",
+    ]:
         raise ValueError(
             "condition must be one of 'salvage', 'used', 'fair', 'good', 'excellent', 'like new', 'new'"
         )
@@ -77,24 +147,328 @@ def predict_mercedes_price(
     if type(version) is not str:
         raise TypeError("version must be a string of form 'vX'")
 
-    price_model = load_mercedes_price_model(version)
 
-    price_prediction = price_model.predict(
-        pd.DataFrame(
-            {
-                "model": [model],
-                "year": [year],
-                "odometer_mi": [odometer_mi],
-                "condition": [condition],
-                "paint_color": [paint_color],
-            }
+def predict_mercedes_price_batch(listings, version="v1", errors="raise") -> np.ndarray:
+    """Predicts the price in USD of many Mercedes-Benz listings at once.
+
+    The columns are validated once for the whole batch and all valid rows
+    are scored with a single call to the model pipeline, which avoids the
+    per-call overhead of `predict_mercedes_price`.
+
+    Parameters
+    ----------
+    listings : pandas.DataFrame or dict
+        A dataframe, or a dict of equal length column arrays, with the columns
+        model, year, odometer_mi, condition and paint_color. Extra columns
+        are ignored.
+    version : str, optional
+        Model version to use if multiple available, by default "v1".
+    errors : str, optional
+        What to do with invalid rows. "raise" raises a ValueError listing
+        them, "coerce" returns NaN for them. By default "raise".
+    mp_context : str, optional
+        Start method of the worker processes, one of "spawn", "forkserver"
+        or "fork", by default "spawn". Forked workers can inherit the model
+        cache's lock while another thread holds it.
+
+    Returns
+    -------
+    numpy.ndarray
+        The predicted prices in USD, in the same order as the input rows.
+
+    Raises
+    ------
+    TypeError
+        If listings is not a dataframe or a dict of columns.
+    ValueError
+        If a required column is missing, or errors="raise" and any row is
+        invalid.
+
+    Examples
+    --------
+    >>> from mercedestrenz.predict import predict_mercedes_price_batch
+    >>> predict_mercedes_price_batch(
+    ...     {
+    ...         "model": ["e-class", "c-class"],
+    ...         "year": [2015, 2012],
+    ...         "odometer_mi": [55_000, 90_000],
+    ...         "condition": ["fair", "good"],
+    ...         "paint_color": ["silver", "black"],
+    ...     }
+    ... )
+    """
+
+    if errors not in ["raise", "coerce"]:
+        raise ValueError("errors must be one of 'raise', 'coerce'")
+    if type(version) is not str:
+        raise TypeError("version must be a string of form 'vX'")
+
+    features = _get_feature_frame(listings)
+    reasons = _get_invalid_row_reasons(features)
+    valid = pd.isna(reasons)
+
+    if errors == "raise" and not valid.all():
+        invalid_rows = pd.Series(reasons, index=features.index)[~valid]
+        raise ValueError(
+            f"{len(invalid_rows)} invalid rows, first invalid rows:\n"
+            f"{invalid_rows.head(10).to_string()}"
         )
-    )
 
-    return round(float(price_prediction[0]), 2)
+    predictions = np.full(len(features), np.nan)
+    if valid.any():
+        price_model = load_mercedes_price_model(version)
+        predictions[valid] = price_model.predict(features.loc[valid])
+
+    return np.round(predictions, 2)
+
+
+def predict_mercedes_price_parallel(
+    listings,
+    version="v1",
+    n_workers=None,
+    chunk_size=100_000,
+    errors="raise",
+    mp_context="spawn",
+) -> np.ndarray:
+    """Predicts the price in USD of a very large set of listings on many cores.
+
+    The listings are split into chunks that are scored with
+    `predict_mercedes_price_batch` across a process pool. Every worker loads
+    the model once when it starts and reuses it for all of its chunks.
+
+    Parameters
+    ----------
+    listings : pandas.DataFrame or dict
+        A dataframe, or a dict of equal length column arrays, with the columns
+        model, year, odometer_mi, condition and paint_color.
+    version : str, optional
+        Model version to use if multiple available, by default "v1".
+    n_workers : int, optional
+        Number of worker processes, by default None which uses one per CPU.
+        With 1 the chunks are scored in the calling process.
+    chunk_size : int, optional
+        Number of rows scored per task, by default 100_000.
+    errors : str, optional
+        What to do with invalid rows. "raise" raises a ValueError listing
+        them, "coerce" returns NaN for them. By default "raise".
+
+    Returns
+    -------
+    numpy.ndarray
+        The predicted prices in USD, in the same order as the input rows.
+
+    Raises
+    ------
+    ValueError
+        If a required column is missing, n_workers or chunk_size is not a
+        positive integer, mp_context is not an available start method, or
+        errors="raise" and any row is invalid.
+    FileNotFoundError
+        If the model version is not found.
+
+    Examples
+    --------
+    >>> from mercedestrenz.predict import predict_mercedes_price_parallel
+    >>> predict_mercedes_price_parallel(listings, n_workers=4, chunk_size=50_000)
+    """
+
+    if n_workers is not None and (type(n_workers) is not int or n_workers < 1):
+        raise ValueError("n_workers must be a positive integer")
+    if type(chunk_size) is not int or chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer")
+    if errors not in ["raise", "coerce"]:
+        raise ValueError("errors must be one of 'raise', 'coerce'")
+    if mp_context not in multiprocessing.get_all_start_methods():
+        raise ValueError(
+            "mp_context must be one of "
+            f"{', '.join(multiprocessing.get_all_start_methods())}"
+        )
+
+    features = _get_feature_frame(listings)
+
+    # validate once up front so errors report rows of the whole input
+    if errors == "raise":
+        invalid_rows = validate_mercedes_listings(features)
+        if len(invalid_rows) > 0:
+            raise ValueError(
+                f"{len(invalid_rows)} invalid rows, first invalid rows:\n"
+                f"{invalid_rows.head(10).to_string()}"
+            )
+
+    if len(features) == 0:
+        return np.array([])
+
+    # fail here rather than with a broken pool when the workers cannot load it
+    with resources.path("mercedestrenz.models", _get_model_name(version)) as d:
+        if not d.exists():
+            _raise_model_not_found(version)
+
+    predictions = np.empty(len(features))
+    starts = range(0, len(features), chunk_size)
+
+    if n_workers == 1:
+        for start in starts:
+            chunk = features.iloc[start : start + chunk_size]
+            predictions[start : start + len(chunk)] = _predict_chunk(chunk, version)
+
+        return predictions
+
+    # chunks are only sliced and sent when a worker is about to need them, so
+    # the input is not held a second time in pickled form
+    max_in_flight = 2 * (n_workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=multiprocessing.get_context(mp_context),
+        initializer=_init_worker,
+        initargs=(version,),
+    ) as executor:
+        pending = {}
+
+        def collect(futures):
+            for future in futures:
+                start = pending.pop(future)
+                chunk_predictions = future.result()
+                predictions[start : start + len(chunk_predictions)] = chunk_predictions
+
+        for start in starts:
+            if len(pending) >= max_in_flight:
+                collect(wait(pending, return_when=FIRST_COMPLETED)[0])
+
+            chunk = features.iloc[start : start + chunk_size]
+            pending[executor.submit(_predict_chunk, chunk, version)] = start
+
+        collect(list(pending))
+
+    return predictions
+
+
+def _init_worker(version: str):
+    """Loads the model into a worker process's cache when the worker starts."""
+
+    model_cache.warmup([version])
+
+
+def _predict_chunk(chunk: pd.DataFrame, version: str) -> np.ndarray:
+    """Scores one chunk of listings with the process's cached model."""
+
+    return predict_mercedes_price_batch(chunk, version, errors="coerce")
+
+
+def validate_mercedes_listings(listings) -> pd.Series:
+    """Checks which listings can be passed to the price prediction model.
+
+    Each column is checked once with vectorized operations, only columns
+    that fail the fast check are inspected row by row.
+
+    Parameters
+    ----------
+    listings : pandas.DataFrame or dict
+        A dataframe, or a dict of equal length column arrays, with the columns
+        model, year, odometer_mi, condition and paint_color.
+
+    Returns
+    -------
+    pandas.Series
+        The reason each invalid row was rejected, indexed by the row labels
+        of the invalid rows. Empty if all rows are valid.
+
+    Raises
+    ------
+    TypeError
+        If listings is not a dataframe or a dict of columns.
+    ValueError
+        If a required column is missing.
+
+    Examples
+    --------
+    >>> from mercedestrenz.data import load_sample_mercedes_listings
+    >>> from mercedestrenz.predict import validate_mercedes_listings
+    >>> validate_mercedes_listings(load_sample_mercedes_listings())
+    """
+
+    features = _get_feature_frame(listings)
+    reasons = pd.Series(_get_invalid_row_reasons(features), index=features.index)
+
+    return reasons.dropna()
+
+
+def _get_invalid_row_reasons(features: pd.DataFrame) -> np.ndarray:
+    """Returns the rejection reason of each row, None for valid rows."""
+
+    # checked in reverse priority so the first failing column wins
+    checks = [
+        (
+            ~_is_str_column(features["paint_color"]),
+            "paint_color must be a string, if unsure use 'unknown'",
+        ),
+        (
+            ~features["condition"].isin(CONDITIONS),
+            "condition must be one of 'salvage', 'used', 'fair', 'good', 'excellent', 'like new', 'new'",
+        ),
+        (
+            ~_is_int_column(features["odometer_mi"]),
+            "odometer_mi must be an integer",
+        ),
+        (
+            ~_is_int_column(features["year"]),
+            "year must be an integer from 1929 to 2021",
+        ),
+        (~_is_str_column(features["model"]), "model must be a string"),
+    ]
 
+    reasons = np.full(len(features), None, dtype=object)
+    for invalid, reason in checks:
+        reasons[invalid.to_numpy()] = reason
 
-def export_mercedes_price_model(model_pipeline, version="v1"):
+    return reasons
+
+
+def _get_feature_frame(listings) -> pd.DataFrame:
+    """Selects the model feature columns from a dataframe or dict of columns."""
+
+    if isinstance(listings, pd.DataFrame):
+        missing = [col for col in FEATURE_COLUMNS if col not in listings.columns]
+    elif isinstance(listings, dict):
+        missing = [col for col in FEATURE_COLUMNS if col not in listings]
+    else:
+        raise TypeError("listings must be a pandas DataFrame or a dict of columns")
+
+    if len(missing) > 0:
+        raise ValueError(f"listings is missing the columns {missing}")
+
+    if isinstance(listings, pd.DataFrame):
+        return listings.loc[:, FEATURE_COLUMNS]
+
+    return pd.DataFrame({col: listings[col] for col in FEATURE_COLUMNS})
+
+
+def _is_str_column(column: pd.Series) -> pd.Series:
+    """Returns a boolean mask of the values in a column that are strings."""
+
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        values_are_str = pd.api.types.infer_dtype(column.cat.categories) == "string"
+        if values_are_str:
+            return column.notna()
+    elif pd.api.types.infer_dtype(column, skipna=False) == "string":
+        return pd.Series(True, index=column.index)
+
+    return column.map(lambda value: type(value) is str).astype(bool)
+
+
+def _is_int_column(column: pd.Series) -> pd.Series:
+    """Returns a boolean mask of the values in a column that are whole numbers."""
+
+    if pd.api.types.is_integer_dtype(column.dtype):
+        return pd.Series(True, index=column.index)
+    if pd.api.types.is_bool_dtype(column.dtype):
+        return pd.Series(False, index=column.index)
+    if pd.api.types.is_float_dtype(column.dtype):
+        return np.isfinite(column) & (column == np.floor(column))
+
+    return column.map(lambda value: type(value) is int).astype(bool)
+
+
+def export_mercedes_price_model(model_pipeline, version="v1", mmap=False):
     """Exports the sklearn model pipeline for mercedes price prediction
 
     Parameters
@@ -103,26 +477,51 @@ def export_mercedes_price_model(model_pipeline, version="v1"):
         sklearn pipeline with the model and preprocessing steps
     version : str, optional
         What to tag the model version by. By default "v1"
+    mmap : bool, optional
+        Whether to also save the compiled model arrays so the model can be
+        loaded with `mmap_mode`, by default False. Otherwise the compiled
+        arrays of an earlier export of the version are removed.
     """
 
-    model_name = f"mercedes_price_prediction_{version}.joblib"
+    model_name = _get_model_name(version)
     with resources.path("mercedestrenz.models", model_name) as d:
 
         joblib.dump(model_pipeline, d)
 
+    if mmap is True:
+        export_compiled_mercedes_price_model(model_pipeline, version)
+    else:
+        # a compiled model of an earlier export of this version is stale now
+        remove_compiled_mercedes_price_model(version)
 
-def load_mercedes_price_model(version="v1"):
+
+def load_mercedes_price_model(version="v1", use_cache=True, mmap_mode=None):
     """Loads the sklearn model for mercedes price prediction
 
+    By default the model is served from the in-process `model_cache`, so it
+    is only read from disk the first time or after the model file changed.
+    The cached pipeline is shared between callers and should not be modified.
+
+    With `mmap_mode` the compiled model arrays saved by
+    `export_mercedes_price_model(..., mmap=True)` are memory mapped instead,
+    so processes loading the same version share one copy through the OS
+    page cache.
+
     Parameters
     ----------
     version : str, optional
         Model version to use if multiple available, by default "v1"
+    use_cache : bool, optional
+        Whether to use the in-process model cache, by default True
+    mmap_mode : str, optional
+        Memory map mode of the compiled model arrays, e.g. "r". By default
+        None which loads the sklearn pipeline.
 
     Returns
     -------
-    Pipeline
-        A sklearn pipeline with the model and preprocessing steps
+    Pipeline or CompiledMercedesPriceModel
+        A sklearn pipeline with the model and preprocessing steps, or the
+        memory mapped compiled model if `mmap_mode` is given.
 
     Raises
     ------
@@ -130,15 +529,382 @@ def load_mercedes_price_model(version="v1"):
         If the model version is not found.
     """
 
-    model_name = f"mercedes_price_prediction_{version}.joblib"
+    if use_cache is True:
+        return model_cache.get(version, mmap_mode)
+
+    return _load_mercedes_price_model_from_disk(version, mmap_mode)
+
+
+def _get_model_name(version, compiled=False) -> str:
+    """Returns the file name a model version, or its compiled arrays, is saved under."""
+
+    if compiled is False:
+        return f"mercedes_price_prediction_{version}.joblib"
+
+    return f"mercedes_price_prediction_{version}.mmap"
+
+
+def _load_model_file(path, compiled=False, mmap_mode=None):
+    """Loads a pipeline, or a compiled model optionally memory mapped, from a file."""
+
+    if compiled is False:
+        return joblib.load(path)
+
+    return CompiledMercedesPriceModel(joblib.load(path, mmap_mode=mmap_mode))
+
+
+def _load_mercedes_price_model_from_disk(version="v1", mmap_mode=None, compiled=None):
+    """Loads a model version from the package's models directory.
+
+    The compiled model is loaded if `compiled` is True, or by default if a
+    `mmap_mode` is given.
+    """
+
+    if compiled is None:
+        compiled = mmap_mode is not None
+
+    model_name = _get_model_name(version, compiled)
     with resources.path("mercedestrenz.models", model_name) as d:
 
         try:
-            mercedes_price_model = joblib.load(d)
+            mercedes_price_model = _load_model_file(d, compiled, mmap_mode)
         except FileNotFoundError as e:
-            with resources.path("mercedestrenz", "models") as p:
-                raise FileNotFoundError(
-                    f"Model version {version} not found. Available models: \n{list(p.glob('*.joblib'))}"
-                )
+            _raise_model_not_found(version, compiled)
 
     return mercedes_price_model
+
+
+def _raise_model_not_found(version, compiled=False):
+    """Raises a FileNotFoundError listing the available model versions."""
+
+    if compiled is False:
+        message, pattern = f"Model version {version} not found.", "*.joblib"
+    else:
+        message = (
+            f"Compiled model version {version} not found, export it with mmap=True."
+        )
+        pattern = "*.mmap"
+
+    with resources.path("mercedestrenz", "models") as p:
+        raise FileNotFoundError(
+            f"{message} Available models: \n{list(p.glob(pattern))}"
+        )
+
+
+def _hash_model_file(path) -> str:
+    """Returns the sha256 hex digest of a model file."""
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def _read_model_file(path, compiled=False, mmap_mode=None):
+    """Returns the sha256 hex digest of a model file and the model loaded from it.
+
+    The file is read once and the model is loaded from the bytes that were
+    hashed, so the hash always belongs to the model even if the file is
+    replaced meanwhile. Memory mapped arrays have to be loaded from the file
+    itself, there the file is hashed and mapped again until it did not change
+    in between.
+    """
+
+    if mmap_mode is None:
+        data = path.read_bytes()
+        model = _load_model_file(io.BytesIO(data), compiled)
+        return hashlib.sha256(data).hexdigest(), model
+
+    while True:
+        before = os.stat(path)
+        file_hash = _hash_model_file(path)
+        model = _load_model_file(path, compiled, mmap_mode)
+        after = os.stat(path)
+        if (before.st_ino, before.st_mtime_ns, before.st_size) == (
+            after.st_ino,
+            after.st_mtime_ns,
+            after.st_size,
+        ):
+            return file_hash, model
+
+
+class MercedesPriceModelCache:
+    """A thread-safe, bounded cache of loaded price prediction pipelines.
+
+    Pipelines are keyed by model version and memory map mode. Each lookup
+    checks the model file's modification time and size; when they change
+    the file is hashed and the model is reloaded only if the content
+    changed. When more than `max_size` models are cached the least recently
+    used one is evicted.
+
+    Parameters
+    ----------
+    max_size : int, optional
+        The maximum number of models kept in memory, by default 4
+
+    Examples
+    --------
+    >>> from mercedestrenz.predict import model_cache
+    >>> model_cache.warmup(["v1"])
+    >>> pipeline = model_cache.get("v1")
+    >>> model_cache.clear()
+    """
+
+    def __init__(self, max_size: int = 4):
+        if type(max_size) is not int or max_size < 1:
+            raise ValueError("max_size must be a positive integer")
+
+        self.max_size = max_size
+        # (version, mmap_mode) -> (file signature, file hash, model), oldest first
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        # (version, mmap_mode) -> lock held while that model file is hashed or loaded
+        self._key_locks = {}
+
+    def get(self, version="v1", mmap_mode=None):
+        """Returns the model for a version, loading it if needed.
+
+        Parameters
+        ----------
+        version : str, optional
+            Model version to use if multiple available, by default "v1"
+        mmap_mode : str, optional
+            Memory map mode of the compiled model arrays, by default None
+            which loads the sklearn pipeline.
+
+        Returns
+        -------
+        Pipeline or CompiledMercedesPriceModel
+            A sklearn pipeline with the model and preprocessing steps, or the
+            memory mapped compiled model if `mmap_mode` is given.
+
+        Raises
+        ------
+        FileNotFoundError
+            If the model version is not found.
+        """
+
+        return self._get_entry(version, mmap_mode)[1]
+
+    def fingerprint(self, version="v1", mmap_mode=None) -> str:
+        """Returns the sha256 hash of the model file a version is served from.
+
+        Parameters
+        ----------
+        version : str, optional
+            Model version to use if multiple available, by default "v1"
+        mmap_mode : str, optional
+            Memory map mode of the compiled model arrays, by default None
+
+        Returns
+        -------
+        str
+            The hex digest of the model file.
+        """
+
+        return self._get_entry(version, mmap_mode)[0]
+
+    def _get_entry(self, version, mmap_mode):
+        """Returns the file hash and the model of a version, loading it if needed.
+
+        The global lock is only held to look up and store entries. Hashing and
+        loading a file happen under a lock of the version alone, so they do not
+        block lookups of other versions.
+        """
+
+        key = (version, mmap_mode)
+        compiled = mmap_mode is not None
+        model_name = _get_model_name(version, compiled)
+        with resources.path("mercedestrenz.models", model_name) as d:
+
+            try:
+                stat = d.stat()
+            except FileNotFoundError:
+                with self._lock:
+                    self._models.pop(key, None)
+                _raise_model_not_found(version, compiled)
+
+            signature = (stat.st_mtime_ns, stat.st_size)
+
+            with self._lock:
+                entry = self._lookup(key, signature)
+                if entry is not None:
+                    return entry
+                key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+            with key_lock:
+                with self._lock:
+                    # another thread may have loaded the file meanwhile
+                    entry = self._lookup(key, signature)
+                    cached = self._models.get(key)
+                if entry is not None:
+                    return entry
+
+                if cached is not None and _hash_model_file(d) == cached[1]:
+                    # file was touched or rewritten with the same content
+                    file_hash, model = cached[1], cached[2]
+                else:
+                    file_hash, model = _read_model_file(d, compiled, mmap_mode)
+
+                with self._lock:
+                    self._models[key] = (signature, file_hash, model)
+                    self._models.move_to_end(key)
+                    while len(self._models) > self.max_size:
+                        self._models.popitem(last=False)
+
+                return file_hash, model
+
+    def _lookup(self, key, signature):
+        """Returns the cached (file hash, model) if the file is unchanged, call with the lock held."""
+
+        if key in self._models and self._models[key][0] == signature:
+            self._models.move_to_end(key)
+            return self._models[key][1:]
+
+        return None
+
+    def warmup(self, versions=("v1",), mmap_mode=None):
+        """Loads model versions into the cache ahead of the first prediction.
+
+        Parameters
+        ----------
+        versions : list of str, optional
+            The model versions to load, by default ("v1",)
+        mmap_mode : str, optional
+            Memory map mode of the compiled model arrays, by default None
+        """
+
+        for version in versions:
+            self.get(version, mmap_mode)
+
+    def clear(self, version=None):
+        """Removes one model version, or all of them, from the cache.
+
+        Parameters
+        ----------
+        version : str, optional
+            The model version to remove, by default None which removes all.
+        """
+
+        with self._lock:
+            if version is None:
+                self._models.clear()
+            else:
+                for key in [key for key in self._models if key[0] == version]:
+                    del self._models[key]
+
+    def versions(self) -> list:
+        """Returns the cached model versions, least recently used first."""
+
+        with self._lock:
+            return [version for version, _ in self._models]
+
+
+model_cache = MercedesPriceModelCache()
+
+
+class MercedesPricePredictionCache:
+    """A thread-safe cache of predicted prices for repeated inputs.
+
+    Results are keyed on the model version and the hash of its model file
+    together with the inputs, so a new or replaced model file never serves
+    stale prices. The least recently used entry is evicted when the cache
+    is full and entries older than `ttl` seconds are treated as misses.
+
+    Parameters
+    ----------
+    max_size : int, optional
+        The maximum number of cached predictions, by default 10_000
+    ttl : float, optional
+        Seconds after which a cached prediction expires, by default None
+        which never expires.
+    odometer_bucket : int, optional
+        Width in miles of the buckets odometer readings are rounded into,
+        by default None which uses the exact reading. A bucketed reading is
+        replaced by the middle of its bucket before predicting, so every
+        reading in a bucket gets the same price.
+
+    Examples
+    --------
+    >>> from mercedestrenz.predict import MercedesPricePredictionCache
+    >>> cache = MercedesPricePredictionCache(max_size=1000, odometer_bucket=1000)
+    >>> predict_mercedes_price("e-class", 2015, 55_000, "fair", "silver", cache=cache)
+    >>> cache.stats()
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl=None, odometer_bucket=None):
+        if type(max_size) is not int or max_size < 1:
+            raise ValueError("max_size must be a positive integer")
+        if ttl is not None and (type(ttl) not in [float, int] or ttl <= 0):
+            raise ValueError("ttl must be a positive number of seconds")
+        if odometer_bucket is not None and (
+            type(odometer_bucket) is not int or odometer_bucket < 1
+        ):
+            raise ValueError("odometer_bucket must be a positive integer")
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.odometer_bucket = odometer_bucket
+        self.hits = 0
+        self.misses = 0
+        # key -> (time stored, price), oldest first
+        self._prices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bucket_odometer(self, odometer_mi: int) -> int:
+        """Rounds an odometer reading to the middle of its bucket."""
+
+        if self.odometer_bucket is None:
+            return odometer_mi
+
+        return (odometer_mi // self.odometer_bucket) * self.odometer_bucket + (
+            self.odometer_bucket // 2
+        )
+
+    def get(self, key):
+        """Returns the cached price for a key, or None if missing or expired."""
+
+        with self._lock:
+            if key in self._prices:
+                stored_at, price = self._prices[key]
+                if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                    self._prices.move_to_end(key)
+                    self.hits += 1
+                    return price
+
+                del self._prices[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, price):
+        """Stores a price, evicting the least recently used entry if full."""
+
+        with self._lock:
+            self._prices[key] = (time.monotonic(), price)
+            self._prices.move_to_end(key)
+
+            while len(self._prices) > self.max_size:
+                self._prices.popitem(last=False)
+
+    def clear(self):
+        """Removes all cached predictions and resets the statistics."""
+
+        with self._lock:
+            self._prices.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """Returns the hits, misses, hit rate and size of the cache."""
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+                "size": len(self._prices),
+            }
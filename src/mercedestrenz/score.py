@@ -0,0 +1,113 @@
+import argparse
+import sys
+import time
+
+import pandas as pd
+
+from mercedestrenz.predict import model_cache, predict_mercedes_price_batch
+
+NUMERIC_COLUMNS = ["year", "odometer_mi"]
+
+
+def score_mercedes_listings_csv(
+    input_path, output_path, version="v1", chunk_size=100_000
+) -> dict:
+    """Appends a predicted price column to a CSV of listings, chunk by chunk.
+
+    The input is read and written `chunk_size` rows at a time, so memory use
+    does not depend on the size of the file. Rows that cannot be scored are
+    written with an empty predicted_price_USD, including rows whose year or
+    odometer_mi is not a number.
+
+    Parameters
+    ----------
+    input_path : str or path
+        CSV file with the columns model, year, odometer_mi, condition and
+        paint_color. All other columns are copied to the output.
+    output_path : str or path
+        Where to write the scored CSV.
+    version : str, optional
+        Model version to use if multiple available, by default "v1".
+    chunk_size : int, optional
+        Number of rows read, scored and written at a time, by default 100_000.
+
+    Returns
+    -------
+    dict
+        The number of rows, rejected rows, elapsed seconds and rows per second.
+
+    Examples
+    --------
+    >>> from mercedestrenz.score import score_mercedes_listings_csv
+    >>> score_mercedes_listings_csv("listings.csv", "scored.csv", version="v1")
+    """
+
+    if type(chunk_size) is not int or chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer")
+
+    start = time.perf_counter()
+    model_cache.warmup([version])
+
+    rows = 0
+    rejected = 0
+    with open(output_path, "w", newline="") as output:
+        for i, chunk in enumerate(pd.read_csv(input_path, chunksize=chunk_size)):
+            # one malformed number makes read_csv parse the whole column of a
+            # chunk as text, coerce so that only the malformed rows are rejected
+            numeric = {
+                column: pd.to_numeric(chunk[column], errors="coerce")
+                for column in NUMERIC_COLUMNS
+                if column in chunk.columns
+            }
+            predictions = predict_mercedes_price_batch(
+                chunk.assign(**numeric), version, errors="coerce"
+            )
+            chunk["predicted_price_USD"] = predictions
+            chunk.to_csv(output, header=(i == 0), index=False)
+
+            rows += len(chunk)
+            rejected += int(pd.isna(predictions).sum())
+
+    elapsed = time.perf_counter() - start
+
+    return {
+        "rows": rows,
+        "rejected": rejected,
+        "seconds": elapsed,
+        "rows_per_second": rows / elapsed if elapsed > 0 else float("inf"),
+    }
+
+
+def main(argv=None):
+    """Command line entry point of mercedestrenz-score."""
+
+    parser = argparse.ArgumentParser(
+        prog="mercedestrenz-score",
+        description="Append a predicted_price_USD column to a CSV of Mercedes-Benz listings.",
+    )
+    parser.add_argument("input", help="CSV file of listings to score")
+    parser.add_argument("output", help="where to write the scored CSV")
+    parser.add_argument("--version", default="v1", help="model version, default v1")
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=100_000,
+        help="rows read and written at a time, default 100000",
+    )
+    args = parser.parse_args(argv)
+
+    stats = score_mercedes_listings_csv(
+        args.input, args.output, version=args.version, chunk_size=args.chunk_size
+    )
+
+    print(
+        f"Scored {stats['rows']} rows in {stats['seconds']:.1f}s "
+        f"({stats['rows_per_second']:.0f} rows/s), rejected {stats['rejected']} rows.",
+        file=sys.stderr,
+    )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
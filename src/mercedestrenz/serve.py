@@ -0,0 +1,235 @@
+import argparse
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from mercedestrenz.predict import (
+    FEATURE_COLUMNS,
+    load_mercedes_price_model,
+    model_cache,
+    predict_mercedes_price,
+    validate_mercedes_listings,
+)
+
+
+class MercedesPriceRequestHandler(BaseHTTPRequestHandler):
+    """Handles the price prediction endpoints of `make_server`.
+
+    GET /health reports whether the model is loaded and which version, or
+    why loading it failed.
+    POST /predict scores one JSON listing object and POST /predict_batch
+    scores a JSON list of listing objects. HTTP/1.1 is used so clients can
+    keep connections alive between requests.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._send_json(404, {"error": f"unknown path {self.path}"})
+
+        if self.server.load_error is not None:
+            return self._send_json(
+                500,
+                {
+                    "status": "failed",
+                    "ready": False,
+                    "version": self.server.version,
+                    "error": self.server.load_error,
+                },
+            )
+
+        ready = self.server.ready.is_set()
+        self._send_json(
+            200 if ready else 503,
+            {
+                "status": "ok" if ready else "loading",
+                "ready": ready,
+                "version": self.server.version,
+            },
+        )
+
+    def do_POST(self):
+        # the body is always read so the connection can be kept alive
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+
+        if self.path not in ["/predict", "/predict_batch"]:
+            return self._send_json(404, {"error": f"unknown path {self.path}"})
+
+        try:
+            body = json.loads(body)
+        except ValueError:
+            return self._send_json(400, {"error": "request body must be valid JSON"})
+
+        if self.server.load_error is not None:
+            return self._send_json(
+                500, {"error": f"model failed to load: {self.server.load_error}"}
+            )
+        if not self.server.ready.is_set():
+            return self._send_json(503, {"error": "model is still loading"})
+
+        if self.path == "/predict":
+            self._predict(body)
+        else:
+            self._predict_batch(body)
+
+    def _predict(self, listing):
+        if not isinstance(listing, dict):
+            return self._send_json(400, {"error": "body must be a listing object"})
+
+        try:
+            price = predict_mercedes_price(
+                *[listing.get(col) for col in FEATURE_COLUMNS],
+                version=self.server.version,
+            )
+        except (TypeError, ValueError) as e:
+            return self._send_json(400, {"error": str(e)})
+
+        self._send_json(200, {"predicted_price_USD": price})
+
+    def _predict_batch(self, listings):
+        if isinstance(listings, dict):
+            listings = listings.get("listings")
+        if not isinstance(listings, list) or not all(
+            isinstance(listing, dict) for listing in listings
+        ):
+            return self._send_json(
+                400, {"error": "body must be a list of listing objects"}
+            )
+
+        # object columns keep every value's own type, so the rows are held to
+        # the same rules as /predict, e.g. a year of 2015.0 is rejected
+        features = pd.DataFrame(
+            {
+                col: pd.Series([listing.get(col) for listing in listings], dtype=object)
+                for col in FEATURE_COLUMNS
+            }
+        )
+        rejected = validate_mercedes_listings(features)
+        valid = ~features.index.isin(rejected.index)
+
+        prices = np.full(len(features), np.nan)
+        if valid.any():
+            price_model = load_mercedes_price_model(self.server.version)
+            prices[valid] = price_model.predict(features.loc[valid].infer_objects())
+        prices = np.round(prices, 2)
+
+        self._send_json(
+            200,
+            {
+                "predicted_price_USD": [
+                    None if np.isnan(price) else float(price) for price in prices
+                ],
+                "rejected": {str(row): reason for row, reason in rejected.items()},
+            },
+        )
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(host="127.0.0.1", port=8000, version="v1", verbose=False):
+    """Makes a local HTTP server that serves price predictions.
+
+    The model is loaded into the in-process `model_cache` on a background
+    thread, /health reports ready once it is loaded. If loading fails the
+    error is kept in `load_error` and reported by /health and the predict
+    endpoints. Call `serve_forever()` on the returned server to start
+    handling requests.
+
+    Parameters
+    ----------
+    host : str, optional
+        Address to listen on, by default "127.0.0.1".
+    port : int, optional
+        Port to listen on, by default 8000. 0 picks a free port.
+    version : str, optional
+        Model version to serve, by default "v1".
+    verbose : bool, optional
+        Whether to log every request, by default False.
+
+    Returns
+    -------
+    http.server.ThreadingHTTPServer
+        The server, with `version`, a `ready` threading.Event, the `loader`
+        thread and the `load_error` message attached.
+
+    Examples
+    --------
+    >>> from mercedestrenz.serve import make_server
+    >>> server = make_server(port=8000)
+    >>> server.serve_forever()
+    """
+
+    server = ThreadingHTTPServer((host, port), MercedesPriceRequestHandler)
+    server.daemon_threads = True
+    server.version = version
+    server.verbose = verbose
+    server.ready = threading.Event()
+    server.load_error = None
+
+    def load_model():
+        try:
+            model_cache.warmup([version])
+        except Exception as e:
+            server.load_error = f"{type(e).__name__}: {e}"
+        else:
+            server.ready.set()
+
+    server.loader = threading.Thread(target=load_model, daemon=True)
+    server.loader.start()
+
+    return server
+
+
+def main(argv=None):
+    """Command line entry point of mercedestrenz-serve."""
+
+    parser = argparse.ArgumentParser(
+        prog="mercedestrenz-serve",
+        description="Serve Mercedes-Benz price predictions over HTTP.",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="default 127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000, help="default 8000")
+    parser.add_argument("--version", default="v1", help="model version, default v1")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    server = make_server(args.host, args.port, args.version, args.verbose)
+
+    # fail fast instead of serving a model that can never load
+    server.loader.join()
+    if server.load_error is not None:
+        server.server_close()
+        print(
+            f"Could not load model {args.version}: {server.load_error}", file=sys.stderr
+        )
+        return 1
+
+    print(f"Serving model {args.version} on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,15 +1,50 @@
 # Author: Ty Andrews
 # Date: 2023-01-12
 import pandas as pd
+import numpy as np
 from importlib import resources
+import json
+import os
+import shutil
+import tempfile
+import time
+import warnings
 import joblib
+from joblib import Parallel, delayed, effective_n_jobs
 
-from sklearn.model_selection import cross_validate
+from sklearn.base import clone, is_classifier
+from sklearn.exceptions import FitFailedWarning
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import ParameterSampler, check_cv, cross_validate
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline, make_pipeline
 from sklearn.preprocessing import StandardScaler, OneHotEncoder, OrdinalEncoder
-from sklearn.ensemble import GradientBoostingRegressor
-from sklearn.model_selection import RandomizedSearchCV
+from sklearn.ensemble import GradientBoostingRegressor, HistGradientBoostingRegressor
+from sklearn.model_selection import KFold, RandomizedSearchCV
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import HalvingRandomSearchCV
+
+from mercedestrenz.compiled import export_compiled_mercedes_price_model
+from mercedestrenz.compiled import remove_compiled_mercedes_price_model
+from mercedestrenz.predict import load_mercedes_price_model
+
+# ordinal levels of the condition feature, from worst to best
+CONDITION_CATEGORIES = [
+    "salvage",
+    "used",
+    "fair",
+    "good",
+    "excellent",
+    "like new",
+    "new",
+]
+
+# the hyperparameter of each model type that successive halving can use as its
+# resource when halving_resource="n_estimators"
+BOOSTING_ROUNDS_PARAMS = {
+    "gradient_boosting": "gradientboostingregressor__n_estimators",
+    "hist_gradient_boosting": "histgradientboostingregressor__max_iter",
+}
 
 
 def train_mercedes_price_prediction_model(
@@ -20,6 +55,11 @@ def train_mercedes_price_prediction_model(
     cv_results={},
     save_model: bool = False,
     overwrite_version: bool = False,
+    search_strategy: str = "random",
+    halving_resource: str = "n_samples",
+    cache_preprocessing: bool = False,
+    cache_dir: str = None,
+    checkpoint_path: str = None,
 ):
     """Trains a model to predict the price of a Mercedes-Benz given the year,
 
@@ -30,7 +70,8 @@ def train_mercedes_price_prediction_model(
     model_version : str
         The version of the model to train and subsequently save.
     model_type : str, optional
-        The type of model to use to train on the data, by default "gradient_boosting"
+        The type of model to use to train on the data, "gradient_boosting" or
+        "hist_gradient_boosting", by default "gradient_boosting"
     n_iter : int, optional
         How many iterations of randomized search to do during tuning, by default 25
     cv_results : dict, optional
@@ -39,6 +80,33 @@ def train_mercedes_price_prediction_model(
         Whether to save a version of the model, by default False
     overwrite_version : bool, optional
         If a version of that name already exists use this to overwrite it, by default False
+    search_strategy : str, optional
+        How to tune the hyperparameters, "random" to cross validate every
+        candidate on all the data or "halving" to use successive halving, which
+        evaluates all candidates on a small resource and only the best ones on
+        more, by default "random"
+    halving_resource : str, optional
+        The resource successive halving increases, "n_samples" for the number of
+        training rows or "n_estimators" for the number of boosting rounds, by
+        default "n_samples"
+    cache_preprocessing : bool, optional
+        Whether to cache the fitted column transformer of each fold so that
+        search candidates sharing the same training rows only refit the
+        regressor. Looking up the cache hashes the training rows, which takes
+        longer than refitting the current column transformers, so it only
+        pays off with more expensive preprocessing, by default False
+    cache_dir : str, optional
+        Where to cache the fitted column transformers, which is kept after
+        training so later runs on the same data can reuse it. By default None,
+        which caches to a temporary directory that is removed after training.
+        Point it at a memory backed file system such as "/dev/shm" to keep the
+        cache in memory.
+    checkpoint_path : str, optional
+        A file to save the fold scores of each finished candidate of the
+        random search to. Rerunning with the same data, model type and
+        n_iter skips the candidates already in the file and gives the same
+        scores and best model as an uninterrupted run. By default None, which
+        does not checkpoint the search.
 
     Returns
     -------
@@ -48,7 +116,9 @@ def train_mercedes_price_prediction_model(
     Raises
     ------
     ValueError
-        If the data does not contain the required columns.
+        If the data does not contain the required columns, search_strategy
+        or halving_resource is not recognized, or checkpoint_path is given
+        with a search_strategy other than "random".
 
     Examples
     --------
@@ -56,6 +126,258 @@ def train_mercedes_price_prediction_model(
     >>> model, results = train_mercedes_price_prediction_model(data, "v2", save_model=False)
     """
 
+    # checked before anything is set up, e.g. the preprocessing cache directory
+    if search_strategy not in ["random", "halving"]:
+        raise ValueError(f"search_strategy {search_strategy} not recognized")
+    if halving_resource not in ["n_samples", "n_estimators"]:
+        raise ValueError(f"halving_resource {halving_resource} not recognized")
+    if checkpoint_path is not None and search_strategy != "random":
+        raise ValueError(
+            'checkpoint_path is only supported by search_strategy="random"'
+        )
+
+    train_data = get_train_data(data)
+
+    # put the primary metric first for what the model is refit to with all the data
+    # at the end of randomized search
+    scoring_metrics = ["neg_root_mean_squared_error", "r2"]
+
+    numeric_features = ["year", "odometer_mi"]
+    ordinal_features = ["condition"]
+    categorical_features = ["model", "paint_color"]
+
+    target = "price_USD"
+
+    X_train = train_data.drop(columns=[target])
+    y_train = train_data[target]
+
+    if model_type == "hist_gradient_boosting":
+        columntransformer = make_native_categorical_column_transformer(
+            numeric_features, ordinal_features, categorical_features
+        )
+    else:
+        columntransformer = make_column_transformer(
+            numeric_features, ordinal_features, categorical_features
+        )
+
+    model = make_model(
+        model_type,
+        categorical_features=list(
+            range(len(categorical_features) + len(ordinal_features))
+        ),
+    )
+
+    param_grid = get_random_search_param_grid(model_type)
+
+    memory = None
+    if cache_preprocessing is True:
+        memory = cache_dir if cache_dir is not None else tempfile.mkdtemp()
+
+    pipe = make_pipeline(columntransformer, model, memory=memory)
+
+    if search_strategy == "random" and checkpoint_path is not None:
+        model_search = CheckpointedRandomSearchCV(
+            pipe,
+            param_distributions=param_grid,
+            checkpoint_path=checkpoint_path,
+            scoring=scoring_metrics,
+            n_jobs=-1,
+            n_iter=n_iter,
+            cv=5,
+            random_state=42,
+        )
+
+    elif search_strategy == "random":
+        model_search = RandomizedSearchCV(
+            pipe,
+            param_distributions=param_grid,
+            scoring=scoring_metrics,
+            refit=scoring_metrics[0],
+            n_jobs=-1,
+            n_iter=n_iter,
+            cv=5,
+            return_train_score=True,
+            random_state=42,
+            verbose=2,
+        )
+
+    elif search_strategy == "halving":
+        if halving_resource == "n_samples":
+            resource, max_resources = "n_samples", "auto"
+        elif halving_resource == "n_estimators":
+            # successive halving picks the number of boosting rounds itself
+            resource = BOOSTING_ROUNDS_PARAMS[model_type]
+            max_resources = max(param_grid.pop(resource))
+
+        # successive halving only supports a single metric, it ranks on the primary one
+        model_search = HalvingRandomSearchCV(
+            pipe,
+            param_distributions=param_grid,
+            n_candidates=n_iter,
+            resource=resource,
+            max_resources=max_resources,
+            min_resources="exhaust",
+            scoring=scoring_metrics[0],
+            refit=True,
+            n_jobs=-1,
+            cv=5,
+            return_train_score=True,
+            random_state=42,
+            verbose=2,
+        )
+
+    try:
+        model_search.fit(X_train, y_train)
+    finally:
+        if memory is not None and cache_dir is None:
+            shutil.rmtree(memory, ignore_errors=True)
+
+    # the saved model should not point at the cache
+    best_model = model_search.best_estimator_.set_params(memory=None)
+
+    primary_metric = scoring_metrics[0] if search_strategy == "random" else "score"
+    print(f"Best model: {model_search.best_params_}")
+    print(
+        f"Best model train {scoring_metrics[0]}: {model_search.cv_results_[f'mean_train_{primary_metric}'][model_search.best_index_]:.1f}"
+    )
+    print(
+        f"Best model test {scoring_metrics[0]}: {model_search.cv_results_[f'mean_test_{primary_metric}'][model_search.best_index_]:.2}f"
+    )
+
+    model_cv = get_best_candidate_cv_scores(
+        model_search, scoring_metrics, X_train, y_train
+    )
+    if model_cv is None:
+        model_cv = cross_validate(
+            best_model,
+            X_train,
+            y_train,
+            cv=5,
+            scoring=scoring_metrics,
+            return_train_score=True,
+        )
+        model_cv = pd.DataFrame(model_cv).agg(["mean", "std"]).T
+
+    cv_results[model_type] = model_cv.round(3)
+
+    if save_model is True:
+        export_mercedes_price_model(best_model, model_version, overwrite_version)
+
+    return best_model, cv_results
+
+
+def retrain_mercedes_price_prediction_model(
+    data: pd.DataFrame,
+    base_version: str,
+    model_version: str,
+    n_new_estimators: int = 50,
+    save_model: bool = False,
+    overwrite_version: bool = False,
+):
+    """Retrains an existing model version by adding boosting stages on new data
+
+    The fitted column transformer of the base version is kept as is, so the
+    encoded features line up with the existing trees, and the regressor is
+    warm started to fit `n_new_estimators` more boosting stages to the
+    residuals of the existing ones on `data`. Categories the base version
+    has not seen are encoded like unknown categories at prediction time. The
+    base version itself is not modified.
+
+    A "hist_gradient_boosting" version cannot be warm started on new data,
+    because it bins the features anew on every fit. It is refit from scratch
+    on `data` with the hyperparameters of the base version instead, which is
+    fast for this model type, and `n_new_estimators` is not used.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The used mercedes data to continue training on, usually the full
+        history including the new listings. Must contain columns for model,
+        year, condition, odometer_mi, paint_color, and price_USD.
+    base_version : str
+        The version of the model to continue training.
+    model_version : str
+        The version to save the retrained model as.
+    n_new_estimators : int, optional
+        How many boosting stages to add to a "gradient_boosting" version, by
+        default 50
+    save_model : bool, optional
+        Whether to save the retrained model, by default False
+    overwrite_version : bool, optional
+        If a version of that name already exists use this to overwrite it, by default False
+
+    Returns
+    -------
+    Pipeline
+        The retrained model pipeline.
+
+    Raises
+    ------
+    ValueError
+        If the data does not contain the required columns, n_new_estimators
+        is not positive or the base version is not a boosting model.
+    FileNotFoundError
+        If the base version is not found.
+
+    Examples
+    --------
+    >>> from mercedestrenz.train import retrain_mercedes_price_prediction_model
+    >>> model = retrain_mercedes_price_prediction_model(data, "v1", "v2", save_model=True)
+    """
+
+    if n_new_estimators < 1:
+        raise ValueError("n_new_estimators must be a positive integer")
+
+    train_data = get_train_data(data)
+    X_train = train_data.drop(columns=["price_USD"])
+    y_train = train_data["price_USD"]
+
+    # the cached model is shared with the predict functions, load a private copy
+    model_pipeline = load_mercedes_price_model(base_version, use_cache=False)
+    columntransformer, model = model_pipeline[:-1], model_pipeline[-1]
+
+    if isinstance(model, GradientBoostingRegressor):
+        model.set_params(
+            warm_start=True, n_estimators=model.n_estimators_ + n_new_estimators
+        )
+        model.fit(columntransformer.transform(X_train), y_train)
+        model.set_params(warm_start=False)
+
+    elif isinstance(model, HistGradientBoostingRegressor):
+        # the feature bins are rebuilt from the data on every fit, so the existing
+        # trees would be continued on bins they were not grown on
+        model_pipeline = clone(model_pipeline).fit(X_train, y_train)
+
+    else:
+        raise ValueError(
+            f"Model version {base_version} is a {type(model).__name__}, only boosting models can be retrained"
+        )
+
+    if save_model is True:
+        export_mercedes_price_model(model_pipeline, model_version, overwrite_version)
+
+    return model_pipeline
+
+
+def get_train_data(data: pd.DataFrame):
+    """Gets the training columns of the used mercedes data without missing values
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The raw used mercedes data. Must contain columns for model, year, condition, odometer_mi, paint_color, and price_USD.
+
+    Returns
+    -------
+    pd.DataFrame
+        The training columns with rows with any missing value dropped.
+
+    Raises
+    ------
+    ValueError
+        If the data does not contain the required columns.
+    """
+
     if (
         set(
             ["model", "year", "condition", "odometer_mi", "paint_color", "price_USD"]
@@ -81,78 +403,385 @@ def train_mercedes_price_prediction_model(
             f"Removed {num_samples_before - num_samples_after} rows. {len(train_data)} rows remaining."
         )
 
-    # put the primary metric first for what the model is refit to with all the data
-    # at the end of randomized search
-    scoring_metrics = ["neg_root_mean_squared_error", "r2"]
+    return train_data
 
-    numeric_features = ["year", "odometer_mi"]
-    ordinal_features = ["condition"]
-    categorical_features = ["model", "paint_color"]
 
-    target = "price_USD"
+def get_best_candidate_cv_scores(search, scoring_metrics, X_train, y_train):
+    """Gets the cross validation scores of the best candidate of a finished search
 
-    X_train = train_data.drop(columns=[target])
-    y_train = train_data[target]
+    The scores are summarized like `cross_validate` results aggregated by mean
+    and standard deviation, so the best model does not have to be cross
+    validated again. A search scored on "neg_root_mean_squared_error" alone,
+    like successive halving, also gives the "r2" of each fold from its mean
+    squared error and the variance of the target in that fold.
 
-    columntransformer = make_column_transformer(
-        numeric_features, ordinal_features, categorical_features
-    )
+    Parameters
+    ----------
+    search : RandomizedSearchCV or HalvingRandomSearchCV
+        A search fit with `cv=5` and `return_train_score=True`
+    scoring_metrics : list
+        The metrics to get the scores of
+    X_train : pd.DataFrame
+        The features the search was fit on
+    y_train : pd.Series
+        The target the search was fit on
 
-    model = make_model(model_type)
+    Returns
+    -------
+    pd.DataFrame or None
+        The mean and standard deviation of the fit and score times and of the
+        train and test scores, or None if the best candidate was not scored on
+        all the rows or the metrics are not available
+    """
 
-    param_grid = get_random_search_param_grid(model_type)
+    results = search.cv_results_
+    best = search.best_index_
+    n_splits = search.n_splits_
+
+    # successive halving scores candidates on a subsample of the rows
+    if isinstance(search, HalvingRandomSearchCV) and search.resource == "n_samples":
+        if results["n_resources"][best] < len(X_train):
+            return None
+
+    # only the mean and population standard deviation of the fold times are
+    # kept, rescale it to the sample standard deviation pandas gives
+    scale = np.sqrt(n_splits / (n_splits - 1))
+    model_cv = {
+        time: [results[f"mean_{time}"][best], results[f"std_{time}"][best] * scale]
+        for time in ["fit_time", "score_time"]
+    }
+
+    multimetric = isinstance(search.scoring, (list, tuple, dict))
+    for metric in scoring_metrics:
+        for split in ["test", "train"]:
+            key = f"{split}_{metric if multimetric else 'score'}"
+            if multimetric or metric == search.scoring:
+                scores = [results[f"split{i}_{key}"][best] for i in range(n_splits)]
+            elif metric == "r2" and search.scoring == "neg_root_mean_squared_error":
+                scores = [
+                    1 - results[f"split{i}_{key}"][best] ** 2 / np.var(y)
+                    for i, y in enumerate(
+                        _fold_targets(y_train, n_splits, split == "test")
+                    )
+                ]
+            else:
+                return None
+            model_cv[f"{split}_{metric}"] = pd.Series(scores).agg(["mean", "std"])
+
+    return pd.DataFrame(model_cv, index=["mean", "std"]).T
+
+
+def _fold_targets(y_train, n_splits, test):
+    """Yields the target of the test or train rows of each unshuffled fold"""
+
+    for train_index, test_index in KFold(n_splits).split(y_train):
+        yield y_train.iloc[test_index if test else train_index]
+
+
+class CheckpointedRandomSearchCV:
+    """Randomized search that checkpoints the fold scores of each candidate
+
+    Draws the same candidates as `RandomizedSearchCV` with the same
+    `random_state` and cross validates them in batches, appending the fold
+    scores of each finished candidate as a line of JSON to `checkpoint_path`.
+    The folds of every candidate in a batch are fit in parallel, and a batch
+    holds just enough candidates to give each job a fit, so an interrupted
+    search loses at most one batch of work. Workers left idle at the end of
+    a batch are the cost of checkpointing compared to `RandomizedSearchCV`,
+    which fits every candidate and fold in one parallel run.
+    Every line is tagged with a fingerprint of the data, the estimator, the
+    parameter distributions and the search settings, and fitting again with
+    the same fingerprint skips the candidates already in the file. After
+    fitting it has the `cv_results_`, `best_index_`, `best_params_`,
+    `best_score_`, `best_estimator_` and `n_splits_` attributes of a
+    multi-metric `RandomizedSearchCV` refit on the first metric.
 
-    pipe = make_pipeline(columntransformer, model)
+    Parameters
+    ----------
+    estimator : Pipeline
+        The model pipeline to tune
+    param_distributions : dict
+        Lists of the values to sample for each parameter
+    checkpoint_path : str
+        The JSON lines file to save the fold scores to
+    scoring : list
+        The metrics to score each fold on, the best candidate has the best
+        mean test score of the first one
+    n_iter : int, optional
+        How many candidates to sample, by default 10
+    cv : int, optional
+        The number of unshuffled folds, by default 5
+    n_jobs : int, optional
+        How many folds to fit in parallel, by default None
+    random_state : int, optional
+        Seed of the candidate sampling, by default None
+    """
 
-    model_random_search = RandomizedSearchCV(
-        pipe,
-        param_distributions=param_grid,
-        scoring=scoring_metrics,
-        refit=scoring_metrics[0],
-        n_jobs=-1,
-        n_iter=n_iter,
+    def __init__(
+        self,
+        estimator,
+        param_distributions,
+        checkpoint_path,
+        scoring,
+        n_iter=10,
         cv=5,
-        return_train_score=True,
-        random_state=42,
-        verbose=2,
-    )
+        n_jobs=None,
+        random_state=None,
+    ):
+        self.estimator = estimator
+        self.param_distributions = param_distributions
+        self.checkpoint_path = checkpoint_path
+        self.scoring = scoring
+        self.n_iter = n_iter
+        self.cv = cv
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        """Cross validates the candidates not in the checkpoint and refits the best
+
+        Parameters
+        ----------
+        X : pd.DataFrame
+            The features to tune on
+        y : pd.Series
+            The target to tune on
+
+        Returns
+        -------
+        CheckpointedRandomSearchCV
+            The fitted search
+        """
+
+        candidates = list(
+            ParameterSampler(
+                self.param_distributions, self.n_iter, random_state=self.random_state
+            )
+        )
+        fingerprint = self._fingerprint(X, y)
+        scores = self._read_checkpoint(fingerprint, candidates)
+        print(
+            f"Loaded {len(scores)} of {len(candidates)} candidates from {self.checkpoint_path}"
+        )
 
-    model_random_search.fit(X_train, y_train)
+        splits = list(
+            check_cv(self.cv, y, classifier=is_classifier(self.estimator)).split(X, y)
+        )
+        pending = [index for index in range(len(candidates)) if index not in scores]
+        batch_size = -(-effective_n_jobs(self.n_jobs) // len(splits))
+
+        with Parallel(n_jobs=self.n_jobs) as parallel:
+            for start in range(0, len(pending), batch_size):
+                batch = pending[start : start + batch_size]
+                fold_scores = parallel(
+                    delayed(_fit_and_score_fold)(
+                        clone(self.estimator).set_params(**candidates[index]),
+                        X,
+                        y,
+                        train,
+                        test,
+                        self.scoring,
+                    )
+                    for index in batch
+                    for train, test in splits
+                )
+
+                for position, index in enumerate(batch):
+                    folds, errors = zip(
+                        *fold_scores[
+                            position * len(splits) : (position + 1) * len(splits)
+                        ]
+                    )
+                    for error in filter(None, errors):
+                        warnings.warn(
+                            f"Fitting candidate {candidates[index]} failed, "
+                            f"its fold scores are NaN: {error}",
+                            FitFailedWarning,
+                        )
+                    scores[index] = {
+                        key: [fold[key] for fold in folds] for key in folds[0]
+                    }
+                    self._write_checkpoint(
+                        fingerprint, index, candidates[index], scores[index]
+                    )
+                    print(
+                        f"Finished candidate {index + 1}/{len(candidates)}: "
+                        f"{candidates[index]}"
+                    )
+
+        self.n_splits_ = len(splits)
+        self.cv_results_ = self._make_cv_results(candidates, scores)
+        self.best_index_ = int(
+            self.cv_results_[f"rank_test_{self.scoring[0]}"].argmin()
+        )
+        self.best_params_ = candidates[self.best_index_]
+        self.best_score_ = self.cv_results_[f"mean_test_{self.scoring[0]}"][
+            self.best_index_
+        ]
+        self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_)
+        self.best_estimator_.fit(X, y)
 
-    best_model = model_random_search.best_estimator_
+        return self
 
-    model_cv = cross_validate(
-        best_model,
-        X_train,
-        y_train,
-        cv=5,
-        scoring=scoring_metrics,
-        return_train_score=True,
-    )
+    def _fingerprint(self, X, y):
+        """Returns a hash of everything the fold scores of the candidates depend on"""
 
-    print(f"Best model: {model_random_search.best_params_}")
-    print(
-        f"Best model train {scoring_metrics[0]}: {model_random_search.cv_results_[f'mean_train_{scoring_metrics[0]}'][model_random_search.best_index_]:.1f}"
-    )
-    print(
-        f"Best model test {scoring_metrics[0]}: {model_random_search.cv_results_[f'mean_test_{scoring_metrics[0]}'][model_random_search.best_index_]:.2}f"
-    )
+        estimator = clone(self.estimator)
+        # the cache location does not change the scores
+        if isinstance(estimator, Pipeline):
+            estimator.set_params(memory=None)
 
-    cv_results[model_type] = pd.DataFrame(model_cv).agg(["mean", "std"]).round(3).T
+        return joblib.hash(
+            (
+                X,
+                y,
+                estimator,
+                self.param_distributions,
+                self.n_iter,
+                self.random_state,
+                self.cv,
+                self.scoring,
+            )
+        )
 
-    if save_model is True:
-        export_mercedes_price_model(best_model, model_version, overwrite_version)
+    def _read_checkpoint(self, fingerprint, candidates):
+        """Returns the fold scores saved for this fingerprint by candidate index"""
+
+        scores = {}
+        if not os.path.exists(self.checkpoint_path):
+            return scores
+
+        with open(self.checkpoint_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line of a search stopped while writing it
+                    continue
+                if (
+                    record.get("fingerprint") == fingerprint
+                    and record["index"] < len(candidates)
+                    and record["params"] == candidates[record["index"]]
+                ):
+                    scores[record["index"]] = record["scores"]
+
+        return scores
+
+    def _write_checkpoint(self, fingerprint, index, params, scores):
+        """Appends the fold scores of a candidate and flushes them to disk"""
+
+        record = {
+            "fingerprint": fingerprint,
+            "index": index,
+            "params": params,
+            "scores": scores,
+        }
+        with open(self.checkpoint_path, "ab+") as f:
+            # start a new line after the partial line of an interrupted write
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+            f.write((json.dumps(record) + "\n").encode())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _make_cv_results(self, candidates, scores):
+        """Lays out the fold scores like the `cv_results_` of a search"""
+
+        cv_results = {"params": candidates}
+        for key in scores[0]:
+            folds = np.array([scores[index][key] for index in range(len(candidates))])
+            if not key.endswith("_time"):
+                for split in range(self.n_splits_):
+                    cv_results[f"split{split}_{key}"] = folds[:, split]
+            cv_results[f"mean_{key}"] = folds.mean(axis=1)
+            cv_results[f"std_{key}"] = folds.std(axis=1)
+
+        for metric in self.scoring:
+            cv_results[f"rank_test_{metric}"] = (
+                pd.Series(cv_results[f"mean_test_{metric}"])
+                .rank(method="min", ascending=False, na_option="bottom")
+                .to_numpy(dtype=int)
+            )
 
-    return best_model, cv_results
+        return cv_results
+
+
+def _fit_and_score_fold(estimator, X, y, train, test, scoring):
+    """Fits one fold of a candidate and scores it like `cross_validate`
+
+    Parameters
+    ----------
+    estimator : Pipeline
+        The unfitted candidate
+    X : pd.DataFrame
+        The features to tune on
+    y : pd.Series
+        The target to tune on
+    train : np.ndarray
+        The positions of the training rows of the fold
+    test : np.ndarray
+        The positions of the test rows of the fold
+    scoring : list
+        The metrics to score the fold on
+
+    Returns
+    -------
+    dict
+        The fit and score times and the test and train score of each metric,
+        NaN scores if the fit failed
+    str
+        The error of a failed fit, None if the fit succeeded
+    """
 
+    start = time.time()
+    try:
+        estimator.fit(X.iloc[train], y.iloc[train])
+    except Exception as e:
+        # returned rather than warned, warnings of worker processes are lost
+        error = repr(e)
+    else:
+        error = None
+    fit_time = time.time() - start
+
+    start = time.time()
+    test_scores = {
+        metric: (
+            np.nan
+            if error
+            else float(get_scorer(metric)(estimator, X.iloc[test], y.iloc[test]))
+        )
+        for metric in scoring
+    }
+    score_time = time.time() - start
+    train_scores = {
+        metric: (
+            np.nan
+            if error
+            else float(get_scorer(metric)(estimator, X.iloc[train], y.iloc[train]))
+        )
+        for metric in scoring
+    }
+
+    fold_scores = {"fit_time": fit_time, "score_time": score_time}
+    for metric in scoring:
+        fold_scores[f"test_{metric}"] = test_scores[metric]
+        fold_scores[f"train_{metric}"] = train_scores[metric]
 
-def make_model(model_type: str):
+    return fold_scores, error
+
+
+def make_model(model_type: str, categorical_features=None):
     """Makes a model for the mercedes price prediction model
 
     Parameters
     ----------
     model_type : str
-        What type of model to use
+        What type of model to use, "gradient_boosting" or "hist_gradient_boosting"
+    categorical_features : list, optional
+        Positions of the categorical columns in the preprocessed data, only
+        used by "hist_gradient_boosting", by default None
 
     Returns
     -------
@@ -164,6 +793,14 @@ def make_model(model_type: str):
 
         model = GradientBoostingRegressor(loss="squared_error", random_state=42)
 
+    elif model_type == "hist_gradient_boosting":
+
+        model = HistGradientBoostingRegressor(
+            loss="squared_error",
+            categorical_features=categorical_features,
+            random_state=42,
+        )
+
     else:
         raise ValueError(f"model_type {model_type} not recognized")
 
@@ -195,6 +832,16 @@ def get_random_search_param_grid(model_type: str):
             "gradientboostingregressor__subsample": [0.5, 0.6, 0.8],
         }
 
+    elif model_type == "hist_gradient_boosting":
+
+        param_grid = {
+            "histgradientboostingregressor__learning_rate": [0.05, 0.1, 0.2],
+            "histgradientboostingregressor__max_iter": [100, 200, 300],
+            "histgradientboostingregressor__max_leaf_nodes": [15, 31, 63],
+            "histgradientboostingregressor__min_samples_leaf": [10, 20, 40],
+            "histgradientboostingregressor__l2_regularization": [0.0, 0.1, 1.0],
+        }
+
     else:
         raise ValueError(f"model_type {model_type} not recognized")
 
@@ -233,28 +880,67 @@ def make_column_transformer(numeric_features, ordinal_features, categorical_feat
             ),
             (
                 "ordinal",
+                OrdinalEncoder(categories=[CONDITION_CATEGORIES]),
+                ordinal_features,
+            ),
+        ]
+    )
+
+    return columntransformer
+
+
+def make_native_categorical_column_transformer(
+    numeric_features, ordinal_features, categorical_features
+):
+    """Makes a column transformer for models with native categorical support
+
+    The categorical and ordinal features are encoded as integer codes in the
+    first columns of the output, followed by the unscaled numeric features.
+    Unknown categories are encoded as missing values.
+
+    Parameters
+    ----------
+    numeric_features : list
+        List of numeric features to include in the model
+    ordinal_features : list
+        List of ordinal features to include in the model
+    categorical_features : list
+        List of categorical features to include in the model
+
+    Returns
+    -------
+    ColumnTransformer
+        A column transformer for the mercedes price prediction model
+    """
+
+    columntransformer = ColumnTransformer(
+        [
+            (
+                "categorical",
                 OrdinalEncoder(
-                    categories=[
-                        [
-                            "salvage",
-                            "used",
-                            "fair",
-                            "good",
-                            "excellent",
-                            "like new",
-                            "new",
-                        ]
-                    ]
+                    handle_unknown="use_encoded_value", unknown_value=np.nan
+                ),
+                categorical_features,
+            ),
+            (
+                "ordinal",
+                OrdinalEncoder(
+                    categories=[CONDITION_CATEGORIES] * len(ordinal_features),
+                    handle_unknown="use_encoded_value",
+                    unknown_value=np.nan,
                 ),
                 ordinal_features,
             ),
+            ("numeric", "passthrough", numeric_features),
         ]
     )
 
     return columntransformer
 
 
-def export_mercedes_price_model(model_pipeline, version="v1", overwrite=False):
+def export_mercedes_price_model(
+    model_pipeline, version="v1", overwrite=False, mmap=False
+):
     """Exports the sklearn model pipeline for mercedes price prediction
 
     Parameters
@@ -263,6 +949,12 @@ def export_mercedes_price_model(model_pipeline, version="v1", overwrite=False):
         sklearn pipeline with the model and preprocessing steps
     version : str, optional
         What to tag the model version by. By default "v1"
+    overwrite : bool, optional
+        Whether to overwrite an existing version, by default False
+    mmap : bool, optional
+        Whether to also save the compiled model arrays so the model can be
+        loaded with `mmap_mode`, by default False. Otherwise the compiled
+        arrays of an earlier export of the version are removed.
     """
 
     model_name = f"mercedes_price_prediction_{version}.joblib"
@@ -273,3 +965,9 @@ def export_mercedes_price_model(model_pipeline, version="v1", overwrite=False):
             )
         joblib.dump(model_pipeline, d)
         print("Model saved to: ", d)
+
+    if mmap is True:
+        export_compiled_mercedes_price_model(model_pipeline, version)
+    else:
+        # a compiled model of an earlier export of this version is stale now
+        remove_compiled_mercedes_price_model(version)
@@ -2,10 +2,18 @@
 # Date: 2023-01-17
 
 # from data import listing_search
+from collections import OrderedDict
+import threading
+import weakref
 import pandas as pd
 import altair as alt
 import numpy as np
 
+# number of market dataframes whose sorted prices are kept
+_SORTED_PRICES_CACHE_SIZE = 8
+_sorted_prices_cache = OrderedDict()
+_sorted_prices_lock = threading.Lock()
+
 def plot_mercedes_price(model, price, market_df, model_col = 'model', price_col = 'price_USD'):
     """
     Plot a density plot of a specific Mercedes-Benz model to see where 
@@ -101,4 +109,113 @@ def plot_mercedes_price(model, price, market_df, model_col = 'model', price_col
     # Combine the density plot and line
     final_plot = density_plot + line
     
-    return final_plot
\ No newline at end of file
+    return final_plot
+
+
+def price_percentile_rank(models, prices, market_df, model_col = 'model', price_col = 'price_USD', kind = 'weak'):
+    """
+    Calculate the percentile rank of many prices within the market prices of their model.
+
+    The market prices of each model are sorted once and every query is a binary search,
+    so whole inventories can be ranked at once. The sorted prices are cached for the last
+    few market dataframes, the market dataframe should not be modified between calls.
+
+    Parameters
+    ----------
+    models : str or array-like of str
+        The model of each vehicle.
+    prices : float or array-like of float
+        The price of each vehicle.
+    market_df : pandas.DataFrame
+        Dataframe containing information on used Mercedes-Benz in the market.
+    model_col : str
+        The name of the column of model. (By default 'model')
+    price_col : str
+        The name of the column of price. (By default 'price_USD')
+    kind : str
+        'weak' counts the market prices at or below the price, 'strict' the prices below it 
+        and 'mean' averages the two. (By default 'weak')
+
+    Returns
+    -------
+    numpy.ndarray
+        The percentage of the market listings of the same model priced at or below each price,
+        NaN when the model is not in the market or the price is missing.
+
+    Examples
+    --------
+    >>> from mercedestrenz.visualizations import price_percentile_rank
+    >>> price_percentile_rank('s-class', 80000, market_df)
+    >>> market_df['price_percentile'] = price_percentile_rank(market_df['model'], market_df['price_USD'], market_df)
+    """
+
+    # Test if inputs have correct type
+    if not isinstance(market_df, pd.DataFrame):
+        raise Exception('The third input should be a pd.DataFrame')
+    if price_col not in market_df.columns:
+        raise Exception("Please insert the name of the price column (e.g. price_percentile_rank('glc',10,df,price_col='price_CAD')")
+    if model_col not in market_df.columns:
+        raise Exception("Please insert the name of the model column")
+    if kind not in ['weak', 'strict', 'mean']:
+        raise Exception("The kind should be one of 'weak', 'strict' or 'mean'")
+
+    models, prices = np.broadcast_arrays(np.asarray(models, dtype = object), np.asarray(prices, dtype = float))
+    if models.ndim > 1:
+        raise Exception('The models and prices should be single values or one dimensional arrays')
+    scalar = models.ndim == 0
+    models, prices = np.atleast_1d(models), np.atleast_1d(prices)
+
+    market_models, sorted_prices, bounds = _get_sorted_market_prices(market_df, model_col, price_col)
+
+    # rank the prices of each model against that model's sorted market prices
+    codes = market_models.get_indexer(models)
+    ranks = np.full(len(prices), np.nan)
+    for code in np.unique(codes[codes >= 0]):
+        queries = np.flatnonzero(codes == code)
+        group = sorted_prices[bounds[code]:bounds[code + 1]]
+        # models whose market prices are all missing are not ranked
+        if len(group) == 0:
+            continue
+        if kind == 'weak':
+            count = np.searchsorted(group, prices[queries], side = 'right')
+        elif kind == 'strict':
+            count = np.searchsorted(group, prices[queries], side = 'left')
+        else:
+            count = (np.searchsorted(group, prices[queries], side = 'right') + np.searchsorted(group, prices[queries], side = 'left')) / 2
+        ranks[queries] = 100 * count / len(group)
+
+    ranks[np.isnan(prices)] = np.nan
+
+    return ranks[0] if scalar else ranks
+
+
+def _get_sorted_market_prices(market_df, model_col, price_col):
+    """
+    Return the models of a market, its prices sorted by model then price, and where each model starts.
+    """
+    key = (id(market_df), model_col, price_col)
+    with _sorted_prices_lock:
+        if key in _sorted_prices_cache:
+            market_ref, sorted_market = _sorted_prices_cache[key]
+            # the id of a deleted dataframe can be reused by a new one
+            if market_ref() is market_df:
+                _sorted_prices_cache.move_to_end(key)
+                return sorted_market
+
+    codes, market_models = pd.factorize(market_df[model_col])
+    market_prices = market_df[price_col].to_numpy(dtype = float)
+    keep = (codes >= 0) & ~np.isnan(market_prices)
+    codes, market_prices = codes[keep], market_prices[keep]
+
+    order = np.lexsort((market_prices, codes))
+    bounds = np.searchsorted(codes[order], np.arange(len(market_models) + 1))
+    sorted_market = (pd.Index(market_models), market_prices[order], bounds)
+
+    with _sorted_prices_lock:
+        _sorted_prices_cache[key] = (weakref.ref(market_df), sorted_market)
+        _sorted_prices_cache.move_to_end(key)
+        while len(_sorted_prices_cache) > _SORTED_PRICES_CACHE_SIZE:
+            _sorted_prices_cache.popitem(last = False)
+
+    return sorted_market
+
@@ -0,0 +1,76 @@
+from mercedestrenz.async_predict import AsyncMercedesPricePredictor
+from mercedestrenz.predict import predict_mercedes_price
+import asyncio
+import pytest
+
+LISTINGS = [
+    ("e-class", 2015, 55_000, "fair", "silver"),
+    ("c-class", 2012, 90_000, "good", "black"),
+    ("s-class", 2019, 12_000, "like new", "white"),
+    ("sprinter", 2008, 210_000, "salvage", "unknown"),
+    ("gl-class", 2011, 130_000, "excellent", "grey"),
+]
+
+
+# test that concurrent calls are grouped into batches and get their own price
+def test_async_predictor_batches():
+    async def run():
+        async with AsyncMercedesPricePredictor(
+            max_batch_size=2, max_wait=1
+        ) as predictor:
+            prices = await asyncio.gather(
+                *[predictor.predict(*row) for row in LISTINGS]
+            )
+        return predictor, prices
+
+    predictor, prices = asyncio.run(run())
+
+    assert prices == [predict_mercedes_price(*row) for row in LISTINGS]
+    assert predictor.n_batches == 3
+    assert predictor.n_predictions == 5
+
+
+# test that a batch that is not full is scored after max_wait
+def test_async_predictor_max_wait():
+    async def run():
+        predictor = AsyncMercedesPricePredictor(max_batch_size=100, max_wait=0.01)
+        price = await asyncio.wait_for(predictor.predict(*LISTINGS[0]), timeout=10)
+        await predictor.close()
+        return predictor, price
+
+    predictor, price = asyncio.run(run())
+
+    assert price == predict_mercedes_price(*LISTINGS[0])
+    assert predictor.n_batches == 1
+
+
+# test that invalid inputs raise in the caller without being queued
+def test_async_predictor_invalid_input():
+    async def run():
+        predictor = AsyncMercedesPricePredictor()
+        with pytest.raises(ValueError):
+            await predictor.predict("e-class", 2015, 55_000, "slightly old", "silver")
+        with pytest.raises(TypeError):
+            await predictor.predict("e-class", "2015", 55_000, "fair", "silver")
+        await predictor.close()
+        return predictor
+
+    assert asyncio.run(run()).n_batches == 0
+
+
+# test that a failing batch raises in every waiting caller
+def test_async_predictor_batch_error():
+    async def run():
+        predictor = AsyncMercedesPricePredictor(version="v999", max_batch_size=2)
+        results = await asyncio.gather(
+            *[predictor.predict(*row) for row in LISTINGS[:2]], return_exceptions=True
+        )
+        return results
+
+    assert all(isinstance(result, FileNotFoundError) for result in asyncio.run(run()))
+
+
+@pytest.mark.parametrize("kwargs", [{"max_batch_size": 0}, {"max_wait": -1}])
+def test_async_predictor_bad_arguments(kwargs):
+    with pytest.raises(ValueError):
+        AsyncMercedesPricePredictor(**kwargs)
@@ -0,0 +1,111 @@
+from mercedestrenz.compiled import compile_mercedes_price_model
+from mercedestrenz.compiled import CompiledMercedesPriceModel
+from mercedestrenz.compiled import load_compiled_mercedes_price_model
+from mercedestrenz.predict import export_mercedes_price_model
+from importlib import resources
+from mercedestrenz.predict import load_mercedes_price_model
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.ensemble import GradientBoostingRegressor
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def listings():
+    # mix of known, infrequent and unknown categories
+    rng = np.random.default_rng(0)
+    n = 500
+    return pd.DataFrame(
+        {
+            "model": rng.choice(["e-class", "c-class", "sprinter", "amg", "unseen"], n),
+            "year": rng.integers(1980, 2022, n),
+            "odometer_mi": rng.integers(0, 400_000, n),
+            "condition": rng.choice(["salvage", "fair", "good", "like new", "new"], n),
+            "paint_color": rng.choice(
+                ["black", "orange", "purple", "silver", "unknown"], n
+            ),
+        }
+    )
+
+
+# test that compiled predictions match the sklearn pipeline
+def test_compiled_matches_pipeline(listings):
+    pipeline = load_mercedes_price_model("v1")
+    compiled = compile_mercedes_price_model(pipeline)
+
+    np.testing.assert_allclose(
+        compiled.predict(listings), pipeline.predict(listings), rtol=1e-9
+    )
+    np.testing.assert_allclose(
+        compiled.predict(listings.to_dict(orient="list")),
+        pipeline.predict(listings),
+        rtol=1e-9,
+    )
+
+
+# test that a single listing dict is scored like the pipeline
+def test_compiled_predict_one(listings):
+    pipeline = load_mercedes_price_model("v1")
+    compiled = compile_mercedes_price_model(pipeline)
+
+    for listing in listings.head(20).to_dict(orient="records"):
+        assert compiled.predict_one(listing) == pytest.approx(
+            pipeline.predict(pd.DataFrame([listing]))[0], rel=1e-9
+        )
+
+
+# test that invalid inputs raise an error
+def test_compiled_invalid_input(listings):
+    compiled = compile_mercedes_price_model(load_mercedes_price_model("v1"))
+
+    with pytest.raises(ValueError):
+        compiled.predict(listings.drop(columns=["year"]))
+
+    listings.loc[0, "condition"] = "slightly old"
+    with pytest.raises(ValueError):
+        compiled.predict(listings)
+
+
+# test that pipelines with unsupported steps cannot be compiled
+def test_compile_unsupported_pipeline():
+    pipeline = make_pipeline(StandardScaler(), GradientBoostingRegressor())
+
+    with pytest.raises(ValueError):
+        compile_mercedes_price_model(pipeline)
+
+
+# test that an exported model can be loaded back memory mapped
+def test_export_and_load_mmap(listings):
+    pipeline = load_mercedes_price_model("v1")
+    export_mercedes_price_model(pipeline, "vmmaptest", mmap=True)
+
+    try:
+        compiled = load_mercedes_price_model("vmmaptest", mmap_mode="r")
+
+        assert isinstance(compiled, CompiledMercedesPriceModel)
+        assert isinstance(compiled.arrays["tree_threshold"], np.memmap)
+        np.testing.assert_allclose(
+            compiled.predict(listings), pipeline.predict(listings), rtol=1e-9
+        )
+
+        # exporting without mmap removes the now stale compiled arrays
+        export_mercedes_price_model(pipeline, "vmmaptest")
+        with pytest.raises(FileNotFoundError):
+            load_mercedes_price_model("vmmaptest", mmap_mode="r")
+        with pytest.raises(FileNotFoundError):
+            load_compiled_mercedes_price_model("vmmaptest")
+    finally:
+        with resources.path("mercedestrenz", "models") as p:
+            for path in p.glob("mercedes_price_prediction_vmmaptest.*"):
+                path.unlink()
+
+
+# test that the packaged v1 model ships with memory mappable arrays
+def test_load_mmap_v1():
+    compiled = load_mercedes_price_model("v1", mmap_mode="r", use_cache=False)
+    assert isinstance(compiled.arrays["tree_value"], np.memmap)
+
+    with pytest.raises(FileNotFoundError):
+        load_mercedes_price_model("v999", mmap_mode="r")
@@ -1,6 +1,7 @@
 # Author: Kelly Wu
 # Date: 2023-01-19
-from mercedestrenz.data import listing_search
+from mercedestrenz.data import listing_search, ListingIndex, ListingStore, listing_search_batch, listing_search_stream, find_mercedes_deals
+from mercedestrenz.predict import predict_mercedes_price
 import pandas as pd
 import numpy as np
 
@@ -104,7 +105,8 @@ def test_listing_search():
 
 # Author: Spencer Gerlach
 # Date: 2023-01-19
-from mercedestrenz.data import load_sample_mercedes_listings
+from mercedestrenz.data import load_sample_mercedes_listings, optimize_mercedes_listing_dtypes, make_synthetic_mercedes_listings, clean_raw_mercedes_listings
+from mercedestrenz.data import _listings_cache, _load_cached_listings
 
 
 def test_load_sample_mercedes_listings():
@@ -132,3 +134,386 @@ def test_load_sample_mercedes_listings():
        'state', 'VIN', 'title_status', 'description']
     actual_col_names = load_sample_mercedes_listings().columns
     assert sum(expected_col_names == actual_col_names) == 16, "Column names not imported correctly (incorrect names or sequencing)."
+
+
+def test_load_sample_mercedes_listings_cache(tmp_path):
+    """Tests that the cached and typed loads hold the same listings"""
+
+    expected = load_sample_mercedes_listings()
+
+    cached = load_sample_mercedes_listings(cache=True, cache_dir=tmp_path)
+    pd.testing.assert_frame_equal(cached, expected)
+    assert (tmp_path / 'mercedes' / 'meta.json').exists(), "Columnar cache was not written."
+
+    # callers get their own copy of the cached frame
+    cached.loc[:, 'price_USD'] = -1
+    pd.testing.assert_frame_equal(load_sample_mercedes_listings(cache=True, cache_dir=tmp_path), expected)
+
+    optimized = load_sample_mercedes_listings(optimize_dtypes=True, cache=True, cache_dir=tmp_path)
+    pd.testing.assert_frame_equal(optimized, optimize_mercedes_listing_dtypes(expected))
+    assert optimized.memory_usage(deep=True).sum() < expected.memory_usage(deep=True).sum()
+
+
+def test_load_cached_listings_exact(tmp_path):
+    """Tests that listings loaded from the columnar cache equal the parsed csv exactly"""
+
+    csv_path = tmp_path / 'listings.csv'
+    make_synthetic_mercedes_listings(50, random_state=1).assign(price_USD=12345.67).to_csv(csv_path)
+    expected = pd.read_csv(csv_path, index_col=0)
+
+    for _ in range(2):
+        # the second load reads the columnar files written by the first
+        _listings_cache.clear()
+        cached = _load_cached_listings(csv_path, False, tmp_path / 'cache')
+        pd.testing.assert_frame_equal(cached, expected, check_exact=True)
+
+
+def test_optimize_mercedes_listing_dtypes():
+    """Tests that compact dtypes keep every value"""
+
+    df = pd.DataFrame({
+        'price_USD': [50000, 20000, 80000, 90000, 40000],
+        'model': ['gls', 'glk', 'gls', 'gls', 'glk'],
+        'condition': ['good', np.nan, 'good', 'good', 'new'],
+        'odometer_mi': [12000.5, np.nan, 35000, 150000, 20000],
+        'engine_l': [2.5, 3.0, 12345.67, 5.5, 2.0],
+        'description': ['a', 'b', 'c', 'd', 'e'],
+        })
+    optimized = optimize_mercedes_listing_dtypes(df)
+
+    assert optimized['price_USD'].dtype == np.int32, "Integers were not downcast"
+    assert optimized['odometer_mi'].dtype == np.float32, "Floats were not downcast"
+    assert optimized['engine_l'].dtype == np.float64, "Floats float32 cannot hold exactly were downcast"
+    assert optimized['model'].dtype == 'category', "Repeated text was not made categorical"
+    assert optimized['condition'].dtype == 'category', "Repeated text was not made categorical"
+    assert optimized['description'].dtype == object, "Free text should stay as objects"
+    pd.testing.assert_frame_equal(optimized.astype(df.dtypes.to_dict()), df, check_exact=True)
+
+
+def test_make_synthetic_mercedes_listings():
+    """Tests that synthetic listings are seeded and look like the sample data"""
+
+    data = make_synthetic_mercedes_listings(5000, random_state=1)
+    assert data.columns.tolist() == ['price_USD', 'condition', 'paint_color', 'model', 'odometer_mi', 'year'], "Wrong columns returned."
+    assert len(data) == 5000, "Incorrect number of rows returned."
+    pd.testing.assert_frame_equal(data, make_synthetic_mercedes_listings(5000, random_state=1))
+    assert not data.equals(make_synthetic_mercedes_listings(5000, random_state=2)), "The seed does not change the listings."
+
+    assert data['model'].value_counts().index[0] == 'c-class', "c-class should be the most common model."
+    assert data['price_USD'].min() >= 500, "Prices should be realistic."
+    # older cars are cheaper and have more miles
+    old = data['year'] < 2010
+    assert data.loc[old, 'price_USD'].median() < data.loc[~old, 'price_USD'].median(), "Prices do not depreciate."
+    assert data.loc[old, 'odometer_mi'].median() > data.loc[~old, 'odometer_mi'].median(), "Odometer does not grow with age."
+
+    template = pd.DataFrame({
+        'model': ['gls', 'gls', 'glk'],
+        'condition': ['good', 'good', np.nan],
+        'paint_color': ['red', 'red', 'red'],
+        'year': [2016, 2018, 2018],
+        'state': ['ca', 'wa', 'wa'],
+        })
+    data = make_synthetic_mercedes_listings(100, random_state=1, template=template)
+    assert set(data['model']) == {'gls', 'glk'}, "Models are not drawn from the template."
+    assert set(data['year']) <= {2016, 2018}, "Years are not drawn from the template."
+    assert set(data['state']) <= {'ca', 'wa'}, "Other template columns are not resampled."
+
+
+def test_clean_raw_mercedes_listings():
+    """Tests that raw scraped listings are normalized, filtered and deduplicated"""
+
+    raw = pd.DataFrame({
+        'price': ['$15,500', '12.5k', 'call', '100', '9000', '20000', '21000', '30000'],
+        'model': ['Mercedes-Benz C300 4matic', 'benz ml350', 'e350', 'c250', 'GLK 350', 'sprinter 2500', 'Sprinter 2500', 'maybach'],
+        'condition': ['Excellent', 'LIKE-NEW', 'good', 'fair', 'salvaged', 'good', 'good', 'junk'],
+        'odometer': ['55,000 miles', '80,000 km', '120000', '5000', '600,000', '90000', '90000', np.nan],
+        'year': [2015, 2012, 2010, 2011, 2005, 2016, 2016, 2030],
+        'paint_color': ['Black', 'gray', 'silver', 'red', 'white', 'White', 'white', 'blue'],
+        'VIN': ['wdd1', 'WDD2', np.nan, np.nan, np.nan, np.nan, np.nan, 'wdd3'],
+        })
+    data = clean_raw_mercedes_listings(raw, chunk_size=3)
+
+    # no price, price and odometer outliers, a future year and a repost are dropped
+    assert data.index.tolist() == [0, 1, 6], "Wrong listings kept"
+    assert data.columns.tolist() == ['price_USD', 'model', 'condition', 'odometer_mi', 'year', 'paint_color', 'VIN'], "Columns were not renamed"
+    assert data['price_USD'].tolist() == [15500, 12500, 21000], "Prices were not parsed"
+    assert data['model'].tolist() == ['c-class', 'm-class', 'sprinter'], "Models were not normalized"
+    assert data['condition'].tolist() == ['excellent', 'like new', 'good'], "Conditions were not normalized"
+    assert data['odometer_mi'].tolist() == [55000, 49710, 90000], "Odometer readings were not parsed"
+    assert data['paint_color'].tolist() == ['black', 'grey', 'white'], "Paint colors were not normalized"
+    assert data['VIN'].tolist()[:2] == ['WDD1', 'WDD2'], "VINs were not normalized"
+    pd.testing.assert_frame_equal(data, clean_raw_mercedes_listings(raw))
+
+    # unknown models and conditions
+    data = clean_raw_mercedes_listings(raw, year_range=[1950, 2030], max_odometer_mi=1_000_000)
+    assert data.loc[7, 'model'] == 'other' and pd.isna(data.loc[7, 'condition']), "Unknown values were not handled"
+    assert data.index.tolist() == [0, 1, 4, 6, 7], "Wrong listings kept"
+
+    # the cleaned listings can be searched
+    assert listing_search(data, budget=20000, model='c-class').index.tolist() == [0]
+
+
+def test_listing_index():
+    """Tests that ListingIndex searches match listing_search."""
+
+    rng = np.random.default_rng(2023)
+    n = 2000
+    df = pd.DataFrame({
+        'price_USD': rng.integers(0, 50, n) * 1000.0,
+        'model': rng.choice(['c-class', 'e-class', 's-class', 'gl-class'], n),
+        'odometer_mi': rng.integers(0, 10, n) * 10000,
+        'year': rng.integers(2000, 2020, n),
+        'condition': rng.choice(['good', 'fair'], n),
+        })
+    df.loc[rng.choice(n, 20), 'price_USD'] = np.nan
+    df.loc[rng.choice(n, 20), 'year'] = np.nan
+
+    index = ListingIndex(df)
+    searches = [
+        dict(),
+        dict(budget=20000, model='c-class'),
+        dict(budget=[5000, 30000], model='any', sort_feature='year', ascending=False),
+        dict(budget=[10000.5, 10000.5], model='gl-class', sort_feature='year'),
+        dict(budget=[5000, 30000], model='e-class', sort_feature='price_USD', ascending=False),
+    ]
+    for search in searches:
+        expected = listing_search(df, **search)
+        pd.testing.assert_frame_equal(index.search(**search), expected)
+        pd.testing.assert_frame_equal(listing_search(index, **search), expected)
+
+    # the same input checks as listing_search
+    try:
+        index.search(budget=[0, 80000], model="450")
+    except Exception as e:
+        assert str(e) == "The specified car model does not exist in the dataframe provided", f"Unexpected exception raised: {e}"
+    else:
+        assert False, "Expected exception was not raised"
+
+    try:
+        index.search(price_col='price_CAD')
+    except Exception as e:
+        assert str(e) == "The index was built for the price column price_USD", f"Unexpected exception raised: {e}"
+    else:
+        assert False, "Expected exception was not raised"
+
+
+def test_listing_search_limit():
+    """Tests that limit returns the first rows of the full search result."""
+
+    rng = np.random.default_rng(19)
+    n = 2000
+    df = pd.DataFrame({
+        'price_USD': rng.integers(0, 50, n) * 1000,
+        'model': rng.choice(['c-class', 'e-class', 's-class'], n),
+        'odometer_mi': rng.integers(0, 10, n) * 10000.0,
+        'year': rng.integers(2000, 2020, n),
+        })
+    df.loc[rng.choice(n, 50), 'odometer_mi'] = np.nan
+    index = ListingIndex(df)
+
+    for search in [dict(), dict(budget=[5000, 30000], model='s-class', sort_feature='year', ascending=False)]:
+        expected = listing_search(df, **search)
+        for limit in [0, 1, 10, len(expected) - 1, len(expected) + 1]:
+            pd.testing.assert_frame_equal(listing_search(df, limit=limit, **search), expected.head(limit))
+            pd.testing.assert_frame_equal(index.search(limit=limit, **search), expected.head(limit))
+
+    try:
+        listing_search(df, limit=-1)
+    except Exception as e:
+        assert str(e) == "The limit parameter should be a non-negative integer", f"Unexpected exception raised: {e}"
+    else:
+        assert False, "Expected exception was not raised"
+
+
+def test_listing_search_batch():
+    """Tests that batch searches match one listing_search per query."""
+
+    rng = np.random.default_rng(7)
+    n = 2000
+    df = pd.DataFrame({
+        'price_USD': rng.integers(0, 50, n) * 1000,
+        'model': rng.choice(['c-class', 'e-class', 's-class'], n),
+        'odometer_mi': rng.integers(0, 10, n) * 10000,
+        'year': pd.array(rng.integers(2000, 2020, n), dtype='Int64'),
+        })
+    queries = pd.DataFrame({
+        'budget_min': [5000, np.nan, 0, 40000, 10000],
+        'budget_max': [30000, 20000, 50000, 10000, 10000],
+        'model': ['c-class', 'any', np.nan, 'e-class', 's-class'],
+        }, index=['a', 'b', 'c', 'd', 'e'])
+    budgets = [[5000, 30000], 20000, [0, 50000], [40000, 10000], [10000, 10000]]
+    models = ['c-class', 'any', 'any', 'e-class', 's-class']
+
+    # year uses the nullable integer dtype, which is searched query by query
+    for sort_feature in ['odometer_mi', 'year']:
+        for limit in [None, 3]:
+            results = listing_search_batch(df, queries, sort_feature=sort_feature, ascending=False, limit=limit)
+            long_result = listing_search_batch(ListingIndex(df), queries, sort_feature=sort_feature, ascending=False, limit=limit, as_frame=True)
+
+            assert list(results) == ['a', 'b', 'c', 'd', 'e']
+            for query_id, budget, model in zip(queries.index, budgets, models):
+                expected = listing_search(df, budget=budget, model=model, sort_feature=sort_feature, ascending=False, limit=limit)
+                pd.testing.assert_frame_equal(results[query_id], expected)
+                pd.testing.assert_frame_equal(
+                    long_result[long_result['query_id'] == query_id].drop(columns='query_id'), expected
+                )
+
+    assert len(listing_search_batch(df, queries.iloc[:0], as_frame=True)) == 0
+
+    try:
+        listing_search_batch(df, queries.assign(model='450'))
+    except Exception as e:
+        assert str(e) == "The specified car models ['450'] do not exist in the dataframe provided", f"Unexpected exception raised: {e}"
+    else:
+        assert False, "Expected exception was not raised"
+
+
+def test_listing_search_stream(tmp_path):
+    """Tests that searching a csv chunk by chunk matches listing_search."""
+
+    rng = np.random.default_rng(11)
+    n = 3000
+    df = pd.DataFrame({
+        'price_USD': rng.integers(0, 50, n) * 1000.0,
+        'model': rng.choice(['c-class', 'e-class', 's-class'], n),
+        'odometer_mi': rng.integers(0, 10, n) * 10000,
+        'year': rng.integers(2000, 2010, n).astype(float),
+        })
+    df.loc[rng.choice(n, 50), 'year'] = np.nan
+    path = tmp_path / 'listings.csv'
+    df.to_csv(path)
+
+    searches = [
+        dict(),
+        dict(budget=20000, model='c-class'),
+        dict(budget=[5000, 30000], sort_feature='year', ascending=False),
+        ]
+    for search in searches:
+        for limit in [None, 0, 5, 5000]:
+            expected = listing_search(df, limit=limit, **search)
+            result = listing_search_stream(path, limit=limit, chunk_size=700, index_col=0, dtype={'year': float}, **search)
+            pd.testing.assert_frame_equal(result, expected)
+
+    # any iterable of dataframes can be searched
+    chunks = (df.iloc[i:i + 1000] for i in range(0, n, 1000))
+    pd.testing.assert_frame_equal(listing_search_stream(chunks, limit=10), listing_search(df, limit=10))
+
+    try:
+        listing_search_stream(path, model='450')
+    except Exception as e:
+        assert str(e) == "The specified car model does not exist in the dataframe provided", f"Unexpected exception raised: {e}"
+    else:
+        assert False, "Expected exception was not raised"
+
+
+def test_listing_store():
+    """Tests that ListingStore searches match listing_search after changes."""
+
+    rng = np.random.default_rng(5)
+    n = 1000
+    df = pd.DataFrame({
+        'price_USD': rng.integers(0, 50, n) * 1000.0,
+        'model': rng.choice(['c-class', 'e-class', 's-class'], n),
+        'odometer_mi': rng.integers(0, 10, n) * 10000.0,
+        'year': rng.integers(2000, 2010, n),
+        }, index=pd.Index(np.arange(n) * 10, name='id'))
+    df.loc[rng.choice(df.index, 20), 'price_USD'] = np.nan
+
+    store = ListingStore(df)
+    expected = df.copy()
+
+    store.insert(1, {'price_USD': 15000.0, 'model': 'gl-class', 'odometer_mi': 0.0, 'year': 2020})
+    expected.loc[1] = [15000.0, 'gl-class', 0.0, 2020]
+    store.insert(2, {'price_USD': 20000.0, 'model': 'c-class', 'odometer_mi': 10000.0, 'year': 2015})
+    expected.loc[2] = [20000.0, 'c-class', 10000.0, 2015]
+    for listing_id in df.index[:100]:
+        store.update_price(listing_id, 5000.0)
+        expected.loc[listing_id, 'price_USD'] = 5000.0
+    for listing_id in df.index[100:200]:
+        store.delete(listing_id)
+    expected = expected.drop(df.index[100:200])
+
+    assert len(store) == len(expected), "Wrong number of listings in the store"
+    pd.testing.assert_frame_equal(store.to_frame(), expected)
+
+    searches = [
+        dict(),
+        dict(budget=20000, model='c-class'),
+        dict(budget=[5000, 30000], model='gl-class', sort_feature='year', ascending=False),
+        dict(budget=[5000, 30000], sort_feature='year', ascending=False, limit=10),
+        dict(budget=[100, 200]),
+        ]
+    for search in searches:
+        pd.testing.assert_frame_equal(store.search(**search), listing_search(expected, **search))
+        pd.testing.assert_frame_equal(listing_search(store, **search), listing_search(expected, **search))
+
+    # sold models can no longer be searched
+    store.delete(1)
+    try:
+        store.search(model='gl-class')
+    except Exception as e:
+        assert str(e) == "The specified car model does not exist in the dataframe provided", f"Unexpected exception raised: {e}"
+    else:
+        assert False, "Expected exception was not raised"
+
+    try:
+        store.delete(1)
+    except Exception as e:
+        assert str(e) == "The listing 1 does not exist in the store", f"Unexpected exception raised: {e}"
+    else:
+        assert False, "Expected exception was not raised"
+
+    # a price that is not a number leaves the store unchanged
+    before = store.to_frame()
+    for change in [lambda: store.insert(3, {'price_USD': 'cheap', 'model': 'gl-class'}),
+                   lambda: store.update_price(2, 'cheap')]:
+        try:
+            change()
+        except Exception as e:
+            assert str(e) == "The price 'cheap' is not a number", f"Unexpected exception raised: {e}"
+        else:
+            assert False, "Expected exception was not raised"
+    pd.testing.assert_frame_equal(store.to_frame(), before)
+    assert 'gl-class' not in store.models, "A failed insert changed the model counts"
+    pd.testing.assert_frame_equal(store.search(budget=[20000, 20000], model='c-class'),
+                                  listing_search(before, budget=[20000, 20000], model='c-class'))
+
+
+def test_find_mercedes_deals():
+    """Tests that deals are ranked by the discount to the predicted price."""
+
+    df = pd.DataFrame({
+        'price_USD': [15000, 9000, 70000, 4000, 12000, 20000],
+        'model': ['e-class', 'c-class', 's-class', 'sprinter', 'c-class', 'c-class'],
+        'year': [2015, 2012, 2019, 2008, 2014, 2016],
+        'odometer_mi': [55000, 90000, 12000, 210000, 60000, 30000],
+        'condition': ['fair', 'good', 'like new', 'salvage', 'not a condition', 'excellent'],
+        'paint_color': ['silver', 'black', 'white', 'unknown', 'black', 'blue'],
+        })
+    predicted = [
+        predict_mercedes_price(row.model, row.year, row.odometer_mi, row.condition, row.paint_color)
+        if row.condition != 'not a condition' else np.nan
+        for row in df.itertuples()
+        ]
+    discount = (np.array(predicted) - df['price_USD']).round(2)
+
+    deals = find_mercedes_deals(df, limit=None)
+    assert deals.columns.tolist()[:4] == ['price_USD', 'predicted_price_USD', 'discount_USD', 'discount_pct'], "Wrong columns returned"
+    assert deals.index.tolist() == discount.dropna().sort_values(ascending=False, kind='stable').index.tolist(), "Deals are not ranked by discount"
+    assert np.allclose(deals['discount_USD'], discount[deals.index]), "Wrong discount calculated"
+
+    # listings that cannot be scored are left out
+    assert 4 not in deals.index, "Listings with invalid features should be left out"
+
+    t1 = find_mercedes_deals(df, budget=[5000, 50000], model='c-class', limit=1)
+    assert t1.index.tolist() == discount[[1, 5]].sort_values(ascending=False).index[:1].tolist(), "The output was not filtered by budget and model"
+
+    t2 = find_mercedes_deals(df, rank_by='discount_pct')
+    assert t2['discount_pct'].is_monotonic_decreasing, "Deals are not ranked by discount percentage"
+
+    try:
+        find_mercedes_deals(df, rank_by='price')
+    except Exception as e:
+        assert str(e) == "The rank_by parameter should be 'discount_USD' or 'discount_pct'", f"Unexpected exception raised: {e}"
+    else:
+        assert False, "Expected exception was not raised"
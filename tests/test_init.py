@@ -0,0 +1,51 @@
+import subprocess
+import sys
+import pytest
+
+HEAVY_MODULES = ["pandas", "numpy", "sklearn", "altair", "joblib"]
+
+
+def imported_modules(statement):
+    """Runs a statement in a fresh interpreter and returns the loaded modules."""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys; {statement}; print(' '.join(sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return {module.split(".")[0] for module in result.stdout.split()}
+
+
+# test that importing the package does not load any heavy dependency
+def test_import_is_lazy():
+    loaded = imported_modules("import mercedestrenz")
+    assert loaded.isdisjoint(HEAVY_MODULES), "import mercedestrenz loaded heavy modules"
+
+
+# test that each subsystem only loads the dependencies it needs
+@pytest.mark.parametrize(
+    "submodule, not_loaded",
+    [
+        ("compiled", ["pandas", "sklearn", "altair"]),
+        ("data", ["sklearn", "altair"]),
+        ("predict", ["sklearn", "altair"]),
+        ("visualizations", ["sklearn"]),
+    ],
+)
+def test_submodule_dependencies(submodule, not_loaded):
+    loaded = imported_modules(f"import mercedestrenz; mercedestrenz.{submodule}")
+    assert "mercedestrenz" in loaded
+    assert loaded.isdisjoint(not_loaded)
+
+
+def test_lazy_attributes():
+    import mercedestrenz
+
+    assert callable(mercedestrenz.data.listing_search)
+    assert isinstance(mercedestrenz.__version__, str)
+    with pytest.raises(AttributeError):
+        mercedestrenz.not_a_submodule
@@ -2,10 +2,38 @@
 # Date: 2023-01-20
 from mercedestrenz.predict import predict_mercedes_price
 from mercedestrenz.predict import load_mercedes_price_model
+from mercedestrenz.predict import predict_mercedes_price_batch
+from mercedestrenz.predict import predict_mercedes_price_parallel
+from mercedestrenz.predict import validate_mercedes_listings
+from mercedestrenz.predict import MercedesPriceModelCache
+from mercedestrenz.predict import MercedesPricePredictionCache
+from mercedestrenz import predict
+from importlib import resources
 from sklearn.pipeline import Pipeline
+import hashlib
+import numpy as np
+import os
+import shutil
+import threading
+import time
+import pandas as pd
 import pytest
 
 
+@pytest.fixture
+def listings():
+    return pd.DataFrame(
+        {
+            "model": ["e-class", "c-class", "s-class", "sprinter"],
+            "year": [2015, 2012, 2019, 2008],
+            "odometer_mi": [55_000, 90_000, 12_000, 210_000],
+            "condition": ["fair", "good", "like new", "salvage"],
+            "paint_color": ["silver", "black", "white", "unknown"],
+            "price_USD": [15_000, 9_000, 70_000, 4_000],
+        }
+    )
+
+
 # test that passing valid values returns a float
 def test_predict_mercedes_price():
     assert isinstance(
@@ -42,3 +70,225 @@ def test_predict_mercedes_price_wrong_condition(condition):
 def test_load_mercedes_price_model_v1(model_version):
     model = load_mercedes_price_model(model_version)
     assert isinstance(model, Pipeline)
+
+
+# test that batch predictions match the single row predictions
+def test_predict_mercedes_price_batch(listings):
+    predictions = predict_mercedes_price_batch(listings)
+
+    assert isinstance(predictions, np.ndarray)
+    expected = [
+        predict_mercedes_price(*row)
+        for row in listings.loc[
+            :, ["model", "year", "odometer_mi", "condition", "paint_color"]
+        ].itertuples(index=False)
+    ]
+    np.testing.assert_allclose(predictions, expected)
+
+
+# test that a dict of columns is accepted as well as a dataframe
+def test_predict_mercedes_price_batch_dict(listings):
+    np.testing.assert_allclose(
+        predict_mercedes_price_batch(listings.to_dict(orient="list")),
+        predict_mercedes_price_batch(listings),
+    )
+
+
+# test that invalid rows are reported, or scored as NaN when coerced
+def test_predict_mercedes_price_batch_invalid_rows(listings):
+    listings.loc[1, "condition"] = "slightly old"
+    listings.loc[3, "year"] = "2008"
+
+    invalid_rows = validate_mercedes_listings(listings)
+    assert invalid_rows.index.tolist() == [1, 3]
+    assert invalid_rows[3] == "year must be an integer from 1929 to 2021"
+
+    with pytest.raises(ValueError):
+        predict_mercedes_price_batch(listings)
+
+    predictions = predict_mercedes_price_batch(listings, errors="coerce")
+    assert np.isnan(predictions).tolist() == [False, True, False, True]
+
+
+# test that missing columns and bad input types raise an error
+def test_predict_mercedes_price_batch_bad_input(listings):
+    with pytest.raises(ValueError):
+        predict_mercedes_price_batch(listings.drop(columns=["paint_color"]))
+    with pytest.raises(TypeError):
+        predict_mercedes_price_batch(listings.to_numpy())
+    with pytest.raises(ValueError):
+        predict_mercedes_price_batch(listings, errors="ignore")
+
+
+# test that parallel scoring returns the batch predictions in input order
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_predict_mercedes_price_parallel(listings, n_workers):
+    listings = pd.concat([listings] * 5, ignore_index=True)
+    listings.loc[7, "condition"] = "slightly old"
+
+    predictions = predict_mercedes_price_parallel(
+        listings, n_workers=n_workers, chunk_size=3, errors="coerce"
+    )
+    np.testing.assert_allclose(
+        predictions, predict_mercedes_price_batch(listings, errors="coerce")
+    )
+
+    with pytest.raises(ValueError):
+        predict_mercedes_price_parallel(listings, n_workers=n_workers, chunk_size=3)
+    with pytest.raises(ValueError):
+        predict_mercedes_price_parallel(listings, chunk_size=0)
+    with pytest.raises(FileNotFoundError):
+        predict_mercedes_price_parallel(
+            listings, version="v999", n_workers=n_workers, errors="coerce"
+        )
+    with pytest.raises(ValueError):
+        predict_mercedes_price_parallel(listings, mp_context="thread")
+
+
+# test that the pool starts under every start method, spawn pickles the initializer
+@pytest.mark.parametrize("mp_context", ["spawn", "forkserver", "fork"])
+def test_predict_mercedes_price_parallel_start_methods(listings, mp_context):
+    predictions = predict_mercedes_price_parallel(
+        listings, n_workers=2, chunk_size=2, mp_context=mp_context
+    )
+    np.testing.assert_allclose(predictions, predict_mercedes_price_batch(listings))
+
+
+@pytest.fixture
+def model_copy():
+    # copy of the v1 model saved as a separate version for cache tests
+    with resources.path("mercedestrenz.models", "mercedes_price_prediction_v1.joblib") as d:
+        copy_path = d.with_name("mercedes_price_prediction_vcachetest.joblib")
+        shutil.copy(d, copy_path)
+    yield copy_path
+    copy_path.unlink()
+
+
+# test that the cache returns the same pipeline until it is cleared
+def test_model_cache_get_and_clear():
+    cache = MercedesPriceModelCache(max_size=2)
+    cache.warmup(["v1"])
+    model = cache.get("v1")
+
+    assert isinstance(model, Pipeline)
+    assert cache.get("v1") is model
+    assert load_mercedes_price_model("v1") is load_mercedes_price_model("v1")
+    assert load_mercedes_price_model("v1", use_cache=False) is not model
+
+    cache.clear()
+    assert cache.versions() == []
+    assert cache.get("v1") is not model
+
+
+# test that the least recently used version is evicted when the cache is full
+def test_model_cache_eviction(model_copy):
+    cache = MercedesPriceModelCache(max_size=1)
+    cache.get("v1")
+    cache.get("vcachetest")
+
+    assert cache.versions() == ["vcachetest"]
+
+
+# test that a changed model file is reloaded but a touched one is not
+def test_model_cache_invalidation(model_copy):
+    cache = MercedesPriceModelCache()
+    model = cache.get("vcachetest")
+
+    stat = model_copy.stat()
+    os.utime(model_copy, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert cache.get("vcachetest") is model
+
+    with open(model_copy, "ab") as f:
+        f.write(b"\0")
+    assert cache.get("vcachetest") is not model
+
+
+# test that loading one version does not block lookups of a cached one, and
+# that the fingerprint is the hash of the bytes the model was loaded from
+def test_model_cache_loads_outside_lock(model_copy, monkeypatch):
+    cache = MercedesPriceModelCache()
+    model = cache.get("v1")
+
+    loading, release = threading.Event(), threading.Event()
+    read_model_file = predict._read_model_file
+
+    def slow_read_model_file(path, *args):
+        loading.set()
+        release.wait(timeout=10)
+        return read_model_file(path, *args)
+
+    monkeypatch.setattr(predict, "_read_model_file", slow_read_model_file)
+    thread = threading.Thread(target=cache.get, args=("vcachetest",))
+    thread.start()
+    try:
+        assert loading.wait(timeout=10)
+        assert cache.get("v1") is model
+        assert thread.is_alive()
+    finally:
+        release.set()
+        thread.join()
+
+    assert cache.fingerprint("vcachetest") == hashlib.sha256(
+        model_copy.read_bytes()
+    ).hexdigest()
+
+
+# test that a missing model version raises an error
+def test_model_cache_missing_version():
+    with pytest.raises(FileNotFoundError):
+        MercedesPriceModelCache().get("v999")
+
+
+# test that repeated predictions are served from the prediction cache
+def test_prediction_cache_hits():
+    cache = MercedesPricePredictionCache(max_size=10)
+    price = predict_mercedes_price("e-class", 2015, 55_000, "fair", "silver", cache=cache)
+
+    assert price == predict_mercedes_price("e-class", 2015, 55_000, "fair", "silver")
+    assert predict_mercedes_price("e-class", 2015, 55_000, "fair", "silver", cache=cache) == price
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "size": 1}
+
+
+# test that odometer readings in the same bucket share a cache entry
+def test_prediction_cache_odometer_bucket():
+    cache = MercedesPricePredictionCache(odometer_bucket=1000)
+    price = predict_mercedes_price("e-class", 2015, 55_100, "fair", "silver", cache=cache)
+
+    assert predict_mercedes_price("e-class", 2015, 55_900, "fair", "silver", cache=cache) == price
+    assert price == predict_mercedes_price("e-class", 2015, 55_500, "fair", "silver")
+    assert cache.stats()["hits"] == 1
+
+
+# test least recently used eviction and expiry of cached predictions
+def test_prediction_cache_eviction_and_ttl(monkeypatch):
+    cache = MercedesPricePredictionCache(max_size=2, ttl=60)
+    cache.put("a", 1.0)
+    cache.put("b", 2.0)
+    cache.get("a")
+    cache.put("c", 3.0)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1.0
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 1
+
+
+# test that a different model file never serves a cached price
+def test_prediction_cache_keyed_on_model_file(model_copy):
+    cache = MercedesPricePredictionCache()
+    cache.put(("vcachetest", "stale", "e-class", 2015, 55_000, "fair", "silver"), -1.0)
+
+    assert predict_mercedes_price(
+        "e-class", 2015, 55_000, "fair", "silver", version="vcachetest", cache=cache
+    ) > 0
+
+
+@pytest.mark.parametrize(
+    "kwargs", [{"max_size": 0}, {"ttl": -1}, {"odometer_bucket": 10.5}]
+)
+def test_prediction_cache_bad_arguments(kwargs):
+    with pytest.raises(ValueError):
+        MercedesPricePredictionCache(**kwargs)
@@ -0,0 +1,83 @@
+from mercedestrenz.score import main, score_mercedes_listings_csv
+from mercedestrenz.predict import predict_mercedes_price_batch
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def listings_csv(tmp_path):
+    listings = pd.DataFrame(
+        {
+            "VIN": ["a", "b", "c", "d", "e"],
+            "model": ["e-class", "c-class", "s-class", "sprinter", "gl-class"],
+            "year": [2015, 2012, 2019, 2008, 2011],
+            "odometer_mi": [55_000, 90_000, 12_000, 210_000, 130_000],
+            "condition": ["fair", "good", "like new", "not a condition", "excellent"],
+            "paint_color": ["silver", "black", "white", "unknown", "grey"],
+        }
+    )
+    path = tmp_path / "listings.csv"
+    listings.to_csv(path, index=False)
+    return path
+
+
+# test that every row is written with its prediction, in order
+def test_score_mercedes_listings_csv(listings_csv, tmp_path):
+    output_path = tmp_path / "scored.csv"
+    stats = score_mercedes_listings_csv(listings_csv, output_path, chunk_size=2)
+
+    listings = pd.read_csv(listings_csv)
+    scored = pd.read_csv(output_path)
+
+    assert stats["rows"] == 5
+    assert stats["rejected"] == 1
+    assert scored.columns.tolist() == listings.columns.tolist() + [
+        "predicted_price_USD"
+    ]
+    pd.testing.assert_frame_equal(
+        scored.drop(columns=["predicted_price_USD"]), listings
+    )
+    np.testing.assert_allclose(
+        scored["predicted_price_USD"],
+        predict_mercedes_price_batch(listings, errors="coerce"),
+    )
+
+
+# test the command line entry point
+def test_score_main(listings_csv, tmp_path, capsys):
+    output_path = tmp_path / "scored.csv"
+
+    assert main([str(listings_csv), str(output_path), "--version", "v1"]) == 0
+    assert len(pd.read_csv(output_path)) == 5
+    assert "rejected 1 rows" in capsys.readouterr().err
+
+
+def test_score_bad_chunk_size(listings_csv, tmp_path):
+    with pytest.raises(ValueError):
+        score_mercedes_listings_csv(listings_csv, tmp_path / "scored.csv", chunk_size=0)
+
+
+# test that a malformed number only rejects its own row, whatever the chunk size
+@pytest.mark.parametrize("chunk_size", [2, 10])
+def test_score_malformed_number(listings_csv, tmp_path, chunk_size):
+    listings = pd.read_csv(listings_csv)
+    listings["odometer_mi"] = listings["odometer_mi"].astype(str)
+    listings.loc[1, "odometer_mi"] = "12k"
+    listings.to_csv(listings_csv, index=False)
+
+    output_path = tmp_path / "scored.csv"
+    stats = score_mercedes_listings_csv(
+        listings_csv, output_path, chunk_size=chunk_size
+    )
+
+    scored = pd.read_csv(output_path)
+    assert stats["rejected"] == 2
+    assert scored["predicted_price_USD"].isna().tolist() == [
+        False,
+        True,
+        False,
+        True,
+        False,
+    ]
+    assert scored.loc[1, "odometer_mi"] == "12k"
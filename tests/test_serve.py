@@ -0,0 +1,115 @@
+from mercedestrenz.serve import main, make_server
+from mercedestrenz.predict import predict_mercedes_price
+import http.client
+import json
+import threading
+import pytest
+
+LISTING = {
+    "model": "e-class",
+    "year": 2015,
+    "odometer_mi": 55_000,
+    "condition": "fair",
+    "paint_color": "silver",
+}
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = make_server(port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.ready.wait(timeout=60)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def connection(server):
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=10)
+    yield connection
+    connection.close()
+
+
+def request(connection, method, path, body=None):
+    """Sends a request on a kept alive connection and returns status and JSON."""
+    payload = None if body is None else json.dumps(body)
+    connection.request(method, path, body=payload)
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+# test that health reports the loaded model version
+def test_health(connection):
+    assert request(connection, "GET", "/health") == (
+        200,
+        {"status": "ok", "ready": True, "version": "v1"},
+    )
+
+
+# test single and batch predictions over one kept alive connection
+def test_predict_and_predict_batch(connection):
+    status, result = request(connection, "POST", "/predict", LISTING)
+    assert status == 200
+    assert result["predicted_price_USD"] == predict_mercedes_price(**LISTING)
+
+    bad_listing = dict(LISTING, condition="slightly old")
+    status, result = request(
+        connection, "POST", "/predict_batch", [LISTING, bad_listing, LISTING]
+    )
+    assert status == 200
+    assert result["predicted_price_USD"][0] == predict_mercedes_price(**LISTING)
+    assert result["predicted_price_USD"][1] is None
+    assert list(result["rejected"]) == ["1"]
+
+    # the batch rows follow the same rules as a single prediction
+    float_year = dict(LISTING, year=2015.0)
+    assert request(connection, "POST", "/predict", float_year)[0] == 400
+    status, result = request(
+        connection, "POST", "/predict_batch", [LISTING, float_year]
+    )
+    assert result["predicted_price_USD"] == [predict_mercedes_price(**LISTING), None]
+    assert list(result["rejected"]) == ["1"]
+
+    status, result = request(
+        connection, "POST", "/predict_batch", {"listings": [LISTING]}
+    )
+    assert status == 200
+    assert len(result["predicted_price_USD"]) == 1
+
+
+# test that bad requests are answered with client errors
+def test_bad_requests(connection):
+    assert request(connection, "POST", "/predict", dict(LISTING, year="2015"))[0] == 400
+    assert request(connection, "POST", "/predict", [LISTING])[0] == 400
+    assert request(connection, "POST", "/predict_batch", LISTING)[0] == 400
+    assert request(connection, "GET", "/not_a_path")[0] == 404
+
+    connection.request("POST", "/predict", body="not json")
+    response = connection.getresponse()
+    response.read()
+    assert response.status == 400
+
+
+# test that a model that fails to load is reported instead of loading forever
+def test_model_load_failure(capsys):
+    server = make_server(port=0, version="v999")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.loader.join(timeout=60)
+
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=10)
+    try:
+        status, result = request(connection, "GET", "/health")
+        assert status == 500
+        assert result["status"] == "failed"
+        assert result["error"].startswith("FileNotFoundError")
+        assert request(connection, "POST", "/predict", LISTING)[0] == 500
+    finally:
+        connection.close()
+        server.shutdown()
+        server.server_close()
+
+    assert main(["--port", "0", "--version", "v999"]) == 1
+    assert "Could not load model v999" in capsys.readouterr().err
@@ -1,8 +1,22 @@
 # Author: Ty Andrews
 # Date: 2023-01-20
 from mercedestrenz.train import train_mercedes_price_prediction_model
+from mercedestrenz.train import retrain_mercedes_price_prediction_model
+from mercedestrenz.train import CheckpointedRandomSearchCV
+from mercedestrenz.predict import load_mercedes_price_model
 from mercedestrenz.data import load_sample_mercedes_listings
+from mercedestrenz.data import make_synthetic_mercedes_listings
+from sklearn.base import clone
 from sklearn.pipeline import Pipeline
+from sklearn.model_selection import cross_validate
+from sklearn.model_selection import RandomizedSearchCV
+from sklearn.exceptions import FitFailedWarning
+from sklearn.tree import DecisionTreeRegressor
+from sklearn.ensemble import HistGradientBoostingRegressor
+import json
+import tempfile
+from importlib import resources
+import numpy as np
 import pandas as pd
 import pytest
 
@@ -36,3 +50,221 @@ def test_incorrect_data_train_price_prediction():
         train_mercedes_price_prediction_model(
             raw_data, "v1", model_type="gradient_boosting", save_model=False, n_iter=1
         )
+
+
+def test_train_hist_gradient_boosting_model():
+    # test that the histogram engine trains on the categorical features natively
+
+    raw_data = make_synthetic_mercedes_listings(1_000, random_state=42)
+    model, cv_results = train_mercedes_price_prediction_model(
+        raw_data, "v1", model_type="hist_gradient_boosting", save_model=False, n_iter=1
+    )
+
+    assert isinstance(model, Pipeline)
+    assert isinstance(model[-1], HistGradientBoostingRegressor)
+    assert model[-1].is_categorical_.tolist() == [True, True, True, False, False]
+    assert cv_results["hist_gradient_boosting"].loc["test_r2", "mean"] > 0.5
+
+    # unknown categories are treated as missing values
+    listing = raw_data.head(1).assign(model="unknown", condition="unknown")
+    assert model.predict(listing).shape == (1,)
+
+
+def test_train_halving_search_strategy():
+    # test that successive halving tunes the number of boosting rounds and
+    # reports the search's own fold scores of the best model
+
+    raw_data = make_synthetic_mercedes_listings(1_000, random_state=42)
+    model, cv_results = train_mercedes_price_prediction_model(
+        raw_data,
+        "v1",
+        model_type="hist_gradient_boosting",
+        n_iter=3,
+        cv_results={},
+        search_strategy="halving",
+        halving_resource="n_estimators",
+    )
+
+    assert isinstance(model[-1], HistGradientBoostingRegressor)
+    assert model[-1].max_iter <= 300
+    results = cv_results["hist_gradient_boosting"]
+    assert list(results.columns) == ["mean", "std"]
+    assert {"test_r2", "train_neg_root_mean_squared_error"}.issubset(results.index)
+
+    X, y = raw_data.drop(columns="price_USD"), raw_data["price_USD"]
+    model_cv = cross_validate(model, X, y, cv=5, scoring="r2")
+    assert results.loc["test_r2", "mean"] == round(model_cv["test_score"].mean(), 3)
+
+    with pytest.raises(ValueError):
+        train_mercedes_price_prediction_model(
+            raw_data, "v1", n_iter=1, search_strategy="grid"
+        )
+
+
+def test_train_cache_preprocessing(tmp_path):
+    # test that the fitted column transformers are cached and the saved model
+    # does not depend on the cache
+
+    raw_data = make_synthetic_mercedes_listings(500, random_state=42)
+    cache_dir = tmp_path / "cache"
+    model, _ = train_mercedes_price_prediction_model(
+        raw_data,
+        "v1",
+        n_iter=2,
+        cv_results={},
+        cache_preprocessing=True,
+        cache_dir=str(cache_dir),
+    )
+
+    assert model.memory is None
+    assert any(cache_dir.rglob("output.pkl"))
+    assert model.predict(raw_data.head()).shape == (5,)
+
+
+def test_retrain_mercedes_price_prediction_model():
+    # test that retraining adds boosting stages to a copy of the base version
+
+    raw_data = make_synthetic_mercedes_listings(500, random_state=42)
+    base_model = load_mercedes_price_model("v1")
+    n_estimators = base_model[-1].n_estimators_
+
+    model = retrain_mercedes_price_prediction_model(
+        raw_data, "v1", "v2", n_new_estimators=5
+    )
+
+    assert model[-1].n_estimators_ == n_estimators + 5
+    assert model[-1].warm_start is False
+    assert base_model[-1].n_estimators_ == n_estimators
+    assert model.predict(raw_data.head()).shape == (5,)
+
+    with pytest.raises(ValueError):
+        retrain_mercedes_price_prediction_model(
+            raw_data, "v1", "v2", n_new_estimators=0
+        )
+    with pytest.raises(FileNotFoundError):
+        retrain_mercedes_price_prediction_model(raw_data, "not_a_version", "v2")
+
+
+def test_train_checkpointed_search(tmp_path, monkeypatch):
+    # test that an interrupted checkpointed search resumes where it stopped
+    # and gives the same results as an uninterrupted search
+
+    raw_data = make_synthetic_mercedes_listings(300, random_state=42)
+    checkpoint_path = tmp_path / "search.jsonl"
+    model, cv_results = train_mercedes_price_prediction_model(
+        raw_data, "v1", n_iter=3, cv_results={}, checkpoint_path=str(checkpoint_path)
+    )
+    uninterrupted_model, uninterrupted_cv_results = (
+        train_mercedes_price_prediction_model(raw_data, "v1", n_iter=3, cv_results={})
+    )
+    scores = ["test_neg_root_mean_squared_error", "test_r2", "train_r2"]
+    pd.testing.assert_frame_equal(
+        cv_results["gradient_boosting"].loc[scores],
+        uninterrupted_cv_results["gradient_boosting"].loc[scores],
+    )
+    assert model[-1].get_params() == uninterrupted_model[-1].get_params()
+
+    # stop the search while it was writing the second candidate
+    lines = checkpoint_path.read_text().splitlines()
+    checkpoint_path.write_text(lines[0] + "\n" + lines[1][:20])
+    resumed_model, resumed_cv_results = train_mercedes_price_prediction_model(
+        raw_data, "v1", n_iter=3, cv_results={}, checkpoint_path=str(checkpoint_path)
+    )
+    pd.testing.assert_frame_equal(
+        resumed_cv_results["gradient_boosting"].loc[scores],
+        cv_results["gradient_boosting"].loc[scores],
+    )
+    lines = checkpoint_path.read_text().splitlines()
+    assert len(lines) == 4
+    assert [json.loads(line)["index"] for line in lines[2:]] == [1, 2]
+
+    # invalid arguments are rejected before the preprocessing cache is made
+    tempdir = tmp_path / "tmp"
+    tempdir.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(tempdir))
+    with pytest.raises(ValueError):
+        train_mercedes_price_prediction_model(
+            raw_data,
+            "v1",
+            search_strategy="halving",
+            checkpoint_path="search.jsonl",
+            cache_preprocessing=True,
+        )
+    assert list(tempdir.iterdir()) == []
+
+
+def test_checkpointed_search_parallel_batches(tmp_path):
+    # test that candidates fit in parallel batches are checkpointed one line
+    # each and score like RandomizedSearchCV, including a candidate that fails
+
+    rng = np.random.default_rng(42)
+    X = pd.DataFrame(rng.normal(size=(120, 3)), columns=["a", "b", "c"])
+    y = X["a"] * 2 + pd.Series(rng.normal(size=120))
+    param_distributions = {"max_depth": [0, 1, 2, 3]}
+    scoring = ["r2", "neg_mean_absolute_error"]
+
+    checkpoint_path = tmp_path / "search.jsonl"
+    search = CheckpointedRandomSearchCV(
+        DecisionTreeRegressor(random_state=0),
+        param_distributions,
+        str(checkpoint_path),
+        scoring,
+        n_iter=4,
+        cv=2,
+        n_jobs=4,
+        random_state=0,
+    )
+    with pytest.warns(FitFailedWarning):
+        search.fit(X, y)
+    expected = RandomizedSearchCV(
+        DecisionTreeRegressor(random_state=0),
+        param_distributions,
+        n_iter=4,
+        cv=2,
+        scoring=scoring,
+        refit="r2",
+        return_train_score=True,
+        random_state=0,
+    )
+    with pytest.warns(FitFailedWarning):
+        expected.fit(X, y)
+
+    lines = checkpoint_path.read_text().splitlines()
+    assert [json.loads(line)["index"] for line in lines] == [0, 1, 2, 3]
+    for key in ["split0_test_r2", "split1_train_neg_mean_absolute_error"]:
+        np.testing.assert_allclose(search.cv_results_[key], expected.cv_results_[key])
+    assert search.best_params_ == expected.best_params_
+
+
+def test_retrain_hist_gradient_boosting_model():
+    # test that a histogram model is refit from scratch with the base
+    # hyperparameters, as warm starting it on new data is not valid
+
+    raw_data = make_synthetic_mercedes_listings(600, random_state=42)
+    base_model, _ = train_mercedes_price_prediction_model(
+        raw_data.iloc[:400],
+        "vhgbretraintest",
+        model_type="hist_gradient_boosting",
+        n_iter=1,
+        cv_results={},
+        save_model=True,
+        overwrite_version=True,
+    )
+
+    try:
+        model = retrain_mercedes_price_prediction_model(
+            raw_data, "vhgbretraintest", "v2"
+        )
+    finally:
+        with resources.path("mercedestrenz", "models") as p:
+            for path in p.glob("mercedes_price_prediction_vhgbretraintest.*"):
+                path.unlink()
+
+    assert isinstance(model[-1], HistGradientBoostingRegressor)
+    assert model[-1].get_params() == base_model[-1].get_params()
+    expected = clone(base_model).fit(
+        raw_data.drop(columns="price_USD"), raw_data["price_USD"]
+    )
+    np.testing.assert_allclose(
+        model.predict(raw_data), expected.predict(raw_data), rtol=1e-9
+    )
@@ -2,7 +2,8 @@
 # Date: 2023-01-17
 
 # from mercedestrenz.data import listing_search
-from mercedestrenz.visualizations import plot_mercedes_price
+from mercedestrenz.visualizations import plot_mercedes_price, price_percentile_rank
+from mercedestrenz.visualizations import _get_sorted_market_prices, _sorted_prices_cache
 import pandas as pd
 import altair as alt
 import numpy as np
@@ -81,4 +82,41 @@ def test_return():
     Test whether the function returns a plot
     """
     if not isinstance(plot_mercedes_price('glb', 450000, df, price_col = 'price'), alt.LayerChart):
-        raise Exception("Function did not return an Altair chart")
\ No newline at end of file
+        raise Exception("Function did not return an Altair chart")
+
+
+def test_price_percentile_rank():
+    """
+    Test the percentile ranks of many prices against the market of their model
+    """
+    market = pd.DataFrame({
+        'price': [10, 20, 20, 40, 100, 200, np.nan],
+        'model': ['glb', 'glb', 'glb', 'glb', 'gls', 'gls', 'gls'],
+    })
+
+    ranks = price_percentile_rank(['glb', 'glb', 'gls', 'glb', 'sprinter'], [20, 5, 150, np.nan, 100], market, price_col = 'price')
+    assert np.allclose(ranks, [75, 0, 50, np.nan, np.nan], equal_nan = True), "Wrong percentile ranks"
+
+    assert price_percentile_rank('glb', 20, market, price_col = 'price', kind = 'strict') == 25
+    assert price_percentile_rank('glb', 20, market, price_col = 'price', kind = 'mean') == 50
+
+    ranks = price_percentile_rank(df['model'], df['price'], df, price_col = 'price')
+    expected = [100 * (df['price'] <= price).mean() for price in df['price']]
+    assert np.allclose(ranks, expected), "Wrong percentile ranks"
+
+    # repeated calls use the cached sorted prices of the market, a new market is sorted again
+    sorted_market = _sorted_prices_cache[(id(df), 'model', 'price')][1]
+    assert _get_sorted_market_prices(df, 'model', 'price') is sorted_market, "The sorted prices were not cached"
+    changed = df.assign(price = df['price'] + 1)
+    assert _get_sorted_market_prices(changed, 'model', 'price') is not sorted_market, "A new market used stale prices"
+    ranks = price_percentile_rank(changed['model'], changed['price'], changed, price_col = 'price')
+    assert np.allclose(ranks, expected), "Wrong percentile ranks"
+
+    try:
+        price_percentile_rank('glb', 20, market, price_col = 'price', kind = 'rank')
+    except Exception as e:
+        # Check if the correct exception was raised
+        assert str(e) == "The kind should be one of 'weak', 'strict' or 'mean'"
+    else:
+        # If no exception was raised, fail the test
+        assert False, "Expected exception was not raised"